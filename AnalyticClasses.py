@@ -0,0 +1,394 @@
+import numpy as np
+import scipy.linalg as linalg
+
+import InputData as data
+from InputData import HealthStates
+
+MAX_LIFETIME_STEPS = 10000  # cap on the number of time-steps used to build lifetime distributions
+LIFETIME_TAIL_TOL = 1e-10   # lifetime distributions are built until the remaining probability is below this
+
+_lifeTable = None           # life table (read on first use)
+
+
+def get_square_prob_matrices(prob_matrix):
+    """
+    :param prob_matrix: a transition probability matrix or a list/array of matrices (e.g. one per PSA draw);
+        rows of absorbing states left out (as in the matrices sampled for sensitivity analysis) are added
+    :return: (numpy.array) transition probability matrices with shape (n_matrices, n_states, n_states)
+    """
+
+    matrices = np.asarray(prob_matrix, dtype=float)
+    if matrices.ndim == 2:
+        matrices = matrices[np.newaxis]
+
+    # add the missing rows of absorbing states
+    n_rows, n_states = matrices.shape[-2], matrices.shape[-1]
+    if n_rows < n_states:
+        absorbing_rows = np.zeros((matrices.shape[0], n_states - n_rows, n_states))
+        for i in range(n_rows, n_states):
+            absorbing_rows[:, i - n_rows, i] = 1
+        matrices = np.concatenate([matrices, absorbing_rows], axis=1)
+
+    return matrices
+
+
+def get_cycle_prob_matrices(prob_matrix, cycle_length=data.CYCLE_LENGTH):
+    """
+    :param prob_matrix: a transition probability matrix over BASE_CYCLE_LENGTH or a list/array of matrices
+    :param cycle_length: length of a time-step (years)
+    :return: (numpy.array) transition probability matrices over one time-step with shape
+        (n_matrices, n_states, n_states): the power P^(cycle_length / BASE_CYCLE_LENGTH) of each matrix, which
+        for shorter time-steps is a root of P. The principal root of a matrix with transitions that are only
+        reached through intermediate states (e.g. PREDEM to MODERATE) has small negative probabilities; each
+        row is then replaced by its closest probability vector (Euclidean projection onto the simplex), so the
+        n-th power of the root approximates P (no stochastic root of such a matrix reproduces it exactly).
+    """
+
+    matrices = get_square_prob_matrices(prob_matrix)
+    power = cycle_length / data.BASE_CYCLE_LENGTH
+    if power == 1:
+        return matrices
+    if float(power).is_integer():
+        return np.linalg.matrix_power(matrices, int(power))
+
+    roots = np.stack([np.real(linalg.fractional_matrix_power(matrix, power)) for matrix in matrices])
+    if roots.min() < 0:
+        roots = _project_to_simplex(roots)
+    return roots
+
+
+def _project_to_simplex(rows):
+    """ :return: (numpy.array) the closest vector of non-negative values summing to 1 to each row (last axis) """
+
+    descending = -np.sort(-rows, axis=-1)
+    excess = np.cumsum(descending, axis=-1) - 1
+    counts = np.arange(1, rows.shape[-1] + 1)
+    n_positive = np.sum(descending - excess / counts > 0, axis=-1, keepdims=True)
+    shift = np.take_along_axis(excess, n_positive - 1, axis=-1) / n_positive
+    return np.maximum(rows - shift, 0)
+
+
+def get_step_rewards(parameters):
+    """
+    :param parameters: parameter set
+    :return: (state costs, state utilities, treatment cost) of one time-step: state costs, the treatment cost,
+        and the utility accrued in a time-step are inputs per BASE_CYCLE_LENGTH and are rescaled to the cycle
+        length of the parameter set (so total costs and QALYs keep their units)
+    """
+
+    scale = parameters.cycleLength / data.BASE_CYCLE_LENGTH
+    return (np.asarray(parameters.semiAnnualStateCosts, dtype=float) * scale,
+            np.asarray(parameters.stateUtilities, dtype=float) * scale,
+            parameters.annualTreatmentCost * scale)
+
+
+def get_transition_rewards(parameters):
+    """
+    :param parameters: parameter set
+    :return: (costs, utilities) arrays of shape (n_states, n_states) with the cost and utility of a time-step
+        in which a patient moves from the current state (row) to the next state (column): the average of both
+        states (half-cycle correction), plus the treatment cost (halved if the next state is SEVERE), with no
+        utility if the next state is ADJ_DEATH and no reward from ADJ_DEATH
+    """
+
+    costs, utilities, treatment_cost = get_step_rewards(parameters)
+    n_states = len(costs)
+    death, severe = HealthStates.ADJ_DEATH.value, HealthStates.SEVERE.value
+
+    transition_costs = 0.5 * (costs[:, np.newaxis] + costs[np.newaxis, :])
+    transition_costs += np.where(np.arange(n_states) == severe, 0.5, 1) * treatment_cost
+    transition_utilities = 0.5 * (utilities[:, np.newaxis] + utilities[np.newaxis, :])
+    transition_utilities[:, death] = 0
+    transition_costs[death] = 0
+    transition_utilities[death] = 0
+    return transition_costs, transition_utilities
+
+
+def get_discount_factors(parameters, n_time_steps):
+    """
+    :param parameters: parameter set
+    :param n_time_steps: number of time-steps
+    :return: (numpy.array) discount factors of the costs and utilities of time-steps 0, 1, ..., n_time_steps-1
+        (discounted at the end of the time-step, with the annual rate divided evenly among the time-steps of a year)
+    """
+
+    return np.power(1 + parameters.discountRate * parameters.cycleLength, -np.arange(1, n_time_steps + 1))
+
+
+def get_prob_matrices(parameters, n_time_steps):
+    """
+    :param parameters: parameter set
+    :param n_time_steps: number of time-steps
+    :return: (numpy.array) transition probability matrices of time-steps 0, 1, ..., n_time_steps-1 with shape
+        (n_time_steps, n_states, n_states); built once and cached on the parameter set (the matrices are read
+        once, so that threads sharing the parameter set with other simulation lengths get matrices of their own length)
+    """
+
+    global _lifeTable
+
+    matrices = parameters.probMatrices
+    if matrices is None or len(matrices) < n_time_steps:
+        matrix = get_cycle_prob_matrices(parameters.probMatrix, cycle_length=parameters.cycleLength)[0]
+        if parameters.ifAgeDependentMortality:
+            if _lifeTable is None:
+                _lifeTable = data.read_life_table()
+            matrices = data.get_trans_prob_matrices_by_age(
+                trans_prob_matrix=matrix, age=parameters.age, sex=parameters.sex,
+                n_time_steps=n_time_steps, life_table=_lifeTable, cycle_length=parameters.cycleLength)
+        else:
+            matrices = np.broadcast_to(matrix, (n_time_steps, ) + matrix.shape)
+        parameters.probMatrices = matrices
+
+    return matrices[:n_time_steps]
+
+
+class FirstPassageTime:
+    """ exact (discrete phase-type) distribution of the time until a patient first enters one of the target
+    states of the absorbing Markov chain; patients absorbed in ADJ_DEATH before reaching a target state never
+    experience the event (so the distribution of time to SEVERE is defective) """
+
+    def __init__(self, prob_matrix, target_states, initial_state=HealthStates.PREDEM, n_time_steps=None,
+                 cycle_length=data.CYCLE_LENGTH):
+        """
+        :param prob_matrix: transition probability matrix or a list of matrices (one per PSA draw) over
+            BASE_CYCLE_LENGTH
+        :param target_states: (list) of HealthStates whose first entry defines the event
+        :param initial_state: initial health state
+        :param n_time_steps: simulation horizon (time-steps) or None for a lifetime horizon
+        :param cycle_length: length of a time-step (years); times are in time-steps
+        """
+
+        matrices = get_cycle_prob_matrices(prob_matrix, cycle_length=cycle_length)
+        self.ifBatch = np.asarray(prob_matrix, dtype=float).ndim == 3
+        self.nTimeSteps = n_time_steps
+
+        targets = [s.value for s in target_states]
+        if initial_state.value in targets:
+            raise ValueError('The initial state should not be one of the target states.')
+
+        # states from which the event can still occur (ADJ_DEATH is absorbing and competes with the targets)
+        transients = [s.value for s in HealthStates
+                      if s.value not in targets and s != HealthStates.ADJ_DEATH]
+
+        # transitions between transient states and the one-step probabilities of entering a target state
+        self._q = matrices[:, transients][:, :, transients]
+        self._r = matrices[:, transients][:, :, targets].sum(axis=-1)
+        self._init = np.zeros((matrices.shape[0], len(transients)))
+        self._init[:, transients.index(initial_state.value)] = 1
+
+        self._pmf = None    # probability that the event occurs at time-steps 1, 2, ...
+
+    def get_pmf(self):
+        """
+        :return: (times, pmf) where times are the recorded event times (with the half-cycle correction used
+            in PatientStateMonitor) and pmf are their (defective) probabilities; pmf has shape (n_times, ) or
+            (n_matrices, n_times) for a batch of matrices
+        """
+
+        pmf = self._get_pmf_array()
+        times = np.arange(1, pmf.shape[1] + 1) - 0.5
+        return times, self._squeeze(pmf)
+
+    def get_prob_event(self):
+        """ :return: probability that the event occurs within the horizon """
+
+        if self.nTimeSteps is None:
+            return self._squeeze(self._get_lifetime_moment(power=0))
+        return self._squeeze(self._get_pmf_array().sum(axis=1))
+
+    def get_mean(self):
+        """ :return: mean time to the event among patients who experience it (as reported by the simulation) """
+
+        return self._squeeze(self._get_conditional_moments()[0] - 0.5)
+
+    def get_var(self):
+        """ :return: variance of the time to the event among patients who experience it """
+
+        mean, second = self._get_conditional_moments()
+        return self._squeeze(second - mean ** 2)
+
+    def get_stdev(self):
+        """ :return: standard deviation of the time to the event among patients who experience it """
+
+        return np.sqrt(self.get_var())
+
+    def get_quantile(self, q):
+        """
+        :param q: probability (between 0 and 1)
+        :return: q-quantile of the time to the event among patients who experience it
+        """
+
+        pmf = self._get_pmf_array()
+        cdf = np.cumsum(pmf, axis=1) / pmf.sum(axis=1, keepdims=True)
+        # the smallest time-step at which the conditional cdf reaches q (tolerating round-off)
+        steps = np.argmax(cdf >= q - 1e-12, axis=1) + 1
+        return self._squeeze(steps - 0.5)
+
+    def get_PI(self, alpha):
+        """
+        :param alpha: significance level
+        :return: 100(1-alpha)% percentile interval [l, u] of the time to the event
+        """
+
+        return [self.get_quantile(alpha / 2), self.get_quantile(1 - alpha / 2)]
+
+    def _get_pmf_array(self):
+        if self._pmf is None:
+            self._pmf = self._build_pmf()
+        return self._pmf
+
+    def _build_pmf(self):
+        """ :return: (n_matrices, n_times) probabilities that the event occurs at each time-step """
+
+        if self.nTimeSteps is not None:
+            n_steps = self.nTimeSteps
+        else:
+            n_steps = MAX_LIFETIME_STEPS
+            prob_event = self._get_lifetime_moment(power=0)
+
+        pmf = []
+        dist = self._init
+        total = np.zeros(dist.shape[0])
+        for k in range(n_steps):
+            # probability of entering a target state at this time-step
+            pmf.append(np.einsum('dm,dm->d', dist, self._r))
+            dist = np.einsum('dm,dmn->dn', dist, self._q)
+            total += pmf[-1]
+            if self.nTimeSteps is None and np.all(prob_event - total < LIFETIME_TAIL_TOL):
+                break
+
+        return np.stack(pmf, axis=1)
+
+    def _get_lifetime_moment(self, power):
+        """
+        :param power: 0, 1, or 2
+        :return: E[n^power * 1{event}] where n is the number of time-steps until the event, computed from the
+            fundamental matrix N = (I - Q)^-1 of the absorbing chain
+        """
+
+        i_minus_q = np.eye(self._q.shape[1]) - self._q
+        # N r, N^2 r and N^3 r
+        n_r = np.linalg.solve(i_minus_q, self._r[..., np.newaxis])
+        if power == 0:
+            vector = n_r
+        else:
+            n2_r = np.linalg.solve(i_minus_q, n_r)
+            if power == 1:
+                vector = n2_r
+            else:
+                # sum_n n^2 Q^(n-1) = (I + Q) N^3
+                n3_r = np.linalg.solve(i_minus_q, n2_r)
+                vector = n3_r + self._q @ n3_r
+
+        return np.einsum('dm,dm->d', self._init, vector[..., 0])
+
+    def _get_conditional_moments(self):
+        """ :return: (E[n | event], E[n^2 | event]) where n is the number of time-steps until the event """
+
+        if self.nTimeSteps is None:
+            prob = self._get_lifetime_moment(power=0)
+            return self._get_lifetime_moment(power=1) / prob, self._get_lifetime_moment(power=2) / prob
+
+        pmf = self._get_pmf_array()
+        steps = np.arange(1, pmf.shape[1] + 1)
+        prob = pmf.sum(axis=1)
+        return pmf @ steps / prob, pmf @ steps ** 2 / prob
+
+    def _squeeze(self, values):
+        """ :return: values for the single matrix if a batch of matrices was not provided """
+
+        if self.ifBatch:
+            return values
+        return values[0] if values.ndim > 1 else float(values[0])
+
+
+def get_survival_time(prob_matrix, initial_state=HealthStates.PREDEM, n_time_steps=None,
+                      cycle_length=data.CYCLE_LENGTH):
+    """
+    :param prob_matrix: transition probability matrix or a list of matrices (one per PSA draw)
+    :param initial_state: initial health state
+    :param n_time_steps: simulation horizon (time-steps) or None for a lifetime horizon
+    :param cycle_length: length of a time-step (years)
+    :return: exact distribution of patient survival time
+    """
+
+    return FirstPassageTime(prob_matrix=prob_matrix, target_states=[HealthStates.ADJ_DEATH],
+                            initial_state=initial_state, n_time_steps=n_time_steps, cycle_length=cycle_length)
+
+
+def get_time_to_severe(prob_matrix, initial_state=HealthStates.PREDEM, n_time_steps=None,
+                       cycle_length=data.CYCLE_LENGTH):
+    """
+    :param prob_matrix: transition probability matrix or a list of matrices (one per PSA draw)
+    :param initial_state: initial health state
+    :param n_time_steps: simulation horizon (time-steps) or None for a lifetime horizon
+    :param cycle_length: length of a time-step (years)
+    :return: exact distribution of patient time to SEVERE state
+    """
+
+    return FirstPassageTime(prob_matrix=prob_matrix, target_states=[HealthStates.SEVERE],
+                            initial_state=initial_state, n_time_steps=n_time_steps, cycle_length=cycle_length)
+
+
+class CohortTrace:
+    """ deterministic cohort-trace evaluation: the distribution of the cohort over health states is propagated
+    with the transition probability matrix of each time-step, and costs and utilities are accumulated with the
+    same half-cycle and discounting rules as PatientCostUtilityMonitor """
+
+    def __init__(self, parameters):
+        self.params = parameters
+        self.stateProbs = None          # (n_time_steps+1, n_states) probability of being in each state
+        self.expectedCost = None        # expected discounted cost per patient
+        self.expectedUtility = None     # expected discounted utility per patient
+        self.stepCosts = None           # expected undiscounted cost per patient in each time-step
+        self.probDeath = None           # probability of death at each time-step
+        self.probSEVERE = None          # probability of reaching SEVERE state (first time) at each time-step
+
+    def simulate(self, n_time_steps):
+        """ calculates the expected outcomes over the specified number of time-steps """
+
+        matrices = get_prob_matrices(self.params, n_time_steps)
+        n_states = matrices.shape[-1]
+        death, severe = HealthStates.ADJ_DEATH.value, HealthStates.SEVERE.value
+
+        # cost and utility of each transition (current state, next state)
+        transition_costs, transition_utilities = get_transition_rewards(self.params)
+        discount_factors = get_discount_factors(self.params, n_time_steps)
+
+        self.stateProbs = np.zeros((n_time_steps + 1, n_states))
+        self.stateProbs[0, self.params.initialHealthState.value] = 1
+        self.probDeath = np.zeros(n_time_steps)
+        self.probSEVERE = np.zeros(n_time_steps)
+        self.stepCosts = np.zeros(n_time_steps)
+        self.expectedCost = 0
+        self.expectedUtility = 0
+
+        for k in range(n_time_steps):
+            # probability of each transition during this time-step
+            flows = self.stateProbs[k][:, np.newaxis] * matrices[k]
+            self.stepCosts[k] = np.sum(flows * transition_costs)
+            self.expectedCost += self.stepCosts[k] * discount_factors[k]
+            self.expectedUtility += np.sum(flows * transition_utilities) * discount_factors[k]
+            self.probDeath[k] = np.sum(flows[:death, death])
+            self.probSEVERE[k] = np.sum(flows[:severe, severe])
+            if k == 0:
+                # patients starting in SEVERE record it at the end of the first time-step (as PatientStateMonitor)
+                self.probSEVERE[k] += flows[severe, severe]
+            self.stateProbs[k + 1] = flows.sum(axis=0)
+
+    def get_prob_alive(self):
+        """ :return: (numpy.array) probability of being alive at time-steps 0, 1, ..., n_time_steps """
+        return 1 - self.stateProbs[:, HealthStates.ADJ_DEATH.value]
+
+    def get_state_prevalence(self):
+        """ :return: (numpy.array) of shape (n_states, n_time_steps) with the expected proportion of patients in
+            each state at the end of each time-step (as the state occupancy of a simulated cohort) """
+        return self.stateProbs[1:].T
+
+    def get_mean_survival_time(self):
+        """ :return: mean survival time of patients who die during simulation (as reported by the simulation) """
+        return np.sum(self.probDeath * (np.arange(len(self.probDeath)) + 0.5)) / np.sum(self.probDeath)
+
+    def get_mean_time_to_severe(self):
+        """ :return: mean time to SEVERE of patients who reach it during simulation """
+        return np.sum(self.probSEVERE * (np.arange(len(self.probSEVERE)) + 0.5)) / np.sum(self.probSEVERE)
@@ -0,0 +1,146 @@
+import concurrent.futures as futures
+import csv
+
+import deampy.format_functions as fmt
+import numpy as np
+
+import InputData as data
+from MarkovClasses import LazySummaryStat
+from RandomStreams import get_bootstrap_rng
+from StrategyClasses import get_efficient_frontier
+
+
+class PairedBootstrap:
+    """ bootstrap samples of the mean cost and mean effect of strategies evaluated over the same patients (or PSA
+    draws): every bootstrap sample resamples the same observation indices for all strategies, and the means of
+    a block of samples are computed with array operations (blocks are evaluated in parallel threads) """
+
+    def __init__(self, costs, effects, n_samples=1000, n_threads=1, memory_budget=64):
+        """
+        :param costs: (list) observed costs of each strategy (all strategies have the same number of observations
+            and the i-th observations of all strategies are paired)
+        :param effects: (list) observed effects of each strategy
+        :param n_samples: number of bootstrap samples
+        :param n_threads: number of threads to evaluate blocks of bootstrap samples
+        :param memory_budget: (float) megabytes of memory the resampled observations of a thread may use
+        """
+
+        self.costs = np.asarray(costs, dtype=float)
+        self.effects = np.asarray(effects, dtype=float)
+        self.nSamples = n_samples
+        n_obs = self.costs.shape[1]
+
+        # mean cost and effect of each strategy in each bootstrap sample
+        self.sampleCosts = np.empty((n_samples, len(self.costs)))
+        self.sampleEffects = np.empty((n_samples, len(self.effects)))
+
+        # blocks of samples whose indices and resampled observations (8 bytes each) fit the memory budget
+        block_size = max(1, int(memory_budget * 2 ** 20 / (16 * n_obs)))
+        blocks = [range(start, min(start + block_size, n_samples)) for start in range(0, n_samples, block_size)]
+        if n_threads > 1:
+            with futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+                list(executor.map(self._resample, blocks))
+        else:
+            for block in blocks:
+                self._resample(block)
+
+    def _resample(self, samples):
+        """ calculates the mean cost and effect of each strategy in a block of bootstrap samples
+        :param samples: (range) ids of the bootstrap samples """
+
+        n_obs = self.costs.shape[1]
+        indices = np.stack([get_bootstrap_rng(sample_id=i).integers(0, n_obs, size=n_obs) for i in samples])
+        for s in range(len(self.costs)):
+            self.sampleCosts[samples.start:samples.stop, s] = self.costs[s][indices].mean(axis=1)
+            self.sampleEffects[samples.start:samples.stop, s] = self.effects[s][indices].mean(axis=1)
+
+    def get_ICER_and_CI(self, new, base, alpha=data.ALPHA):
+        """
+        :param new: index of the new strategy
+        :param base: index of the strategy it is compared to
+        :param alpha: significance level
+        :return: (ICER, [lower, upper]) the incremental cost-effectiveness ratio and its basic (pivotal)
+            bootstrap confidence interval
+        """
+
+        icer = (self.costs[new].mean() - self.costs[base].mean()) \
+            / (self.effects[new].mean() - self.effects[base].mean())
+        sample_icers = (self.sampleCosts[:, new] - self.sampleCosts[:, base]) \
+            / (self.sampleEffects[:, new] - self.sampleEffects[:, base])
+        upper, lower = icer - np.percentile(sample_icers - icer, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+        return icer, [lower, upper]
+
+    def get_incremental_NMB(self, new, base, wtp_values, alpha=data.ALPHA):
+        """
+        :param new: index of the new strategy
+        :param base: index of the strategy it is compared to
+        :param wtp_values: (list) willingness-to-pay values
+        :param alpha: significance level
+        :return: (mean, lower, upper) arrays of the incremental net monetary benefit at each willingness-to-pay
+            value and its basic bootstrap confidence interval
+        """
+
+        wtp_values = np.asarray(wtp_values, dtype=float)
+        d_cost = self.costs[new].mean() - self.costs[base].mean()
+        d_effect = self.effects[new].mean() - self.effects[base].mean()
+        nmb = wtp_values * d_effect - d_cost
+
+        # (n_samples, n_wtp_values) incremental NMB of the bootstrap samples
+        sample_nmb = np.outer(self.sampleEffects[:, new] - self.sampleEffects[:, base], wtp_values) \
+            - (self.sampleCosts[:, new] - self.sampleCosts[:, base])[:, np.newaxis]
+        upper, lower = nmb - np.percentile(sample_nmb - nmb, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+        return nmb, lower, upper
+
+
+def write_CE_table(names, costs, effects, interval_type='c', alpha=data.ALPHA, n_samples=1000, n_threads=1,
+                   cost_digits=0, effect_digits=2, icer_digits=2, file_name='CETable.csv'):
+    """ writes the cost-effectiveness table of strategies (in the format of deampy's CEA.build_CE_table) with
+    ICER confidence intervals from a paired bootstrap
+    :param names: (list) names of the strategies
+    :param costs: (list) observed costs of each strategy (paired across strategies)
+    :param effects: (list) observed effects of each strategy (paired across strategies)
+    :param interval_type: 'c' for confidence intervals or 'p' for percentile intervals of cost and effect
+        estimates (ICERs always have confidence intervals)
+    :param alpha: significance level
+    :param n_samples: number of bootstrap samples
+    :param n_threads: number of threads to evaluate bootstrap samples
+    :param cost_digits: digits to round cost estimates to
+    :param effect_digits: digits to round effect estimates to
+    :param icer_digits: digits to round ICER estimates to
+    :param file_name: csv file to write the table in
+    """
+
+    def get_text(obs, deci):
+        """ :return: formatted mean and interval of the observations """
+        stat = LazySummaryStat(name='', data=obs)
+        interval = stat.get_t_CI(alpha=alpha) if interval_type == 'c' else stat.get_PI(alpha=alpha)
+        return fmt.format_estimate_interval(estimate=stat.get_mean(), interval=interval,
+                                            deci=deci, format=',')
+
+    costs = [np.asarray(obs, dtype=float) for obs in costs]
+    effects = [np.asarray(obs, dtype=float) for obs in effects]
+    frontier = get_efficient_frontier(names=names, costs=[obs.mean() for obs in costs],
+                                      effects=[obs.mean() for obs in effects])
+    bootstrap = PairedBootstrap(costs=costs, effects=effects, n_samples=n_samples, n_threads=n_threads)
+
+    table = [['Strategy', 'Cost', 'Effect', 'Incremental Cost', 'Incremental Effect',
+              'ICER (with confidence interval)']]
+    previous = None     # index of the previous strategy on the frontier
+    for row in frontier:
+        i = names.index(row['name'])
+        line = [row['name'], get_text(costs[i], cost_digits), get_text(effects[i], effect_digits)]
+        if row['status'] != 'frontier':
+            line += ['-', '-', 'Dominated']
+        elif previous is None:
+            line += ['-', '-', '-']
+        else:
+            icer, interval = bootstrap.get_ICER_and_CI(new=i, base=previous, alpha=alpha)
+            line += [get_text(costs[i] - costs[previous], cost_digits),
+                     get_text(effects[i] - effects[previous], effect_digits),
+                     fmt.format_estimate_interval(estimate=icer, interval=interval, deci=icer_digits, format=',')]
+        if row['status'] == 'frontier':
+            previous = i
+        table.append(line)
+
+    with open(file_name, 'w', newline='') as f:
+        csv.writer(f).writerows(table)
@@ -0,0 +1,21 @@
+import InputData as data
+import ParameterClasses as param
+import Support as support
+from BudgetImpactClasses import ANALYTIC, BudgetImpact, get_entries_per_step
+
+ANNUAL_INCIDENCE = 500000   # new patients with predementia entering the population each year
+N_YEARS = 10                # budget horizon (years)
+METHOD = ANALYTIC           # ANALYTIC (expected outcomes) or BATCHED (simulated patients)
+
+entries = get_entries_per_step(annual_incidence=ANNUAL_INCIDENCE, n_years=N_YEARS)
+
+# the incident cohorts of both therapies (with BATCHED, both are simulated with the same random numbers)
+budget_impacts = {}
+for therapy in [param.Therapies.SOC, param.Therapies.DMT_30]:
+    budget_impact = BudgetImpact(id=0, entries=entries, parameters=param.Parameters(therapy=therapy),
+                                 method=METHOD, memory_budget=data.MEMORY_BUDGET)
+    budget_impact.simulate()
+    budget_impacts[therapy.name] = budget_impact
+
+support.report_budget_impact(budget_impacts=budget_impacts, file_name='BudgetImpact.csv',
+                             fig_file_name='figs/budget_impact.png')
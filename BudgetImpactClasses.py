@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+
+import InputData as data
+from AnalyticClasses import CohortTrace
+from InputData import HealthStates
+from MarkovClasses import PatientBatch, get_chunk_size, get_chunk_uniforms
+from RandomStreams import get_incident_block_rng
+
+# how the incident cohorts are evaluated
+ANALYTIC = 'analytic'   # expected outcomes from the cohort trace (any population size at the same cost)
+BATCHED = 'batched'     # simulated as batches of patients in chunks that fit the memory budget
+
+
+def get_entries_per_step(annual_incidence, n_years):
+    """
+    :param annual_incidence: number of new patients per year, or a list with the number of each year
+    :param n_years: number of years of the budget horizon
+    :return: (numpy.array) number of patients entering at the start of each time-step of the horizon (the new
+        patients of a year are spread evenly over its time-steps)
+    """
+
+    steps_per_year = int(round(1 / data.CYCLE_LENGTH))
+    incidence = np.broadcast_to(np.asarray(annual_incidence, dtype=np.int64), (n_years, ))
+    entries = np.repeat(incidence // steps_per_year, steps_per_year)
+    # the remainder of a year enters in its first time-steps
+    remainders = np.arange(steps_per_year)[np.newaxis, :] < (incidence % steps_per_year)[:, np.newaxis]
+    return entries + remainders.ravel()
+
+
+class BudgetImpact:
+    """ open cohort: a cohort of incident patients enters at the start of every time-step, and the outcomes of
+    all cohorts are summed by calendar time-step. All incident cohorts have the same parameters, so the outcomes of
+    the cohort entering at time-step e are those of the cohort entering at time-step 0 shifted by e; costs are
+    undiscounted (as budget impact is reported) """
+
+    def __init__(self, id, entries, parameters, method=ANALYTIC, memory_budget=data.MEMORY_BUDGET):
+        """
+        :param id: id of the population (strategies simulated with the same id share their random numbers)
+        :param entries: (list) number of patients entering at the start of each time-step of the horizon
+        :param parameters: parameter set
+        :param method: ANALYTIC or BATCHED
+        :param memory_budget: (float) megabytes of memory the simulation of a chunk of patients may use
+        """
+
+        if method not in (ANALYTIC, BATCHED):
+            raise ValueError('Method should be ' + ANALYTIC + ' or ' + BATCHED + ' (not ' + str(method) + ').')
+
+        self.id = id
+        self.entries = np.asarray(entries, dtype=np.int64)
+        self.params = parameters
+        self.method = method
+        self.memoryBudget = memory_budget
+
+        self.costs = None           # (n_time_steps, ) total cost of each calendar time-step
+        self.nTreated = None        # (n_time_steps, ) patients alive (and treated) at the start of each time-step
+        self.stateOccupancy = None  # (n_states, n_time_steps) patients in each state at the end of each time-step
+                                    # (patients in ADJ_DEATH are the cumulative deaths)
+
+    def simulate(self):
+        """ evaluates the incident cohorts over the horizon (the number of time-steps of entries) """
+
+        n_time_steps = len(self.entries)
+        if self.method == ANALYTIC:
+            self._evaluate_trace(n_time_steps)
+        else:
+            self._simulate_batches(n_time_steps)
+
+    def _evaluate_trace(self, n_time_steps):
+        """ sums the expected outcomes of one incident patient, shifted to the entry time-step of each cohort and
+        scaled by its size (a convolution of the entries with the cohort trace) """
+
+        trace = CohortTrace(parameters=self.params)
+        trace.simulate(n_time_steps=n_time_steps)
+
+        shift = lambda profile: np.convolve(self.entries, profile)[:n_time_steps]
+        self.costs = shift(trace.stepCosts)
+        self.nTreated = shift(trace.get_prob_alive()[:n_time_steps])
+        self.stateOccupancy = np.stack([shift(p) for p in trace.get_state_prevalence()])
+
+    def _simulate_batches(self, n_time_steps):
+        """ simulates the patients of each incident cohort until the end of the horizon in chunks """
+
+        n_states = len(HealthStates)
+        death = HealthStates.ADJ_DEATH.value
+        self.costs = np.zeros(n_time_steps)
+        self.nTreated = np.zeros(n_time_steps)
+        self.stateOccupancy = np.zeros((n_states, n_time_steps))
+
+        for entry_step, pop_size in enumerate(self.entries):
+            n_steps = n_time_steps - entry_step    # time-steps left in the horizon
+            chunk_size = get_chunk_size(memory_budget=self.memoryBudget, n_time_steps=n_steps)
+            for chunk_start in range(0, pop_size, chunk_size):
+                n_patients = min(chunk_size, pop_size - chunk_start)
+                uniforms = get_chunk_uniforms(
+                    get_block_rng=lambda block_id: get_incident_block_rng(
+                        population_id=self.id, entry_step=entry_step, block_id=block_id),
+                    chunk_start=chunk_start, n_patients=n_patients, n_time_steps=n_steps)
+
+                batch = PatientBatch(parameters=self.params, n_patients=n_patients)
+                batch.simulate(n_time_steps=n_steps, uniforms=uniforms)
+
+                # patients alive at the start of each time-step: all at entry, then those not dead yet
+                self.costs[entry_step:] += batch.stepCosts
+                self.nTreated[entry_step] += n_patients
+                self.nTreated[entry_step + 1:] += n_patients - batch.stateOccupancy[death, :-1]
+                self.stateOccupancy[:, entry_step:] += batch.stateOccupancy
+
+    def get_year_index(self):
+        """ :return: (numpy.array) index of the first time-step of each year of the horizon """
+
+        steps_per_year = int(round(1 / data.CYCLE_LENGTH))
+        return np.arange(0, len(self.entries), steps_per_year)
+
+    def get_annual_costs(self):
+        """ :return: (numpy.array) total cost of each year """
+
+        return np.add.reduceat(self.costs, self.get_year_index())
+
+    def get_annual_treated(self):
+        """ :return: (numpy.array) number of patients treated during each year (alive at its start or entering
+            during it) """
+
+        starts = self.get_year_index()
+        return self.nTreated[starts] + np.add.reduceat(self.entries, starts) - self.entries[starts]
+
+    def get_annual_prevalence(self):
+        """ :return: (numpy.array) of shape (n_states, n_years) with the number of patients in each state at the
+            end of each year """
+
+        ends = np.minimum(self.get_year_index() + int(round(1 / data.CYCLE_LENGTH)), len(self.entries)) - 1
+        return self.stateOccupancy[:, ends]
+
+    def get_n_years(self):
+        """ :return: number of (possibly partial) years of the horizon """
+
+        return math.ceil(len(self.entries) * data.CYCLE_LENGTH)
@@ -0,0 +1,20 @@
+import time
+
+import CalibrationClasses as calib
+import Support as support
+
+# observed proportions of patients alive and of patients who have not entered SEVERE state (patients who died
+# without entering SEVERE are counted as free of SEVERE; see CalibrationClasses.CALIBRATION_OUTCOMES)
+TARGETS_FILE = 'CalibrationTargets.csv'
+N_PROCESSES = 1     # 1: candidates of each generation are evaluated together as a batch of matrices
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+
+    # calibrate the transition probabilities of standard of care to the targets
+    calibration = calib.Calibration(targets=calib.read_calibration_targets(TARGETS_FILE))
+    calibration.calibrate(n_processes=N_PROCESSES)
+
+    # calibrated matrix and goodness of fit
+    support.report_calibration(calibration=calibration)
+    print('Calibration time (seconds): {:.2f}'.format(time.perf_counter() - start))
@@ -0,0 +1,207 @@
+import csv
+
+import numpy as np
+import scipy.optimize as opt
+
+import InputData as data
+from AnalyticClasses import FirstPassageTime
+from InputData import HealthStates
+
+# outcomes that can be calibrated to and the health states whose first entry ends them; 'Free of SEVERE' is the
+# proportion of patients who have not entered SEVERE, where patients who died without entering SEVERE are counted
+# as free of SEVERE (1 - cumulative incidence of SEVERE with death as a competing risk), not the proportion alive
+# and free of SEVERE, so its targets may exceed those of 'Alive'
+CALIBRATION_OUTCOMES = {'Alive': HealthStates.ADJ_DEATH,
+                        'Free of SEVERE': HealthStates.SEVERE}
+
+PENALTY = 1e6   # objective value of candidates that are not valid transition probability matrices
+
+
+class CalibrationTarget:
+    """ an observed proportion of patients (e.g. alive) at a given time since the start of follow-up """
+
+    def __init__(self, outcome, year, value, st_dev):
+        """
+        :param outcome: 'Alive' or 'Free of SEVERE' (see CALIBRATION_OUTCOMES for their definitions)
+        :param year: years since the start of follow-up
+        :param value: observed proportion of patients (of all patients who started follow-up)
+        :param st_dev: standard error of the observed proportion (to weight the target)
+        """
+        if outcome not in CALIBRATION_OUTCOMES:
+            raise ValueError('{} is not a calibration outcome ({}).'.format(
+                outcome, ', '.join(CALIBRATION_OUTCOMES)))
+        self.outcome = outcome
+        self.year = year
+        self.timeStep = int(round(year / data.CYCLE_LENGTH))
+        self.value = value
+        self.stDev = st_dev
+
+
+def read_calibration_targets(file_name):
+    """
+    :param file_name: csv file with columns Outcome, Year, Value, StDev
+    :return: (list) of CalibrationTarget
+    """
+
+    with open(file_name, newline='') as file:
+        return [CalibrationTarget(outcome=row['Outcome'], year=float(row['Year']), value=float(row['Value']),
+                                  st_dev=float(row['StDev']))
+                for row in csv.DictReader(file)]
+
+
+def get_calibrated_transitions(trans_matrix=data.TRANS_MATRIX):
+    """
+    :param trans_matrix: transition matrix containing counts of transitions between states
+    :return: (list) of (from state, to state) of the transitions that are calibrated: transitions observed
+        between different states (the probability of staying in a state is the complement)
+    """
+
+    return [(i, j) for i, row in enumerate(trans_matrix) for j, count in enumerate(row)
+            if i != j and count > 0 and i != HealthStates.ADJ_DEATH.value]
+
+
+def get_prob_matrices_from_values(values, transitions):
+    """
+    :param values: (numpy.array) probabilities of the calibrated transitions with shape (n_transitions, )
+        or (n_candidates, n_transitions)
+    :param transitions: (list) of (from state, to state) of the calibrated transitions
+    :return: (numpy.array) transition probability matrices with shape (n_candidates, n_states, n_states)
+    """
+
+    values = np.atleast_2d(values)
+    n_states = len(HealthStates)
+    matrices = np.zeros((len(values), n_states, n_states))
+    rows, cols = np.array(transitions).T
+    matrices[:, rows, cols] = values
+    diagonal = np.arange(n_states)
+    matrices[:, diagonal, diagonal] = 1 - matrices.sum(axis=2)
+    return matrices
+
+
+def get_model_outcomes(matrices, targets):
+    """
+    :param matrices: (numpy.array) transition probability matrices with shape (n_candidates, n_states, n_states)
+    :param targets: (list) of CalibrationTarget
+    :return: (numpy.array) modeled proportion of patients of each target with shape (n_candidates, n_targets)
+    """
+
+    n_time_steps = max(target.timeStep for target in targets)
+    outcomes = np.empty((len(matrices), len(targets)))
+    for outcome, state in CALIBRATION_OUTCOMES.items():
+        indices = [i for i, target in enumerate(targets) if target.outcome == outcome]
+        if len(indices) == 0:
+            continue
+        pmf = FirstPassageTime(prob_matrix=matrices, target_states=[state],
+                               n_time_steps=n_time_steps)._get_pmf_array()
+        # proportion without the event at the end of each time-step
+        no_event = 1 - np.cumsum(pmf, axis=1)
+        outcomes[:, indices] = no_event[:, [targets[i].timeStep - 1 for i in indices]]
+    return outcomes
+
+
+class CalibrationObjective:
+    """ weighted sum of squared differences between modeled and observed targets plus the deviance of the
+    observed transition counts (which keeps the calibrated matrix close to the data where the targets are not
+    informative); a picklable callable so that candidates can be evaluated in worker processes """
+
+    def __init__(self, targets, transitions, trans_matrix=data.TRANS_MATRIX, count_weight=1):
+        """
+        :param targets: (list) of CalibrationTarget
+        :param transitions: (list) of (from state, to state) of the calibrated transitions
+        :param trans_matrix: transition matrix of observed counts
+        :param count_weight: weight of the deviance of the observed counts (0 to fit the targets only)
+        """
+        self.targets = targets
+        self.transitions = transitions
+        self.values = np.array([target.value for target in targets])
+        self.stDevs = np.array([target.stDev for target in targets])
+        self.counts = np.array(trans_matrix, dtype=float)
+        self.countWeight = count_weight
+        self._mleProbs = np.array(data.get_trans_prob_matrix(trans_matrix=trans_matrix))
+
+    def __call__(self, x):
+        """
+        :param x: (numpy.array) transition probabilities of one candidate with shape (n_transitions, ), or of
+            several candidates with shape (n_transitions, n_candidates)
+        :return: objective value of the candidate(s)
+        """
+
+        values = np.asarray(x, dtype=float)
+        candidates = values.T if values.ndim == 2 else values[np.newaxis]
+        matrices = get_prob_matrices_from_values(values=candidates, transitions=self.transitions)
+        observed = self.counts > 0
+        # the matrix is valid if it gives a positive probability to every observed transition
+        valid = np.all(np.diagonal(matrices, axis1=1, axis2=2) >= 0, axis=1) & \
+            np.all(matrices[:, observed] > 0, axis=1)
+
+        objective = np.full(len(candidates), PENALTY)
+        if np.any(valid):
+            outcomes = get_model_outcomes(matrices=matrices[valid], targets=self.targets)
+            objective[valid] = np.sum(((outcomes - self.values) / self.stDevs) ** 2, axis=1)
+            if self.countWeight > 0:
+                # multinomial deviance of the observed counts
+                deviance = 2 * np.sum(self.counts[observed] *
+                                      np.log(self._mleProbs[observed] / matrices[valid][:, observed]), axis=1)
+                objective[valid] += self.countWeight * deviance
+        return objective if values.ndim == 2 else objective[0]
+
+
+class Calibration:
+    """ calibrates the transition probabilities of standard of care to observed targets with differential
+    evolution; candidates are evaluated with exact (phase-type) distributions instead of simulation """
+
+    def __init__(self, targets, trans_matrix=data.TRANS_MATRIX, count_weight=1, max_prob=0.6):
+        """
+        :param targets: (list) of CalibrationTarget
+        :param trans_matrix: transition matrix of counts (defines the calibrated transitions and the initial matrix)
+        :param count_weight: weight of the deviance of the observed counts in the objective (0 to fit the
+            targets only)
+        :param max_prob: upper bound of the probability of each calibrated transition
+        """
+        self.targets = targets
+        self.transitions = get_calibrated_transitions(trans_matrix=trans_matrix)
+        self.initialMatrix = np.array(data.get_trans_prob_matrix(trans_matrix=trans_matrix))
+        self.bounds = [(0, max_prob)] * len(self.transitions)
+        self.objective = CalibrationObjective(targets=targets, transitions=self.transitions,
+                                              trans_matrix=trans_matrix, count_weight=count_weight)
+
+        self.result = None              # result of the optimizer
+        self.calibratedMatrix = None    # calibrated transition probability matrix
+        self.fit = []                   # goodness of fit of each target (see calibrate)
+
+    def calibrate(self, n_processes=1, max_iter=1000, seed=data.SEED):
+        """ searches the transition probabilities that best fit the targets
+        :param n_processes: number of processes to evaluate candidates (1: all candidates of a generation
+            are evaluated together as one batch of matrices)
+        :param max_iter: maximum number of generations of differential evolution
+        :param seed: seed of the optimizer
+        """
+
+        initial = self.initialMatrix[tuple(np.array(self.transitions).T)]
+        if n_processes > 1:
+            self.result = opt.differential_evolution(
+                self.objective, bounds=self.bounds, x0=initial, maxiter=max_iter, seed=seed, tol=1e-8,
+                workers=n_processes, updating='deferred')
+        else:
+            self.result = opt.differential_evolution(
+                self.objective, bounds=self.bounds, x0=initial, maxiter=max_iter, seed=seed, tol=1e-8,
+                vectorized=True, updating='deferred')
+
+        self.calibratedMatrix = get_prob_matrices_from_values(values=self.result.x, transitions=self.transitions)[0]
+
+        # goodness of fit
+        initial_outcomes = get_model_outcomes(matrices=self.initialMatrix[np.newaxis], targets=self.targets)[0]
+        outcomes = get_model_outcomes(matrices=self.calibratedMatrix[np.newaxis], targets=self.targets)[0]
+        self.fit = [{'outcome': target.outcome, 'year': target.year, 'target': target.value,
+                     'st dev': target.stDev, 'initial model': float(initial_outcomes[i]),
+                     'calibrated model': float(outcomes[i]), 'z': float((outcomes[i] - target.value) / target.stDev)}
+                    for i, target in enumerate(self.targets)]
+
+    def get_chi_square(self, matrix=None):
+        """
+        :param matrix: transition probability matrix (calibrated matrix if None)
+        :return: weighted sum of squared differences between modeled and observed targets (chi-square)
+        """
+        matrix = self.calibratedMatrix if matrix is None else matrix
+        outcomes = get_model_outcomes(matrices=np.asarray(matrix)[np.newaxis], targets=self.targets)[0]
+        return float(np.sum(((outcomes - self.objective.values) / self.objective.stDevs) ** 2))
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+from enum import Enum
+
+import numpy as np
+
+import InputData as data
+
+MANIFEST_FILE = 'manifest.json'
+# attributes of a parameter set that are derived from the others (and cached during simulation)
+DERIVED_PARAMETERS = ('probMatrices', 'transitionSampler')
+
+
+def to_json(value):
+    """ :return: value converted to a type json can write (numpy arrays to lists, enums to their names) """
+
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, range):
+        return list(value)
+    raise TypeError('{} cannot be written to a checkpoint manifest.'.format(type(value).__name__))
+
+
+def get_parameter_settings(parameters):
+    """
+    :param parameters: a parameter set
+    :return: (dict) the values of the parameter set that determine the simulation outcomes
+    """
+    return {key: value for key, value in vars(parameters).items() if key not in DERIVED_PARAMETERS}
+
+
+class CheckpointDirectory:
+    """ a directory where the outcomes of each completed cohort (or PSA draw) of a multi-cohort simulation are
+    saved as soon as the cohort is simulated, so that an interrupted simulation resumes from the completed cohorts.
+
+    Random number streams are derived from the root seed and the ids of the cohort, the patient block, and the
+    PSA draw (see RandomStreams), so the state of a stream is determined by these ids; a resumed simulation
+    re-derives the streams of the remaining cohorts and produces the same outcomes as an uninterrupted one. """
+
+    def __init__(self, path, settings=None):
+        """
+        :param path: path of the directory (created if it does not exist)
+        :param settings: (dict) settings of the simulation (ids, population sizes, parameters, ...); they are
+            saved with the root seed and the patient block size of the random number streams in the manifest of a
+            new directory and have to match the manifest of an existing one (None to use an existing directory
+            without checking, e.g. in worker processes)
+        """
+
+        self.path = path
+        if settings is None:
+            return
+
+        os.makedirs(path, exist_ok=True)
+        settings = json.loads(json.dumps(dict(settings, seed=data.SEED, rngBlockSize=data.RNG_BLOCK_SIZE),
+                                          default=to_json))
+        manifest = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                if json.load(f) != settings:
+                    raise ValueError('Checkpoints in ' + path + ' were saved by a simulation with different '
+                                     'settings; use another directory or delete it.')
+        else:
+            self._write_atomically(file_name=manifest,
+                                   write=lambda f: f.write(json.dumps(settings, indent=2).encode()))
+
+    def get_file_name(self, index):
+        """ :return: name of the file of the cohort with this index """
+        return os.path.join(self.path, 'cohort_{:06d}.npz'.format(index))
+
+    def get_if_completed(self, index):
+        """ :return: True if the outcomes of the cohort with this index are saved """
+        return os.path.exists(self.get_file_name(index))
+
+    def save(self, index, record):
+        """
+        :param index: index of the cohort
+        :param record: (dict) outcomes of the simulated cohort (see get_cohort_record)
+        """
+        self._write_atomically(file_name=self.get_file_name(index), write=lambda f: np.savez(f, **record))
+
+    def load(self, index):
+        """
+        :param index: index of the cohort
+        :return: (dict) saved outcomes of the cohort (see get_cohort_record)
+        """
+        with np.load(self.get_file_name(index)) as f:
+            return {key: f[key] for key in f.files}
+
+    @staticmethod
+    def _write_atomically(file_name, write):
+        """ writes to a temporary file and then renames it, so an interrupted write leaves no partial file; the
+        temporary file has a unique name, so processes writing the same file (e.g. workers on different hosts
+        opening the same checkpoint directory) do not write to or rename each other's temporary file """
+
+        directory, base_name = os.path.split(file_name)
+        fd, temp_file_name = tempfile.mkstemp(dir=directory or '.', prefix=base_name + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_file_name, file_name)
+        except BaseException:
+            os.remove(temp_file_name)
+            raise
+
+
+def get_cohort_record(simulated_cohort, n_time_steps):
+    """
+    :param simulated_cohort: a cohort after being simulated
+    :param n_time_steps: simulation length
+    :return: (dict) outcomes of the cohort to save in a checkpoint
+    """
+
+    outcomes = simulated_cohort.cohortOutcomes
+    return {'pop_size': simulated_cohort.popSize,
+            'survival_times': np.asarray(outcomes.survivalTimes, dtype=float),
+            'time_to_severe': np.asarray(outcomes.timeToSEVERE, dtype=float),
+            'n_deaths': outcomes.get_deaths_per_step(n_time_steps=n_time_steps),
+            'state_occupancy': outcomes.stateOccupancy,
+            'mean_survival_time': outcomes.statSurvivalTimes.get_mean(),
+            'mean_time_to_severe': outcomes.statTimeToSEVERE.get_mean(),
+            'mean_cost': outcomes.statCost.get_mean(),
+            'mean_qaly': outcomes.statUtilities.get_mean()}
+
@@ -2,59 +2,64 @@ import InputData as data
 import MarkovClasses as model
 import ParameterClasses as param
 import Support as support
+from PipelineClasses import PROCESS, THREAD, Pipeline
+
+
+def simulate_cohort(id, therapy):
+    """ :return: outcomes of a cohort simulated under this therapy """
+
+    cohort = model.Cohort(id=id,
+                          pop_size=data.POP_SIZE,
+                          parameters=param.Parameters(therapy=therapy))
+    cohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
+    return cohort.cohortOutcomes
 
-# simulating donepezil
-# create a cohort
-cohort_SOC = model.Cohort(id=0,
-                           pop_size=data.POP_SIZE,
-                           parameters=param.Parameters(therapy=param.Therapies.SOC))
-# simulate the cohort
-cohort_SOC.simulate(n_time_steps=data.SIM_TIME_STEPS)
-
-# simulating dmt
-# create a cohort
-cohort_DMT30 = model.Cohort(id=1,
-                            pop_size=data.POP_SIZE,
-                            parameters=param.Parameters(therapy=param.Therapies.DMT_30))
-# simulate the cohort
-cohort_DMT30.simulate(n_time_steps=data.SIM_TIME_STEPS)
-
-# print the estimates for the mean survival time and mean time to severe state
-support.print_outcomes(sim_outcomes=cohort_SOC.cohortOutcomes,
-                       therapy_name=param.Therapies.SOC)
-support.print_outcomes(sim_outcomes=cohort_DMT30.cohortOutcomes,
-                       therapy_name=param.Therapies.DMT_30)
 
-# print comparative outcomes
-support.print_comparative_outcomes(sim_outcomes_soc=cohort_SOC.cohortOutcomes,
-                                   sim_outcomes_dmt=cohort_DMT30.cohortOutcomes)
+def simulate_multi_cohort(therapy):
+    """ :return: outcomes of a multi-cohort simulated under this therapy """
 
-# report the CEA results
-support.report_CEA_CBA(sim_outcomes_soc=cohort_SOC.cohortOutcomes,
-                       sim_outcomes_dmt=cohort_DMT30.cohortOutcomes)
+    multi_cohort = model.MultiCohort(
+        ids=range(data.N_COHORTS),   # [0, 1, 2 ..., N_COHORTS-1]
+        pop_sizes=[data.POP_SIZE]*data.N_COHORTS,   # [COHORT_POP_SIZE, COHORT_POP_SIZE, ..., COHORT_POP_SIZE]
+        parameters=param.Parameters(therapy=therapy))
+    multi_cohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
+    return multi_cohort.multiCohortOutcomes
 
-# graphs
-support.plot_survival_curves_and_histograms(sim_outcomes_soc=cohort_SOC.cohortOutcomes,
-                                            sim_outcomes_dmt=cohort_DMT30.cohortOutcomes)
 
+if __name__ == '__main__':
+
+    # the stages run as soon as their inputs are ready: both therapies are simulated at the same time,
+    # and the tables and figures of the cohorts are produced while the multi-cohorts are simulated
+    pipeline = Pipeline(name='Compare alternatives')
+    both = {'sim_outcomes_soc': 'Simulate donepezil', 'sim_outcomes_dmt': 'Simulate DMT'}
+    both_multi = {'multi_cohort_outcomes_soc': 'Simulate donepezil multi-cohort',
+                  'multi_cohort_outcomes_dmt30': 'Simulate DMT multi-cohort'}
+
+    # simulating donepezil and dmt
+    pipeline.add_stage('Simulate donepezil', simulate_cohort, where=PROCESS, id=0, therapy=param.Therapies.SOC)
+    pipeline.add_stage('Simulate DMT', simulate_cohort, where=PROCESS, id=1, therapy=param.Therapies.DMT_30)
+    pipeline.add_stage('Simulate donepezil multi-cohort', simulate_multi_cohort, where=PROCESS,
+                       therapy=param.Therapies.SOC)
+    pipeline.add_stage('Simulate DMT multi-cohort', simulate_multi_cohort, where=PROCESS,
+                       therapy=param.Therapies.DMT_30)
+
+    # print the estimates for the mean survival time and mean time to severe state
+    pipeline.add_stage('Print donepezil outcomes', support.print_outcomes,
+                       inputs={'sim_outcomes': 'Simulate donepezil'}, therapy_name=param.Therapies.SOC)
+    pipeline.add_stage('Print DMT outcomes', support.print_outcomes, inputs={'sim_outcomes': 'Simulate DMT'},
+                       therapy_name=param.Therapies.DMT_30)
 
-# create multicohort
-multiCohort = model.MultiCohort(
-    ids=range(data.N_COHORTS),   # [0, 1, 2 ..., N_COHORTS-1]
-    pop_sizes=[data.POP_SIZE]*data.N_COHORTS,
-    parameters=param.Parameters(therapy=param.Therapies.SOC)# [COHORT_POP_SIZE, COHORT_POP_SIZE, ..., COHORT_POP_SIZE]
-)
+    # print comparative outcomes
+    pipeline.add_stage('Print comparative outcomes', support.print_comparative_outcomes, inputs=both)
 
-multiCohort1 = model.MultiCohort(
-    ids=range(data.N_COHORTS),   # [0, 1, 2 ..., N_COHORTS-1]
-    pop_sizes=[data.POP_SIZE]*data.N_COHORTS,
-    parameters=param.Parameters(therapy=param.Therapies.DMT_30)# [COHORT_POP_SIZE, COHORT_POP_SIZE, ..., COHORT_POP_SIZE]
-)
+    # report the CEA results
+    pipeline.add_stage('CE table', support.write_CE_table, inputs=both, where=THREAD)
+    pipeline.add_stage('CE plane figure', support.plot_CE_plane, inputs=both, where=PROCESS)
+    pipeline.add_stage('NMB figure', support.plot_NMB_lines, inputs=both, where=PROCESS)
 
-# simulating multicohorts
-multiCohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
-multiCohort1.simulate(n_time_steps=data.SIM_TIME_STEPS)
+    # graphs
+    pipeline.add_stage('Survival figures', support.plot_survival_curves_and_histograms, inputs=both, where=PROCESS)
+    pipeline.add_stage('Multi-cohort survival figures', support.plot_survival_curves_and_histograms_multi,
+                       inputs=both_multi, where=PROCESS)
 
-# multicohort
-support.plot_survival_curves_and_histograms_multi(multi_cohort_outcomes_soc = multiCohort.multiCohortOutcomes,
-                                                  multi_cohort_outcomes_dmt30 = multiCohort1.multiCohortOutcomes)
\ No newline at end of file
+    pipeline.run()
@@ -0,0 +1,27 @@
+import InputData as data
+import StrategyClasses as strategy
+import Support as support
+
+# disease modifying treatment at other effectiveness levels and prices
+strategy.register_strategy(strategy.Strategy(
+    name='Disease Modifying Treatment at 20% effectiveness', relative_risk=0.20,
+    treatment_cost=data.DMT30_COST, color='lightsteelblue'))
+strategy.register_strategy(strategy.Strategy(
+    name='Disease Modifying Treatment at 40% effectiveness', relative_risk=0.40,
+    treatment_cost=data.DMT30_COST, color='navy'))
+strategy.register_strategy(strategy.Strategy(
+    name='Disease Modifying Treatment at 30% effectiveness ($40,000)', relative_risk=data.RR_DMT,
+    treatment_cost=40000/2, color='royalblue'))
+
+strategies = list(strategy.STRATEGIES.values())  # Donepezil is the base strategy
+
+# simulate all strategies over the same population of patients
+comparison = strategy.StrategyComparison(id=0, pop_size=data.POP_SIZE)
+comparison.simulate(strategy_names=[s.name for s in strategies], n_time_steps=data.SIM_TIME_STEPS)
+
+# print the outcomes of each strategy
+for s in strategies:
+    support.print_outcomes(sim_outcomes=comparison.strategyOutcomes[s.name], therapy_name=s.name)
+
+# cost-effectiveness frontier
+support.report_strategies_CEA(strategy_comparison=comparison, strategies=strategies)
@@ -0,0 +1,32 @@
+import time
+
+import InputData as data
+import MarkovClasses as model
+import ParameterClasses as param
+from AnalyticClasses import CohortTrace
+
+CYCLE_LENGTHS = [0.5, 0.25, 1 / 12]    # semi-annual, quarterly, and monthly time-steps (years)
+
+# the same horizon (SIM_YEARS) with finer time-steps: expected outcomes of the cohort trace, and the mean outcomes
+# and run time of the simulated cohort (patients simulated in batches)
+for cycle_length in CYCLE_LENGTHS:
+    n_time_steps = int(round(data.SIM_YEARS / cycle_length))
+    print('Cycle length {:.4f} years ({} time-steps):'.format(cycle_length, n_time_steps))
+    for therapy in [param.Therapies.SOC, param.Therapies.DMT_30]:
+        params = param.Parameters(therapy=therapy)
+        params.cycleLength = cycle_length
+
+        trace = CohortTrace(parameters=params)
+        trace.simulate(n_time_steps=n_time_steps)
+
+        start = time.perf_counter()
+        cohort = model.Cohort(id=0, pop_size=data.POP_SIZE, parameters=params, memory_budget=data.MEMORY_BUDGET)
+        cohort.simulate(n_time_steps=n_time_steps)
+        seconds = time.perf_counter() - start
+
+        outcomes = cohort.cohortOutcomes
+        print('  {}: expected cost {:,.0f}, QALY {:.3f}, mean time to SEVERE {:.2f} years'.format(
+            therapy.name, trace.expectedCost, trace.expectedUtility, trace.get_mean_time_to_severe() * cycle_length))
+        print('    simulated: cost {:,.0f}, QALY {:.3f}, mean time to SEVERE {:.2f} years ({:.2f} seconds)'.format(
+            outcomes.statCost.get_mean(), outcomes.statUtilities.get_mean(),
+            outcomes.statTimeToSEVERE.get_mean() * cycle_length, seconds))
@@ -0,0 +1,197 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+import InputData as data
+from MarkovClassesSensitivity import MultiCohort
+from SensitivityParamClasses import Therapies
+
+QUEUE_FILE = 'queue.sqlite'
+
+# status of a work unit
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+
+
+class PSAWorkQueue:
+    """ a queue of PSA work units (ranges of draws of a therapy) in an SQLite database on a shared file system,
+    so that workers on any host claim units, simulate their draws, and save the outcome of each draw in the
+    checkpoint directory of the therapy (see Checkpoints); the reducer then loads the outcomes of all draws.
+
+    A claimed unit is leased: its worker renews the lease after every draw, and a unit whose lease expired
+    (its worker crashed or was preempted) is claimed again by another worker, which skips the draws already saved.
+    (SQLite relies on file locks; the shared file system should support them, e.g. NFS with a lock manager.) """
+
+    def __init__(self, directory, lease_timeout=600):
+        """
+        :param directory: shared directory of the queue and of the saved outcomes
+        :param lease_timeout: seconds after the last renewal of a claimed unit at which it is reclaimed
+        """
+        self.directory = directory
+        self.leaseTimeout = lease_timeout
+        self._connection = None
+
+    def _connect(self):
+        """ :return: connection to the queue database (transactions are started explicitly) """
+
+        if self._connection is None:
+            self._connection = sqlite3.connect(os.path.join(self.directory, QUEUE_FILE),
+                                               timeout=60, isolation_level=None)
+        return self._connection
+
+    def create(self, therapies, n_draws, pop_size, n_time_steps, unit_size=10):
+        """ (coordinator) splits the draws of each therapy into work units; if the queue exists, its settings
+        have to be the same
+        :param therapies: (list) therapies to simulate
+        :param n_draws: number of PSA draws of each therapy
+        :param pop_size: population size of each cohort
+        :param n_time_steps: simulation length
+        :param unit_size: number of draws in a work unit
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        settings = json.dumps({'therapies': [therapy.name for therapy in therapies], 'nDraws': n_draws,
+                               'popSize': pop_size, 'nTimeSteps': n_time_steps, 'seed': data.SEED})
+
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS settings (value TEXT)')
+            connection.execute('CREATE TABLE IF NOT EXISTS units (id INTEGER PRIMARY KEY, therapy TEXT, '
+                               'first_draw INTEGER, end_draw INTEGER, status TEXT, worker TEXT, '
+                               'lease REAL, attempts INTEGER)')
+            connection.execute('CREATE INDEX IF NOT EXISTS units_status ON units (status, lease)')
+            row = connection.execute('SELECT value FROM settings').fetchone()
+            if row is None:
+                connection.execute('INSERT INTO settings VALUES (?)', (settings, ))
+                connection.executemany(
+                    'INSERT INTO units (therapy, first_draw, end_draw, status, attempts) VALUES (?, ?, ?, ?, 0)',
+                    [(therapy.name, first, min(first + unit_size, n_draws), PENDING)
+                     for therapy in therapies for first in range(0, n_draws, unit_size)])
+            elif json.loads(row[0]) != json.loads(settings):
+                raise ValueError('The queue in ' + self.directory + ' was created with different settings.')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        # the manifest of the checkpoint directory of each therapy is written here, once, so that workers
+        # only check it against their settings
+        for therapy in therapies:
+            self.get_multi_cohort(therapy=therapy).open_checkpoints(n_time_steps=n_time_steps)
+
+    def get_settings(self):
+        """ :return: (dict) settings the queue was created with """
+        return json.loads(self._connect().execute('SELECT value FROM settings').fetchone()[0])
+
+    def claim(self, worker_id):
+        """ claims the next pending unit, or a claimed unit whose lease expired
+        :param worker_id: id of the worker
+        :return: (unit id, therapy, first draw, end draw) of the claimed unit, or None if no unit is available
+        """
+
+        connection = self._connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT id, therapy, first_draw, end_draw FROM units '
+                'WHERE status = ? OR (status = ? AND lease < ?) ORDER BY id LIMIT 1',
+                (PENDING, CLAIMED, now - self.leaseTimeout)).fetchone()
+            if row is not None:
+                connection.execute('UPDATE units SET status = ?, worker = ?, lease = ?, attempts = attempts + 1 '
+                                   'WHERE id = ?', (CLAIMED, worker_id, now, row[0]))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return row
+
+    def renew(self, unit_id, worker_id):
+        """ renews the lease of a claimed unit
+        :return: False if the unit was reclaimed by another worker (its lease had expired) """
+
+        cursor = self._connect().execute('UPDATE units SET lease = ? WHERE id = ? AND worker = ? AND status = ?',
+                                         (time.time(), unit_id, worker_id, CLAIMED))
+        return cursor.rowcount == 1
+
+    def complete(self, unit_id, worker_id):
+        """ marks a claimed unit as done (all of its draws are saved) """
+        self._connect().execute('UPDATE units SET status = ? WHERE id = ? AND worker = ?',
+                                (DONE, unit_id, worker_id))
+
+    def get_progress(self):
+        """ :return: (dict) number of units by status """
+        return dict(self._connect().execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall())
+
+    def get_if_done(self):
+        """ :return: True if all units are done """
+        return self._connect().execute('SELECT COUNT(*) FROM units WHERE status != ?', (DONE, )).fetchone()[0] == 0
+
+    def get_multi_cohort(self, therapy):
+        """
+        :param therapy: a therapy of the queue
+        :return: a MultiCohort of the draws of this therapy whose outcomes are saved in the checkpoint directory
+            of the therapy (workers save each simulated draw there and the reducer loads them)
+        """
+
+        settings = self.get_settings()
+        return MultiCohort(ids=range(settings['nDraws']), pop_sizes=settings['popSize'], parameters=therapy,
+                           checkpoint_dir=os.path.join(self.directory, therapy.name))
+
+
+def run_worker(queue, worker_id=None, poll_interval=30):
+    """ claims and simulates work units until all units of the queue are done
+    :param queue: a PSAWorkQueue
+    :param worker_id: id of this worker (host name and process id by default)
+    :param poll_interval: seconds to wait before trying again when all remaining units are claimed by other
+        workers (their units are reclaimed if their leases expire)
+    :return: number of units this worker completed
+    """
+
+    if worker_id is None:
+        worker_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+    n_time_steps = queue.get_settings()['nTimeSteps']
+
+    n_completed = 0
+    while not queue.get_if_done():
+        unit = queue.claim(worker_id=worker_id)
+        if unit is None:
+            time.sleep(poll_interval)
+            continue
+
+        unit_id, therapy, first_draw, end_draw = unit
+        multi_cohort = queue.get_multi_cohort(therapy=Therapies[therapy])
+        for draw in range(first_draw, end_draw):
+            # draws saved by a worker that held this unit before are loaded instead of simulated
+            multi_cohort.simulate_draw(draw=draw, n_time_steps=n_time_steps)
+            if not queue.renew(unit_id=unit_id, worker_id=worker_id):
+                break   # the lease expired and another worker took over the unit
+        else:
+            queue.complete(unit_id=unit_id, worker_id=worker_id)
+            n_completed += 1
+
+    return n_completed
+
+
+def reduce_outcomes(queue):
+    """
+    :param queue: a PSAWorkQueue whose units are all done
+    :return: (dict) simulated MultiCohort of each therapy (outcomes of all draws loaded and summarized)
+    """
+
+    if not queue.get_if_done():
+        raise ValueError('Work units of the queue in ' + queue.directory + ' are not done yet: '
+                         + str(queue.get_progress()))
+
+    n_time_steps = queue.get_settings()['nTimeSteps']
+    multi_cohorts = {}
+    for therapy in queue.get_settings()['therapies']:
+        multi_cohort = queue.get_multi_cohort(therapy=Therapies[therapy])
+        # all draws are saved, so they are only loaded
+        multi_cohort.simulate(n_time_steps=n_time_steps)
+        multi_cohorts[Therapies[therapy]] = multi_cohort
+    return multi_cohorts
@@ -0,0 +1,54 @@
+import argparse
+
+import InputData as data
+import DistributedClasses as distributed
+import SensitivityParamClasses as param
+import SensitivitySupport as support
+
+QUEUE_DIR = 'psa_queue'     # directory of the work queue and the saved draws (on a file system shared by all nodes)
+N_COHORTS = 10000           # number of cohorts (PSA draws)
+POP_SIZE = 500              # population size of each cohort
+UNIT_SIZE = 20              # number of draws in a work unit
+LEASE_TIMEOUT = 600         # seconds without progress after which the unit of a worker is reclaimed
+
+# run on one node:      python DistributedPSA.py coordinate
+# run on every node:    python DistributedPSA.py work     (as many processes per node as it has cores)
+# once units are done:  python DistributedPSA.py reduce
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Probabilistic sensitivity analysis on multiple nodes.')
+    parser.add_argument('role', choices=['coordinate', 'work', 'reduce', 'progress'])
+    args = parser.parse_args()
+
+    queue = distributed.PSAWorkQueue(directory=QUEUE_DIR, lease_timeout=LEASE_TIMEOUT)
+
+    if args.role == 'coordinate':
+        queue.create(therapies=[param.Therapies.SOC, param.Therapies.DMT_30], n_draws=N_COHORTS,
+                     pop_size=POP_SIZE, n_time_steps=data.SIM_TIME_STEPS, unit_size=UNIT_SIZE)
+        print('Work units:', queue.get_progress())
+
+    elif args.role == 'work':
+        print('Work units completed by this worker:', distributed.run_worker(queue=queue))
+
+    elif args.role == 'progress':
+        print('Work units:', queue.get_progress())
+
+    else:
+        multiCohorts = distributed.reduce_outcomes(queue=queue)
+        outcomesSOC = multiCohorts[param.Therapies.SOC].multiCohortOutcomes
+        outcomesDMT30 = multiCohorts[param.Therapies.DMT_30].multiCohortOutcomes
+
+        # print the estimates for the mean survival time and mean time to severe stage
+        support.print_outcomes(multi_cohort_outcomes=outcomesSOC, therapy_name=param.Therapies.SOC)
+        support.print_outcomes(multi_cohort_outcomes=outcomesDMT30, therapy_name=param.Therapies.DMT_30)
+
+        # draw survival curves and histograms
+        support.plot_survival_curves_and_histograms(multi_cohort_outcomes_soc=outcomesSOC,
+                                                    multi_cohort_outcomes_dmt30=outcomesDMT30)
+
+        # print comparative outcomes
+        support.print_comparative_outcomes(multi_cohort_outcomes_soc=outcomesSOC,
+                                           multi_cohort_outcomes_dmt30=outcomesDMT30)
+
+        # report the CEA results
+        support.report_CEA_CBA(multi_cohort_outcomes_soc=outcomesSOC, multi_cohort_outcomes_dmt30=outcomesDMT30)
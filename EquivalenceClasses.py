@@ -0,0 +1,332 @@
+import os
+import tempfile
+
+import numpy as np
+import scipy.stats as scipy_stats
+
+import InputData as data
+from AnalyticClasses import CohortTrace, get_survival_time, get_time_to_severe
+from BudgetImpactClasses import ANALYTIC, BATCHED, BudgetImpact
+from InputData import HealthStates
+from MarkovClasses import Cohort, PatientBatch, get_chunk_uniforms
+from ParameterClasses import Parameters, Therapies
+from RandomStreams import get_patient_block_rng
+from TrajectoryClasses import TrajectoryStore
+
+# the path of every patient of the deterministic scenario (state at the end of each time-step)
+DETERMINISTIC_PATH = [HealthStates.MILD, HealthStates.SEVERE, HealthStates.ADJ_DEATH]
+
+
+def get_deterministic_parameters():
+    """ :return: parameter set whose transition matrix moves every patient along DETERMINISTIC_PATH
+        (PREDEM -> MILD -> SEVERE -> ADJ_DEATH), so that all engines must give the same outcomes """
+
+    params = Parameters(therapy=Therapies.DMT_30)
+    params.probMatrix = np.zeros((len(HealthStates), len(HealthStates)))
+    previous = params.initialHealthState
+    for state in DETERMINISTIC_PATH:
+        params.probMatrix[previous.value, state.value] = 1
+        previous = state
+    params.probMatrix[HealthStates.MODERATE.value, HealthStates.SEVERE.value] = 1
+    return params
+
+
+def get_scenarios():
+    """ :return: (dict) function that returns a new parameter set of each fixed scenario by name """
+
+    def get_age_dependent():
+        params = Parameters(therapy=Therapies.DMT_30)
+        params.ifAgeDependentMortality = True
+        return params
+
+    def get_quarterly():
+        params = Parameters(therapy=Therapies.DMT_30)
+        params.cycleLength = data.BASE_CYCLE_LENGTH / 2
+        return params
+
+    def get_starting_in(state):
+        params = Parameters(therapy=Therapies.DMT_30)
+        params.initialHealthState = state
+        return params
+
+    return {'SOC': lambda: Parameters(therapy=Therapies.SOC),
+            'DMT': lambda: Parameters(therapy=Therapies.DMT_30),
+            'DMT with age-dependent mortality': get_age_dependent,
+            'DMT with quarterly time-steps': get_quarterly,
+            'DMT starting in MODERATE': lambda: get_starting_in(HealthStates.MODERATE),
+            'DMT starting in SEVERE': lambda: get_starting_in(HealthStates.SEVERE)}
+
+
+class EquivalenceCheck:
+    """ the result of comparing an engine with the reference (Patient/Cohort) on a scenario """
+
+    def __init__(self, name, scenario, passed, detail):
+        """
+        :param name: name of the check
+        :param scenario: name of the scenario
+        :param passed: (bool) if the engine agrees with the reference
+        :param detail: description of the compared values
+        """
+        self.name = name
+        self.scenario = scenario
+        self.passed = bool(passed)
+        self.detail = detail
+
+    def __str__(self):
+        return '{} {} [{}]: {}'.format('PASS' if self.passed else 'FAIL', self.name, self.scenario, self.detail)
+
+
+def get_reference_outcomes(params, n_time_steps):
+    """ :return: (survival time, time to SEVERE, discounted cost, discounted utility) of a patient following
+        DETERMINISTIC_PATH, computed from the model rules: events are recorded at the middle of the time-step,
+        costs and utilities are the average of the states at both ends of the time-step, the treatment cost is
+        halved for the time-step of entering SEVERE, utility is zero for the time-step of death, rewards are
+        scaled from BASE_CYCLE_LENGTH to the cycle length, and the amount of time-step k is discounted over k+1
+        time-steps """
+
+    scale = params.cycleLength / data.BASE_CYCLE_LENGTH
+    costs = [c * scale for c in params.semiAnnualStateCosts]
+    utilities = [u * scale for u in params.stateUtilities]
+    survival_time, time_to_severe, cost, utility = None, None, 0, 0
+    current = params.initialHealthState
+    for k, new in enumerate(DETERMINISTIC_PATH[:n_time_steps]):
+        discount = (1 + params.discountRate * params.cycleLength) ** -(k + 1)
+        treatment = params.annualTreatmentCost * scale * (0.5 if new == HealthStates.SEVERE else 1)
+        cost += (0.5 * (costs[current.value] + costs[new.value]) + treatment) * discount
+        if new == HealthStates.ADJ_DEATH:
+            survival_time = k + 0.5
+        else:
+            utility += 0.5 * (utilities[current.value] + utilities[new.value]) * discount
+        if new == HealthStates.SEVERE and time_to_severe is None:
+            time_to_severe = k + 0.5
+        current = new
+    return survival_time, time_to_severe, cost, utility
+
+
+def check_deterministic_scenario(n_patients=100, n_time_steps=data.SIM_TIME_STEPS):
+    """ all engines against the outcomes of the model rules on the deterministic scenario (exact agreement
+    up to round-off) """
+
+    scenario = 'deterministic'
+    survival_time, time_to_severe, cost, utility = get_reference_outcomes(
+        params=get_deterministic_parameters(), n_time_steps=n_time_steps)
+    expected = [survival_time, time_to_severe, cost, utility]
+    checks = []
+
+    def add(name, values, expected_values=expected):
+        """ compares the values (of each patient) of every outcome with the expected value """
+        passed = all(np.allclose(v, e, rtol=1e-12) for v, e in zip(values, expected_values))
+        got = [float(np.mean(v)) for v in values]
+        checks.append(EquivalenceCheck(name=name, scenario=scenario, passed=passed,
+                                       detail='expected {}, got {}'.format(np.round(expected_values, 6),
+                                                                           np.round(got, 6))))
+
+    # patient loop
+    cohort = Cohort(id=0, pop_size=n_patients, parameters=get_deterministic_parameters())
+    cohort.simulate(n_time_steps=n_time_steps)
+    outcomes = cohort.cohortOutcomes
+    add('Patient', [outcomes.survivalTimes, outcomes.timeToSEVERE, outcomes.costs, outcomes.utilities])
+
+    # batch of patients
+    batch = PatientBatch(parameters=get_deterministic_parameters(), n_patients=n_patients)
+    batch.simulate(n_time_steps=n_time_steps, uniforms=np.random.default_rng(0).random((n_patients, n_time_steps)))
+    add('PatientBatch', [batch.survivalTimes, batch.timeToSEVERE, batch.costs, batch.utilities])
+
+    # cohort trace
+    trace = CohortTrace(parameters=get_deterministic_parameters())
+    trace.simulate(n_time_steps=n_time_steps)
+    add('CohortTrace', [trace.get_mean_survival_time(), trace.get_mean_time_to_severe(), trace.expectedCost,
+                        trace.expectedUtility])
+
+    # exact distributions
+    matrix = get_deterministic_parameters().probMatrix
+    add('FirstPassageTime', [get_survival_time(prob_matrix=matrix, n_time_steps=n_time_steps).get_mean(),
+                             get_time_to_severe(prob_matrix=matrix, n_time_steps=n_time_steps).get_mean()],
+        expected_values=[survival_time, time_to_severe])
+
+    # replay of recorded paths
+    with tempfile.TemporaryDirectory() as directory:
+        cohort = Cohort(id=0, pop_size=n_patients, parameters=get_deterministic_parameters(), memory_budget=1,
+                        trajectory_file=os.path.join(directory, 'paths'))
+        cohort.simulate(n_time_steps=n_time_steps)
+        costs, utilities = TrajectoryStore.open(cohort.trajectoryFile).replay(parameters=cohort.params)
+    add('TrajectoryStore.replay', [costs, utilities], expected_values=[cost, utility])
+
+    return checks
+
+
+def check_exact_engines(scenario, get_parameters, n_patients=3000, n_time_steps=data.SIM_TIME_STEPS):
+    """ engines that draw the same random numbers as the reference against the reference (exact agreement
+    up to round-off): PatientBatch, chunked Cohort (with and without antithetic pairs), and replay of
+    recorded paths """
+
+    checks = []
+    for antithetic in (False, True):
+        reference = Cohort(id=7, pop_size=n_patients, parameters=get_parameters(), antithetic=antithetic)
+        reference.simulate(n_time_steps=n_time_steps)
+        ref = reference.cohortOutcomes
+        suffix = ' (antithetic)' if antithetic else ''
+
+        # a batch simulated with the random numbers of the reference cohort
+        params = get_parameters()
+        uniforms = get_chunk_uniforms(
+            get_block_rng=lambda block_id: get_patient_block_rng(cohort_id=7, block_id=block_id,
+                                                                 therapy=params.therapy),
+            chunk_start=0, n_patients=n_patients, n_time_steps=n_time_steps, antithetic=antithetic)
+        batch = PatientBatch(parameters=params, n_patients=n_patients)
+        batch.simulate(n_time_steps=n_time_steps, uniforms=uniforms, monotone=antithetic)
+        passed = np.array_equal(batch.survivalTimes[~np.isnan(batch.survivalTimes)], ref.survivalTimes) \
+            and np.array_equal(batch.timeToSEVERE[~np.isnan(batch.timeToSEVERE)], ref.timeToSEVERE) \
+            and np.allclose(batch.costs, ref.costs, rtol=1e-12) \
+            and np.allclose(batch.utilities, ref.utilities, rtol=1e-12) \
+            and np.array_equal(batch.stateOccupancy, ref.stateOccupancy)
+        checks.append(EquivalenceCheck(
+            name='PatientBatch per patient' + suffix, scenario=scenario, passed=passed,
+            detail='{} patients, {} deaths'.format(n_patients, len(ref.survivalTimes))))
+
+        # a cohort simulated in several chunks with aggregate outcomes
+        chunked = Cohort(id=7, pop_size=n_patients, parameters=get_parameters(), antithetic=antithetic,
+                         memory_budget=0.1)
+        chunked.simulate(n_time_steps=n_time_steps)
+        agg = chunked.cohortOutcomes
+        means = [agg.statSurvivalTimes.get_mean(), agg.statTimeToSEVERE.get_mean(), agg.statCost.get_mean(),
+                 agg.statUtilities.get_mean()]
+        ref_means = [ref.statSurvivalTimes.get_mean(), ref.statTimeToSEVERE.get_mean(), ref.statCost.get_mean(),
+                     ref.statUtilities.get_mean()]
+        passed = np.allclose(means, ref_means, rtol=1e-9) \
+            and np.array_equal(agg.stateOccupancy, ref.stateOccupancy) \
+            and np.isclose(agg.statCost.get_t_half_length(alpha=data.ALPHA),
+                           ref.statCost.get_t_half_length(alpha=data.ALPHA), rtol=1e-6)
+        checks.append(EquivalenceCheck(
+            name='Chunked Cohort' + suffix, scenario=scenario, passed=passed,
+            detail='{} chunks, mean cost {:,.2f} vs {:,.2f}'.format(
+                -(-n_patients // chunked.get_chunk_size(n_time_steps)), means[2], ref_means[2])))
+
+    # replay of the recorded paths of the reference cohort
+    with tempfile.TemporaryDirectory() as directory:
+        recorded = Cohort(id=7, pop_size=n_patients, parameters=get_parameters(),
+                          trajectory_file=os.path.join(directory, 'paths'))
+        recorded.simulate(n_time_steps=n_time_steps)
+        costs, utilities = TrajectoryStore.open(recorded.trajectoryFile).replay(parameters=recorded.params)
+    passed = np.allclose(costs, recorded.cohortOutcomes.costs, rtol=1e-12) \
+        and np.allclose(utilities, recorded.cohortOutcomes.utilities, rtol=1e-12)
+    checks.append(EquivalenceCheck(name='TrajectoryStore.replay per patient', scenario=scenario, passed=passed,
+                                   detail='{} patients'.format(n_patients)))
+    return checks
+
+
+def check_stochastic_engines(scenario, get_parameters, n_patients=3000, n_time_steps=data.SIM_TIME_STEPS,
+                             alpha=0.001):
+    """ a batch simulated with other random numbers against the reference: two-sample Kolmogorov-Smirnov
+    tests of survival times and times to SEVERE, and z-tests of the mean discounted cost and utility """
+
+    reference = Cohort(id=1, pop_size=n_patients, parameters=get_parameters())
+    reference.simulate(n_time_steps=n_time_steps)
+    ref = reference.cohortOutcomes
+
+    # a batch with the random numbers of another cohort
+    params = get_parameters()
+    uniforms = get_chunk_uniforms(
+        get_block_rng=lambda block_id: get_patient_block_rng(cohort_id=2, block_id=block_id, therapy=params.therapy),
+        chunk_start=0, n_patients=n_patients, n_time_steps=n_time_steps)
+    batch = PatientBatch(parameters=params, n_patients=n_patients)
+    batch.simulate(n_time_steps=n_time_steps, uniforms=uniforms)
+
+    checks = []
+    for name, times, ref_times in [
+            ('survival time', batch.survivalTimes, ref.survivalTimes),
+            ('time to SEVERE', batch.timeToSEVERE, ref.timeToSEVERE)]:
+        p_value = scipy_stats.ks_2samp(times[~np.isnan(times)], ref_times).pvalue
+        checks.append(EquivalenceCheck(name='KS test of ' + name, scenario=scenario, passed=p_value > alpha,
+                                       detail='p-value {:.4f}'.format(p_value)))
+
+    z_critical = scipy_stats.norm.ppf(1 - alpha / 2)
+    for name, obs, ref_stat in [('discounted cost', batch.costs, ref.statCost),
+                                ('discounted utility', batch.utilities, ref.statUtilities)]:
+        z = (obs.mean() - ref_stat.get_mean()) / np.sqrt((obs.var(ddof=1) + ref_stat.get_stdev() ** 2) / n_patients)
+        checks.append(EquivalenceCheck(name='Mean ' + name, scenario=scenario, passed=abs(z) < z_critical,
+                                       detail='{:,.3f} vs {:,.3f} (z = {:.2f})'.format(
+                                           obs.mean(), ref_stat.get_mean(), z)))
+    return checks
+
+
+def check_analytic_engines(scenario, get_parameters, n_patients=200000, n_time_steps=data.SIM_TIME_STEPS,
+                           alpha=0.001):
+    """ analytic expectations (cohort trace, exact time distributions, analytic budget impact) against a large
+    simulated cohort; multiple comparisons are Bonferroni-corrected """
+
+    params = get_parameters()
+    batch = PatientBatch(parameters=params, n_patients=n_patients)
+    batch.simulate(n_time_steps=n_time_steps, uniforms=np.random.default_rng(data.SEED).random(
+        (n_patients, n_time_steps)))
+    trace = CohortTrace(parameters=get_parameters())
+    trace.simulate(n_time_steps=n_time_steps)
+    checks = []
+
+    # mean discounted cost and utility
+    z_critical = scipy_stats.norm.ppf(1 - alpha / 4)
+    for name, expected, obs in [('discounted cost', trace.expectedCost, batch.costs),
+                                ('discounted utility', trace.expectedUtility, batch.utilities)]:
+        z = (obs.mean() - expected) / (obs.std(ddof=1) / np.sqrt(n_patients))
+        checks.append(EquivalenceCheck(name='CohortTrace ' + name, scenario=scenario, passed=abs(z) < z_critical,
+                                       detail='{:,.3f} vs simulated {:,.3f} (z = {:.2f})'.format(
+                                           expected, obs.mean(), z)))
+
+    # state prevalence at the end of each time-step
+    expected = trace.get_state_prevalence()
+    observed = batch.stateOccupancy / n_patients
+    se = np.sqrt(expected * (1 - expected) / n_patients)
+    z_critical = scipy_stats.norm.ppf(1 - alpha / (2 * expected.size))
+    worst = np.max(np.abs(observed - expected) - z_critical * se)
+    checks.append(EquivalenceCheck(name='CohortTrace state prevalence', scenario=scenario,
+                                   passed=worst <= 1e-12,
+                                   detail='largest difference {:.5f}'.format(np.max(np.abs(observed - expected)))))
+
+    # distribution of survival time and time to SEVERE (the mass of patients without the event included) of the
+    # cohort trace and of the exact distributions, within the Dvoretzky-Kiefer-Wolfowitz bound of the empirical
+    # distribution function
+    epsilon = np.sqrt(np.log(8 / alpha) / (2 * n_patients))
+    distributions = [('CohortTrace survival time', trace.probDeath, batch.survivalTimes),
+                     ('CohortTrace time to SEVERE', trace.probSEVERE, batch.timeToSEVERE)]
+    # (exact distributions are for a time-homogeneous matrix and an initial state that is not the target)
+    if not params.ifAgeDependentMortality:
+        distributions.append(('FirstPassageTime survival time', get_survival_time(
+            prob_matrix=params.probMatrix, initial_state=params.initialHealthState, n_time_steps=n_time_steps,
+            cycle_length=params.cycleLength).get_pmf()[1], batch.survivalTimes))
+        if params.initialHealthState != HealthStates.SEVERE:
+            distributions.append(('FirstPassageTime time to SEVERE', get_time_to_severe(
+                prob_matrix=params.probMatrix, initial_state=params.initialHealthState, n_time_steps=n_time_steps,
+                cycle_length=params.cycleLength).get_pmf()[1], batch.timeToSEVERE))
+    for name, pmf, times in distributions:
+        steps = times[~np.isnan(times)].astype(int)
+        empirical = np.cumsum(np.bincount(steps, minlength=n_time_steps)[:n_time_steps]) / n_patients
+        distance = np.max(np.abs(empirical - np.cumsum(pmf)[:n_time_steps]))
+        checks.append(EquivalenceCheck(name=name, scenario=scenario, passed=distance <= epsilon,
+                                       detail='distance {:.5f} (bound {:.5f})'.format(distance, epsilon)))
+
+    # open-cohort budget impact: analytic against batched
+    entries = np.full(n_time_steps, n_patients // (4 * n_time_steps))
+    impacts = {}
+    for method in (ANALYTIC, BATCHED):
+        impacts[method] = BudgetImpact(id=0, entries=entries, parameters=get_parameters(), method=method)
+        impacts[method].simulate()
+    difference = abs(impacts[BATCHED].costs.sum() / impacts[ANALYTIC].costs.sum() - 1)
+    checks.append(EquivalenceCheck(name='BudgetImpact analytic total cost', scenario=scenario,
+                                   passed=difference < 0.01,
+                                   detail='relative difference {:.5f}'.format(difference)))
+    return checks
+
+
+def run_all_checks(n_patients=3000, n_large=200000):
+    """
+    :param n_patients: population size of the cohorts compared with the reference patient loop
+    :param n_large: population size of the cohorts compared with analytic expectations
+    :return: (list) EquivalenceCheck of every engine and scenario
+    """
+
+    checks = check_deterministic_scenario()
+    for scenario, get_parameters in get_scenarios().items():
+        checks += check_exact_engines(scenario=scenario, get_parameters=get_parameters, n_patients=n_patients)
+        checks += check_stochastic_engines(scenario=scenario, get_parameters=get_parameters, n_patients=n_patients)
+        checks += check_analytic_engines(scenario=scenario, get_parameters=get_parameters, n_patients=n_large)
+    return checks
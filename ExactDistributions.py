@@ -0,0 +1,52 @@
+import deampy.plots.histogram as hist
+
+import AnalyticClasses as analytic
+import InputData as data
+import ParameterClasses as param
+import SensitivityParamClasses as sens_param
+import Support as support
+
+N_PSA_DRAWS = 1000   # number of parameter samples for the probabilistic sensitivity analysis
+
+# transition probability matrices of both therapies
+matrix_soc = param.Parameters(therapy=param.Therapies.SOC).probMatrix
+matrix_dmt = param.Parameters(therapy=param.Therapies.DMT_30).probMatrix
+
+for therapy, matrix in [(param.Therapies.SOC, matrix_soc), (param.Therapies.DMT_30, matrix_dmt)]:
+    print(therapy)
+    for horizon_name, n_time_steps in [('simulation horizon', data.SIM_TIME_STEPS), ('lifetime', None)]:
+        survival = analytic.get_survival_time(prob_matrix=matrix, n_time_steps=n_time_steps)
+        time_to_severe = analytic.get_time_to_severe(prob_matrix=matrix, n_time_steps=n_time_steps)
+        print('  {}:'.format(horizon_name))
+        print('    Probability of death:', survival.get_prob_event())
+        print('    Mean (st dev) survival time:', survival.get_mean(), survival.get_stdev())
+        print('    {:.{prec}%} percentile interval of survival time:'.format(1 - data.ALPHA, prec=0),
+              survival.get_PI(alpha=data.ALPHA))
+        print('    Probability of reaching severe state:', time_to_severe.get_prob_event())
+        print('    Mean (st dev) time to severe state:', time_to_severe.get_mean(), time_to_severe.get_stdev())
+        print('    {:.{prec}%} percentile interval of time to severe state:'.format(1 - data.ALPHA, prec=0),
+              time_to_severe.get_PI(alpha=data.ALPHA))
+
+# exact distributions within the simulation horizon
+support.plot_exact_time_distributions(
+    dist_soc=analytic.get_survival_time(prob_matrix=matrix_soc, n_time_steps=data.SIM_TIME_STEPS),
+    dist_dmt=analytic.get_survival_time(prob_matrix=matrix_dmt, n_time_steps=data.SIM_TIME_STEPS),
+    x_label='Survival time (year)',
+    file_name='figs/compare/exact_survival_times.png')
+support.plot_exact_time_distributions(
+    dist_soc=analytic.get_time_to_severe(prob_matrix=matrix_soc, n_time_steps=data.SIM_TIME_STEPS),
+    dist_dmt=analytic.get_time_to_severe(prob_matrix=matrix_dmt, n_time_steps=data.SIM_TIME_STEPS),
+    x_label='Time to Severe (years)',
+    file_name='figs/compare/exact_times_severe_state.png')
+
+# exact mean survival time for each PSA draw (in one batch, without simulating cohorts)
+param_generator = sens_param.ParameterGenerator(therapy=param.Therapies.DMT_30)
+psa_matrices = [param_generator.get_new_parameters(seed=i).probMatrix for i in range(N_PSA_DRAWS)]
+psa_survival = analytic.get_survival_time(prob_matrix=psa_matrices, n_time_steps=data.SIM_TIME_STEPS)
+
+hist.plot_histogram(
+    data=psa_survival.get_mean(),
+    title='Histogram of Exact Mean Survival Time',
+    x_label='Survival Time (year)',
+    bin_width=0.1,
+    file_name='figs/exact_survival_times_sensitivity.png')
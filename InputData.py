@@ -1,12 +1,27 @@
+import csv
 from enum import Enum
 import numpy as np
 
 N_COHORTS = 10         # number of cohorts
 POP_SIZE = 10000       # cohort population size
-SIM_TIME_STEPS = 20    # length of simulation (half years)
+SIM_YEARS = 10         # length of simulation (years)
 ALPHA = 0.05           # significance level for calculating confidence intervals
 DISCOUNT = 0.03        # annual discount rate
 RR_DMT = 0.30          # effectiveness of DMT
+WTP = 100000           # willingness-to-pay per QALY to calculate net monetary benefit
+SEED = 2024            # root seed from which all random number streams are derived
+RNG_BLOCK_SIZE = 1000  # number of patients simulated with the same random number stream
+
+AGE_DEPENDENT_MORTALITY = False  # set to True to increase background mortality with age over time
+AGE_AT_START = 70      # age of patients at the start of simulation (years)
+SEX = 'Female'         # sex of patients ('Male' or 'Female') to select the life table column
+CYCLE_LENGTH = 0.5     # length of a simulation time-step (years); e.g. 0.25 for quarterly or 1/12 for monthly
+BASE_CYCLE_LENGTH = 0.5     # time-step (years) of the transition counts, state costs, treatment costs and utilities
+                            # below (they are converted to CYCLE_LENGTH, see ParameterClasses)
+SIM_TIME_STEPS = int(round(SIM_YEARS / CYCLE_LENGTH))  # length of simulation (time-steps)
+LIFE_TABLE_FILE = 'LifeTable.csv'   # annual probability of death by age (illustrative Gompertz approximation)
+POPULATION_FILE = 'PopulationStrata.csv'    # covariate strata of the population and their shares
+MEMORY_BUDGET = 500    # megabytes available to simulate a group of patients as a batch
 
 SEMI_ANNUAL_STATE_COST = [3875,      # PREDEM
                           3875,      # MILD
@@ -52,9 +67,6 @@ def get_trans_prob_matrix(trans_matrix):
 
     return trans_prob_matrix
 
-# printing transition probability matrix for standard of care
-print(get_trans_prob_matrix(TRANS_MATRIX))
-
 # transition probability matrix for DMT
 def get_trans_prob_matrix_dmt_30(trans_prob_matrix_soc, relative_risk_dmt):
     """
@@ -88,5 +100,70 @@ def get_trans_prob_matrix_dmt_30(trans_prob_matrix_soc, relative_risk_dmt):
 
     return matrix_dmt
 
-# printing transition probability matrix for DMT at predementia stage
-print(get_trans_prob_matrix_dmt_30(get_trans_prob_matrix(TRANS_MATRIX),0.30))
\ No newline at end of file
+
+def read_life_table(file_name=LIFE_TABLE_FILE):
+    """
+    :param file_name: csv file with columns Age, Male, Female of annual probabilities of death
+    :return: (dict) of numpy arrays of annual probability of death indexed by age, for 'Male' and 'Female'
+    """
+
+    with open(file_name, newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    life_table = {}
+    for sex in ('Male', 'Female'):
+        # ages below the first age in the table take the first value
+        probs = np.zeros(int(rows[-1]['Age']) + 1)
+        for row in rows:
+            probs[int(row['Age'])] = float(row[sex])
+        probs[:int(rows[0]['Age'])] = probs[int(rows[0]['Age'])]
+        life_table[sex] = probs
+
+    return life_table
+
+
+def get_trans_prob_matrices_by_age(trans_prob_matrix, age, sex, n_time_steps, life_table,
+                                   cycle_length=CYCLE_LENGTH):
+    """
+    :param trans_prob_matrix: transition probability matrix estimated for patients aged 'age'
+    :param age: age of patients at the start of simulation (years)
+    :param sex: 'Male' or 'Female'
+    :param n_time_steps: number of time-steps
+    :param life_table: life table returned by read_life_table
+    :param cycle_length: length of a time-step (years) of trans_prob_matrix
+    :return: (numpy.array) transition probability matrices of time-steps 0, 1, ..., n_time_steps-1 with
+        shape (n_time_steps, n_states, n_states); the excess (disease-related) mortality of each state is
+        kept while background mortality follows the life table as patients age
+    """
+
+    probs = np.array(trans_prob_matrix, dtype=float)
+    death = HealthStates.ADJ_DEATH.value
+    annual_death = life_table[sex]
+
+    def background_death(age_at_step):
+        # probability of death from other causes during one time-step
+        q = annual_death[min(int(age_at_step), len(annual_death) - 1)]
+        return 1 - (1 - q) ** cycle_length
+
+    matrices = np.repeat(probs[np.newaxis], n_time_steps, axis=0)
+    survival_at_start = 1 - background_death(age)
+    for k in range(n_time_steps):
+        # probability of surviving background mortality relative to the starting age
+        ratio = (1 - background_death(age + k * cycle_length)) / survival_at_start
+        for s in range(probs.shape[0]):
+            if s == death:
+                continue
+            p_death = 1 - (1 - probs[s, death]) * ratio
+            # scale other transitions so that the row sums to 1
+            matrices[k, s] *= ratio
+            matrices[k, s, death] = p_death
+
+    return matrices
+
+
+if __name__ == '__main__':
+    # printing transition probability matrix for standard of care
+    print(get_trans_prob_matrix(TRANS_MATRIX))
+
+    # printing transition probability matrix for DMT at predementia stage
+    print(get_trans_prob_matrix_dmt_30(get_trans_prob_matrix(TRANS_MATRIX),0.30))
@@ -1,10 +1,161 @@
+import bisect
+
 import numpy as np
-from deampy.markov import MarkovJumpProcess
+import scipy.stats as scipy_stats
 from deampy.plots.sample_paths import PrevalencePathBatchUpdate
 import deampy.statistics as stats
 import deampy.econ_eval as econ
 
+import InputData as data
+from AnalyticClasses import get_discount_factors, get_prob_matrices, get_step_rewards, get_transition_rewards
+from Checkpoints import CheckpointDirectory, get_cohort_record, get_parameter_settings
 from InputData import HealthStates
+from PopulationClasses import get_stratum_parameters, get_stratum_sizes
+from RandomStreams import AntitheticGenerator, get_patient_block_rng
+from TrajectoryClasses import PADDING, TrajectoryStore
+
+
+class TransitionSampler:
+    """ samples the next health state from the transition probability matrix of the current time-step with
+    the alias method (one uniform random number and constant time per transition), or by inversion of the
+    cumulative probabilities when the next state must be monotone in the uniform (antithetic sampling) """
+
+    def __init__(self, prob_matrices):
+        """
+        :param prob_matrices: (numpy.array) transition probability matrices of each time-step with shape
+            (n_time_steps, n_states, n_states)
+        """
+
+        matrices = np.array(prob_matrices, dtype=float)
+        self.nTimeSteps, self.nStates = matrices.shape[0], matrices.shape[-1]
+
+        # ADJ_DEATH is absorbing (whatever its row), so paths can be sampled without tracking who is alive
+        death = HealthStates.ADJ_DEATH.value
+        matrices[:, death] = 0
+        matrices[:, death, death] = 1
+
+        # alias tables: column i of row s is kept with probability prob[k, s, i], otherwise alias[k, s, i]
+        # is returned; time-steps with the same matrix share their tables
+        self.prob = np.ones(matrices.shape)
+        self.alias = np.tile(np.arange(self.nStates), matrices.shape[:2] + (1, ))
+        for k in range(self.nTimeSteps):
+            if k > 0 and np.array_equal(matrices[k], matrices[k - 1]):
+                self.prob[k], self.alias[k] = self.prob[k - 1], self.alias[k - 1]
+                continue
+            for s, row in enumerate(matrices[k]):
+                self._build_alias_table(k, s, row)
+
+        # cumulative probabilities of each row (for sampling by inversion)
+        self.cumProbs = np.cumsum(matrices, axis=-1)
+        self.cumProbs /= self.cumProbs[..., -1:]
+
+        # python lists for fast look-ups when sampling one transition at a time
+        self._probRows = self.prob.tolist()
+        self._aliasRows = self.alias.tolist()
+        self._cumRows = self.cumProbs.tolist()
+
+    def _build_alias_table(self, k, s, row):
+        """ builds the alias table of state s at time-step k (Vose's method) """
+
+        scaled = np.asarray(row, dtype=float) * self.nStates / np.sum(row)
+        small = [i for i in range(self.nStates) if scaled[i] < 1]
+        large = [i for i in range(self.nStates) if scaled[i] >= 1]
+        while small and large:
+            i, j = small.pop(), large.pop()
+            self.prob[k, s, i] = scaled[i]
+            self.alias[k, s, i] = j
+            scaled[j] -= 1 - scaled[i]
+            if scaled[j] < 1:
+                small.append(j)
+            else:
+                large.append(j)
+        # what remains has probability 1 up to round-off
+        for i in small + large:
+            self.prob[k, s, i] = 1
+
+    def next_state(self, current_state_index, uniform, time_step=0, monotone=False):
+        """
+        :param current_state_index: (int) index of the current state
+        :param uniform: a uniform random number in [0, 1)
+        :param time_step: (int) current time-step
+        :param monotone: set to True to sample by inversion (the next state index is non-decreasing in uniform)
+        :return: (int) index of the next state
+        """
+
+        if monotone:
+            return min(bisect.bisect_right(self._cumRows[time_step][current_state_index], uniform),
+                       self.nStates - 1)
+
+        x = uniform * self.nStates
+        i = min(int(x), self.nStates - 1)
+        if x - i < self._probRows[time_step][current_state_index][i]:
+            return i
+        return self._aliasRows[time_step][current_state_index][i]
+
+    def next_states(self, current_states, uniforms, time_step=0, monotone=False):
+        """
+        :param current_states: (numpy.array) indices of the current states of a batch of patients
+        :param uniforms: (numpy.array) uniform random numbers in [0, 1), one per patient
+        :param time_step: (int) current time-step
+        :param monotone: set to True to sample by inversion (the next state index is non-decreasing in uniform)
+        :return: (numpy.array) indices of the next states
+        """
+
+        if monotone:
+            below = uniforms[:, None] >= self.cumProbs[time_step, current_states]
+            return np.minimum(below.sum(axis=1), self.nStates - 1)
+
+        x = uniforms * self.nStates
+        i = np.minimum(x.astype(int), self.nStates - 1)
+        return np.where(x - i < self.prob[time_step, current_states, i],
+                        i, self.alias[time_step, current_states, i])
+
+    def sample_paths(self, initial_state_index, uniforms, monotone=False):
+        """
+        :param initial_state_index: (int) index of the initial state of all patients
+        :param uniforms: (numpy.array) uniform random numbers in [0, 1) of shape (n_patients, n_time_steps)
+        :param monotone: set to True to sample by inversion (the next state index is non-decreasing in uniform)
+        :return: (numpy.array) of shape (n_time_steps, n_patients) with the index of the state of each patient at
+            the end of each time-step (the same states as next_states; patients stay in the absorbing ADJ_DEATH)
+        """
+
+        n_patients, n_time_steps = uniforms.shape
+        paths = np.empty((n_time_steps, n_patients), dtype=np.uint8)
+        states = np.full(n_patients, initial_state_index)
+        fractions = np.ascontiguousarray(uniforms.T)    # one row per time-step
+
+        if monotone:
+            for k in range(n_time_steps):
+                states = self.next_states(current_states=states, uniforms=fractions[k], time_step=k, monotone=True)
+                paths[k] = states
+            return paths
+
+        # the alias column and its fraction of every uniform are found for all time-steps at once, so that a
+        # time-step only looks up the alias tables of the current states (a few array operations per time-step)
+        fractions *= self.nStates
+        columns = np.minimum(fractions.astype(np.uint8), self.nStates - 1)
+        fractions -= columns
+        probs = self.prob.reshape(self.nTimeSteps, -1)
+        aliases = self.alias.reshape(self.nTimeSteps, -1)
+        for k in range(n_time_steps):
+            cells = states * self.nStates + columns[k]
+            states = np.where(fractions[k] < probs[k].take(cells), columns[k], aliases[k].take(cells))
+            paths[k] = states
+        return paths
+
+
+def get_transition_sampler(parameters, n_time_steps):
+    """
+    :param parameters: parameter set
+    :param n_time_steps: simulation length
+    :return: the transition sampler of this parameter set (built on first use and then shared by all patients)
+    """
+
+    sampler = parameters.transitionSampler
+    if sampler is None or sampler.nTimeSteps < n_time_steps:
+        sampler = TransitionSampler(prob_matrices=get_prob_matrices(parameters, n_time_steps))
+        parameters.transitionSampler = sampler
+    return sampler
 
 
 class Patient:
@@ -13,22 +164,29 @@ class Patient:
         self.params = parameters
         self.stateMonitor = PatientStateMonitor(parameters=parameters)
 
-    def simulate(self, n_time_steps):
-        """ simulate the patient over the specified simulation length """
+    def simulate(self, n_time_steps, rng, monotone=False):
+        """ simulate the patient over the specified simulation length
+        :param n_time_steps: simulation length
+        :param rng: random number generator of the block of patients this patient belongs to
+        :param monotone: set to True to sample transitions by inversion (needed for antithetic pairs)
+        """
 
-        rng = np.random.RandomState(seed=self.id)     # random number generator
-        markov_jump = MarkovJumpProcess(transition_prob_matrix=self.params.probMatrix)     # Markov jump process
+        # one uniform random number per time-step (drawn even after death so that
+        # every patient uses the same number of random numbers)
+        uniforms = rng.random(n_time_steps).tolist()
+        sampler = get_transition_sampler(self.params, n_time_steps)   # transition sampler shared by all patients
 
         k = 0  # simulation time step
 
         # while the patient is alive and simulation length is not yet reached
         while self.stateMonitor.get_if_alive() and k < n_time_steps:
 
-            # sample from the Markov jump process to get a new state
-            # (returns an integer from {0, 1, 2, ...})
-            new_state_index = markov_jump.get_next_state(
+            # sample a new state (returns an integer from {0, 1, 2, ...})
+            new_state_index = sampler.next_state(
                 current_state_index=self.stateMonitor.currentState.value,
-                rng=rng)
+                uniform=uniforms[k],
+                time_step=k,
+                monotone=monotone)
 
             self.stateMonitor.update(time_step=k, new_state=HealthStates(new_state_index))         # update health state
 
@@ -42,6 +200,7 @@ class PatientStateMonitor:
         self.currentState = parameters.initialHealthState
         self.survivalTime = None
         self.timeToSEVERE = None
+        self.stateIndices = []      # index of the state at the end of each time-step (until death)
         self.costUtilityMonitor = PatientCostUtilityMonitor(parameters=parameters)
 
     def update(self, time_step, new_state):
@@ -54,6 +213,7 @@ class PatientStateMonitor:
         # update cost utility monitor
         self.costUtilityMonitor.update(k=time_step, current_state=self.currentState, next_state=new_state)
         self.currentState = new_state
+        self.stateIndices.append(new_state.value)
 
     def get_if_alive(self):
         return self.currentState != HealthStates.ADJ_DEATH     # check if patient is alive
@@ -65,28 +225,31 @@ class PatientCostUtilityMonitor:
         self.totalDiscountedCost = 0
         self.totalDiscountedUtility = 0
 
+        # costs and utilities of a time-step of the cycle length of the parameters, and discount rate per time-step
+        state_costs, state_utilities, self.treatmentCost = get_step_rewards(parameters)
+        self.stateCosts, self.stateUtilities = state_costs.tolist(), state_utilities.tolist()
+        self.discountRate = parameters.discountRate * parameters.cycleLength
+
     def update(self, k, current_state, next_state):
 
         # Update cost, calculating half-cycle for transitions
-        cost = 0.5 * (self.params.semiAnnualStateCosts[current_state.value] +
-                      self.params.semiAnnualStateCosts[next_state.value])
+        cost = 0.5 * (self.stateCosts[current_state.value] + self.stateCosts[next_state.value])
 
         # Calculate utility if the state is associated with a utility
         utility = 0
         if current_state != HealthStates.ADJ_DEATH and next_state != HealthStates.ADJ_DEATH:
-            utility = 0.5 * (self.params.stateUtilities[current_state.value] +
-                             self.params.stateUtilities[next_state.value])
+            utility = 0.5 * (self.stateUtilities[current_state.value] + self.stateUtilities[next_state.value])
 
         # Treatment cost adjustments based on state
         if next_state == HealthStates.SEVERE:
-            cost += 0.5 * self.params.annualTreatmentCost # Only half cycle treatment cost if next state is SEVERE
+            cost += 0.5 * self.treatmentCost # Only half cycle treatment cost if next state is SEVERE
         else:
-            cost += self.params.annualTreatmentCost
+            cost += self.treatmentCost
 
         # Apply discounting
-        discounted_cost = econ.pv_single_payment(payment=cost, discount_rate=self.params.discountRate / 2,
+        discounted_cost = econ.pv_single_payment(payment=cost, discount_rate=self.discountRate,
                                                  discount_period=k + 1)
-        discounted_utility = econ.pv_single_payment(payment=utility, discount_rate=self.params.discountRate / 2,
+        discounted_utility = econ.pv_single_payment(payment=utility, discount_rate=self.discountRate,
                                                     discount_period=k + 1)
 
         # Update total discounted cost and utility
@@ -94,35 +257,266 @@ class PatientCostUtilityMonitor:
         self.totalDiscountedUtility += discounted_utility
 
 
+class PatientBatch:
+    """ simulates a batch of patients together as arrays; given the same uniform random numbers, the outcomes
+    are those of simulating each Patient (the alias sampler maps a uniform to the same next state) """
+
+    def __init__(self, parameters, n_patients, record_paths=False):
+        self.params = parameters
+        self.nPatients = n_patients
+        self.recordPaths = record_paths     # if the state path of each patient is recorded
+        self.statePaths = None              # (n_patients, n_time_steps) index of the state at the end of each
+                                            # time-step (PADDING after death) if paths are recorded
+        self.survivalTimes = np.full(n_patients, np.nan)    # nan if alive at the end of simulation
+        self.timeToSEVERE = np.full(n_patients, np.nan)     # nan if SEVERE state is not reached
+        self.costs = np.zeros(n_patients)                   # discounted costs
+        self.utilities = np.zeros(n_patients)               # discounted utilities
+        self.stateOccupancy = None      # (n_states, n_time_steps) number of patients in each state at the end
+                                        # of each time-step
+        self.stepCosts = None           # (n_time_steps, ) undiscounted cost of all patients in each time-step
+
+    def simulate(self, n_time_steps, uniforms, monotone=False):
+        """ simulate the batch of patients over the specified simulation length
+        :param n_time_steps: simulation length
+        :param uniforms: (numpy.array) uniform random numbers of shape (n_patients, n_time_steps)
+        :param monotone: set to True to sample transitions by inversion (needed for antithetic pairs)
+        """
+
+        sampler = get_transition_sampler(self.params, n_time_steps)
+        death, severe = HealthStates.ADJ_DEATH.value, HealthStates.SEVERE.value
+        initial_state = self.params.initialHealthState.value
+
+        # state of each patient at the end of each time-step (n_time_steps, n_patients), and at its start
+        paths = sampler.sample_paths(initial_state_index=initial_state, uniforms=uniforms[:, :n_time_steps],
+                                     monotone=monotone)
+        previous = np.empty_like(paths)
+        previous[0] = initial_state
+        previous[1:] = paths[:-1]
+
+        # half-cycle costs and utilities of the transitions (none from ADJ_DEATH)
+        n_states = sampler.nStates
+        transition_costs, transition_utilities = get_transition_rewards(self.params)
+        transitions = previous.astype(np.intp) * n_states + paths
+        step_costs = transition_costs.ravel().take(transitions)
+        discount_factors = get_discount_factors(self.params, n_time_steps)
+        self.costs = discount_factors @ step_costs
+        self.stepCosts = step_costs.sum(axis=1)
+        del step_costs
+        self.utilities = discount_factors @ transition_utilities.ravel().take(transitions)
+        del transitions
+
+        # number of patients in each state at the end of each time-step
+        cells = paths + np.arange(n_time_steps)[:, np.newaxis] * n_states
+        self.stateOccupancy = np.bincount(cells.ravel(), minlength=n_time_steps * n_states).reshape(
+            n_time_steps, n_states).T
+        del cells
+
+        # times of events (with half-cycle correction)
+        dead = paths == death
+        self.survivalTimes = np.where(dead[-1], dead.argmax(axis=0) + 0.5, np.nan)
+        # (as in PatientStateMonitor, the first time-step ending in SEVERE, also for patients starting in SEVERE)
+        in_severe = paths == severe
+        self.timeToSEVERE = np.where(in_severe.any(axis=0), in_severe.argmax(axis=0) + 0.5, np.nan)
+
+        if self.recordPaths:
+            self.statePaths = np.where(previous == death, np.uint8(PADDING), paths).T
+
+
 class Cohort:
-    def __init__(self, id, pop_size, parameters):
+    def __init__(self, id, pop_size, parameters, memory_budget=None, stratum_id=None, antithetic=False,
+                 trajectory_file=None):
+        """
+        :param id: cohort id
+        :param pop_size: population size
+        :param parameters: parameter set
+        :param memory_budget: (float) megabytes of memory the simulation arrays may use; if provided,
+            patients are simulated in batches of a size that fits this budget and only aggregate
+            outcomes are kept (patient-level lists stay empty)
+        :param stratum_id: (int) index of the population stratum this cohort represents (if any)
+        :param antithetic: set to True to simulate patients in antithetic pairs (variance reduction)
+        :param trajectory_file: base name of the files to record the state path of each patient in
+            (see TrajectoryClasses.TrajectoryStore; None: paths are not recorded)
+        """
         self.id = id
         self.popSize = pop_size
         self.params = parameters
-        self.cohortOutcomes = CohortOutcomes()  # outcomes of this simulated cohort
+        self.memoryBudget = memory_budget
+        self.stratumId = stratum_id
+        self.antithetic = antithetic
+        self.trajectoryFile = trajectory_file
+        self.trajectoryStore = None     # state paths of the patients (if recorded)
+        if memory_budget is None:
+            self.cohortOutcomes = CohortOutcomes(antithetic=antithetic)  # outcomes of this simulated cohort
+        else:
+            self.cohortOutcomes = AggregateCohortOutcomes(antithetic=antithetic)
 
     def simulate(self, n_time_steps):
         """ simulate the cohort of patients over the specified number of time-steps """
+
+        if self.trajectoryFile is not None:
+            self.trajectoryStore = TrajectoryStore.create(
+                file_name=self.trajectoryFile, n_patients=self.popSize, n_time_steps=n_time_steps,
+                initial_state=self.params.initialHealthState, cohort_id=self.id, therapy=self.params.therapy.name,
+                cycle_length=self.params.cycleLength)
+
+        if self.memoryBudget is not None:
+            self._simulate_in_chunks(n_time_steps=n_time_steps)
+            return
+
+        self.cohortOutcomes.stateOccupancy = np.zeros((len(HealthStates), n_time_steps), dtype=np.int64)
+
         # populate and simulate the cohort
         for i in range(self.popSize):
+            # each block of patients uses its own random number stream
+            if i % data.RNG_BLOCK_SIZE == 0:
+                rng = get_patient_block_rng(cohort_id=self.id, block_id=i // data.RNG_BLOCK_SIZE,
+                                            therapy=self.params.therapy, stratum_id=self.stratumId)
+                if self.antithetic:
+                    rng = AntitheticGenerator(rng=rng)
             # create a new patient (use id * pop_size + n as patient id)
             patient = Patient(id=self.id * self.popSize + i,
                               parameters=self.params)
             # simulate
-            patient.simulate(n_time_steps)
+            patient.simulate(n_time_steps, rng=rng, monotone=self.antithetic)
 
             # store outputs of this simulation
             self.cohortOutcomes.extract_outcome(simulated_patient=patient)
+            if self.trajectoryStore is not None:
+                self.trajectoryStore.write_path(patient_index=i, state_indices=patient.stateMonitor.stateIndices)
+
+        # calculate cohort outcomes
+        self.cohortOutcomes.calculate_cohort_outcomes(initial_pop_size=self.popSize)
+        if self.trajectoryStore is not None:
+            self.trajectoryStore.close()
+
+    def get_chunk_size(self, n_time_steps):
+        """
+        :param n_time_steps: simulation length
+        :return: number of patients to simulate together under the memory budget (a multiple of RNG_BLOCK_SIZE)
+        """
+        return get_chunk_size(memory_budget=self.memoryBudget, n_time_steps=n_time_steps)
+
+    def _simulate_in_chunks(self, n_time_steps):
+        """ simulate the cohort in chunks of patients and stream their outcomes into aggregate outcomes """
+
+        chunk_size = self.get_chunk_size(n_time_steps=n_time_steps)
+        self.cohortOutcomes.nDeaths = np.zeros(n_time_steps, dtype=np.int64)
+        self.cohortOutcomes.stateOccupancy = np.zeros((len(HealthStates), n_time_steps), dtype=np.int64)
+
+        for chunk_start in range(0, self.popSize, chunk_size):
+            n_patients = min(chunk_size, self.popSize - chunk_start)
+
+            # random numbers of the blocks of patients in this chunk
+            uniforms = get_chunk_uniforms(
+                get_block_rng=lambda block_id: get_patient_block_rng(
+                    cohort_id=self.id, block_id=block_id,
+                    therapy=self.params.therapy, stratum_id=self.stratumId),
+                chunk_start=chunk_start, n_patients=n_patients, n_time_steps=n_time_steps,
+                antithetic=self.antithetic)
+
+            # simulate the chunk and store its outcomes
+            batch = PatientBatch(parameters=self.params, n_patients=n_patients,
+                                 record_paths=self.trajectoryStore is not None)
+            batch.simulate(n_time_steps=n_time_steps, uniforms=uniforms, monotone=self.antithetic)
+            self.cohortOutcomes.extract_batch_outcomes(simulated_batch=batch, n_time_steps=n_time_steps)
+            if self.trajectoryStore is not None:
+                self.trajectoryStore.write_paths(first_patient_index=chunk_start, paths=batch.statePaths)
+            del uniforms, batch
 
         # calculate cohort outcomes
         self.cohortOutcomes.calculate_cohort_outcomes(initial_pop_size=self.popSize)
+        if self.trajectoryStore is not None:
+            self.trajectoryStore.close()
+
+
+def get_chunk_size(memory_budget, n_time_steps):
+    """
+    :param memory_budget: (float) megabytes of memory the simulation arrays may use
+    :param n_time_steps: simulation length
+    :return: number of patients to simulate together under the memory budget (a multiple of RNG_BLOCK_SIZE)
+    """
+
+    # uniform random numbers and about 5 arrays of 8 bytes per patient and time-step (state paths, rewards and
+    # temporaries), plus about 24 arrays of 8 bytes per patient (outcomes)
+    bytes_per_patient = 48 * n_time_steps + 8 * 24
+    n_blocks = int(memory_budget * 2 ** 20 / bytes_per_patient) // data.RNG_BLOCK_SIZE
+    return max(n_blocks, 1) * data.RNG_BLOCK_SIZE
+
+
+def get_chunk_uniforms(get_block_rng, chunk_start, n_patients, n_time_steps, antithetic=False):
+    """
+    :param get_block_rng: function that returns the random number generator of a block of patients given its index
+    :param chunk_start: index of the first patient of the chunk (a multiple of RNG_BLOCK_SIZE)
+    :param n_patients: number of patients in the chunk
+    :param n_time_steps: simulation length
+    :param antithetic: set to True if patients 2j and 2j+1 form antithetic pairs (u and 1 - u)
+    :return: (numpy.array) uniform random numbers of shape (n_patients, n_time_steps), the same numbers
+        the patients of these blocks would draw if simulated one at a time
+    """
+
+    uniforms = np.empty((n_patients, n_time_steps))
+    for start in range(0, n_patients, data.RNG_BLOCK_SIZE):
+        end = min(start + data.RNG_BLOCK_SIZE, n_patients)
+        rng = get_block_rng((chunk_start + start) // data.RNG_BLOCK_SIZE)
+        if antithetic:
+            # the first patient of each pair draws the numbers (RNG_BLOCK_SIZE is even, so pairs stay in a block)
+            first = rng.random(((end - start + 1) // 2, n_time_steps))
+            uniforms[start:end:2] = first
+            uniforms[start + 1:end:2] = 1 - first[:(end - start) // 2]
+        else:
+            uniforms[start:end] = rng.random((end - start, n_time_steps))
+
+    return uniforms
+
+
+class StratifiedCohort:
+    """ a cohort of patients from a population made of covariate strata; the patients of each stratum
+    are simulated together as a batch with the parameters of the stratum """
+
+    def __init__(self, id, pop_size, parameters, strata, memory_budget=data.MEMORY_BUDGET):
+        """
+        :param id: cohort id
+        :param pop_size: population size
+        :param parameters: parameter set of the therapy
+        :param strata: (list) of strata of the population (see PopulationClasses.read_population_strata)
+        :param memory_budget: (float) megabytes of memory the simulation of each stratum may use
+        """
+        self.id = id
+        self.popSize = pop_size
+        self.params = parameters
+        self.strata = strata
+        self.memoryBudget = memory_budget
+        self.stratumOutcomes = []                       # outcomes of each stratum
+        self.cohortOutcomes = AggregateCohortOutcomes()  # pooled outcomes of all strata
+
+    def simulate(self, n_time_steps):
+        """ simulate the patients of all strata over the specified number of time-steps """
+
+        sizes = get_stratum_sizes(pop_size=self.popSize, strata=self.strata)
+        for stratum, size in zip(self.strata, sizes):
+            cohort = Cohort(id=self.id, pop_size=size,
+                            parameters=get_stratum_parameters(parameters=self.params, stratum=stratum),
+                            memory_budget=self.memoryBudget, stratum_id=stratum.id)
+            cohort.simulate(n_time_steps=n_time_steps)
+
+            self.stratumOutcomes.append(cohort.cohortOutcomes)
+            self.cohortOutcomes.merge_outcomes(cohort_outcomes=cohort.cohortOutcomes)
+
+        # calculate pooled outcomes
+        self.cohortOutcomes.calculate_cohort_outcomes(initial_pop_size=self.popSize)
 
 
 class CohortOutcomes:
-    def __init__(self):
+    def __init__(self, antithetic=False):
+        self.antithetic = antithetic    # if patients were simulated in antithetic pairs
+        self.nPatients = 0              # number of patients extracted
+        self.survivalPairs = []         # index of the antithetic pair of each survival time
+        self.timeToSEVEREPairs = []     # index of the antithetic pair of each time to SEVERE
         self.survivalTimes = []         # patients' survival times
         self.timeToSEVERE = []          # patients' times to SEVERE state
         self.nLivingPatients = None     # survival curve (sample path of number of alive patients over time)
+        self.stateOccupancy = None      # (n_states, n_time_steps) number of patients in each state at the end
+                                        # of each time-step
         self.costs = []                 # patients' discounted costs
         self.utilities = []             # patients' discounted utilities
         self.statSurvivalTimes = None   # summary statistics for survival time
@@ -137,12 +531,40 @@ class CohortOutcomes:
         # record survival time and time until SEVERE state
         if simulated_patient.stateMonitor.survivalTime is not None:
             self.survivalTimes.append(simulated_patient.stateMonitor.survivalTime)
+            self.survivalPairs.append(self.nPatients // 2)
         if simulated_patient.stateMonitor.timeToSEVERE is not None:
             self.timeToSEVERE.append(simulated_patient.stateMonitor.timeToSEVERE)
+            self.timeToSEVEREPairs.append(self.nPatients // 2)
 
         # discounted cost and utilities
         self.costs.append(simulated_patient.stateMonitor.costUtilityMonitor.totalDiscountedCost)
         self.utilities.append(simulated_patient.stateMonitor.costUtilityMonitor.totalDiscountedUtility)
+        self.nPatients += 1
+
+        # state occupancy (patients who died stay in the death state)
+        if self.stateOccupancy is not None:
+            state_indices = simulated_patient.stateMonitor.stateIndices
+            self.stateOccupancy[state_indices, np.arange(len(state_indices))] += 1
+            self.stateOccupancy[HealthStates.ADJ_DEATH.value, len(state_indices):] += 1
+
+    def extract_batch_outcomes(self, simulated_batch, n_time_steps):
+        """ extracts outcomes of a simulated batch of patients
+        :param simulated_batch: a simulated PatientBatch
+        :param n_time_steps: simulation length """
+
+        pairs = (self.nPatients + np.arange(simulated_batch.nPatients)) // 2
+        died = ~np.isnan(simulated_batch.survivalTimes)
+        reached_severe = ~np.isnan(simulated_batch.timeToSEVERE)
+        self.survivalTimes.extend(simulated_batch.survivalTimes[died].tolist())
+        self.survivalPairs.extend(pairs[died].tolist())
+        self.timeToSEVERE.extend(simulated_batch.timeToSEVERE[reached_severe].tolist())
+        self.timeToSEVEREPairs.extend(pairs[reached_severe].tolist())
+        self.costs.extend(simulated_batch.costs.tolist())
+        self.utilities.extend(simulated_batch.utilities.tolist())
+        self.nPatients += simulated_batch.nPatients
+        if self.stateOccupancy is None:
+            self.stateOccupancy = np.zeros_like(simulated_batch.stateOccupancy)
+        self.stateOccupancy += simulated_batch.stateOccupancy
 
     def calculate_cohort_outcomes(self, initial_pop_size):
         """ calculates the cohort outcomes
@@ -150,10 +572,25 @@ class CohortOutcomes:
         """
 
         # summary statistics
-        self.statSurvivalTimes = stats.SummaryStat(name="Survival Time", data=self.survivalTimes)
-        self.statTimeToSEVERE = stats.SummaryStat(name="Time To Severe State", data=self.timeToSEVERE)
-        self.statCost = stats.SummaryStat(name="Discounted Cost", data=self.costs)
-        self.statUtilities = stats.SummaryStat(name="Discounted Utilities", data=self.utilities)
+        if self.antithetic:
+            # confidence intervals are based on antithetic pairs
+            n_pairs = (self.nPatients + 1) // 2
+            all_pairs = np.arange(self.nPatients) // 2
+            self.statSurvivalTimes = AntitheticStat(name="Survival Time")
+            self.statSurvivalTimes.record_pairs(
+                obs=np.array(self.survivalTimes), pairs=np.array(self.survivalPairs, dtype=int), n_pairs=n_pairs)
+            self.statTimeToSEVERE = AntitheticStat(name="Time To Severe State")
+            self.statTimeToSEVERE.record_pairs(
+                obs=np.array(self.timeToSEVERE), pairs=np.array(self.timeToSEVEREPairs, dtype=int), n_pairs=n_pairs)
+            self.statCost = AntitheticStat(name="Discounted Cost")
+            self.statCost.record_pairs(obs=np.array(self.costs), pairs=all_pairs, n_pairs=n_pairs)
+            self.statUtilities = AntitheticStat(name="Discounted Utilities")
+            self.statUtilities.record_pairs(obs=np.array(self.utilities), pairs=all_pairs, n_pairs=n_pairs)
+        else:
+            self.statSurvivalTimes = LazySummaryStat(name="Survival Time", data=self.survivalTimes)
+            self.statTimeToSEVERE = LazySummaryStat(name="Time To Severe State", data=self.timeToSEVERE)
+            self.statCost = LazySummaryStat(name="Discounted Cost", data=self.costs)
+            self.statUtilities = LazySummaryStat(name="Discounted Utilities", data=self.utilities)
 
 
         # survival curve
@@ -164,34 +601,360 @@ class CohortOutcomes:
             increments=[-1]*len(self.survivalTimes)
         )
 
+    def get_deaths_per_step(self, n_time_steps):
+        """
+        :param n_time_steps: simulation length
+        :return: (numpy.array) number of deaths at each time-step
+        """
+        # survival times are k + 0.5 where k is the time-step of death
+        return np.bincount(np.array(self.survivalTimes, dtype=int), minlength=n_time_steps)
+
     def print_costs(self):
         print("Costs for each patient in this cohort:")
         for i, cost in enumerate(self.costs):
             print(f"Patient {i + 1}: ${cost:.2f}")
 
+
+def get_survival_curve(initial_pop_size, n_deaths):
+    """
+    :param initial_pop_size: initial population size
+    :param n_deaths: (numpy.array) number of deaths at each time-step
+    :return: survival curve (sample path of number of alive patients over time)
+    """
+
+    steps = np.flatnonzero(n_deaths)
+    return PrevalencePathBatchUpdate(
+        name='# of living patients',
+        initial_size=initial_pop_size,
+        times_of_changes=(steps + 0.5).tolist(),
+        increments=(-np.asarray(n_deaths)[steps]).tolist()
+    )
+
+
+def get_saved_survival_curve(record):
+    """
+    :param record: (dict) outcomes of a cohort saved in a checkpoint (see Checkpoints.get_cohort_record)
+    :return: survival curve of the cohort, built as when the cohort was simulated (from patient survival
+        times if they were kept, otherwise from the number of deaths at each time-step)
+    """
+
+    pop_size = int(record['pop_size'])
+    survival_times = record['survival_times'].tolist()
+    if len(survival_times) == 0:
+        return get_survival_curve(initial_pop_size=pop_size, n_deaths=record['n_deaths'])
+    return PrevalencePathBatchUpdate(
+        name='# of living patients',
+        initial_size=pop_size,
+        times_of_changes=survival_times,
+        increments=[-1]*len(survival_times)
+    )
+
+
+def get_state_prevalence(state_occupancies, pop_sizes, alpha=data.ALPHA):
+    """
+    :param state_occupancies: (list) state occupancy (n_states, n_time_steps) of each simulated cohort
+    :param pop_sizes: (list) population size of each cohort
+    :param alpha: significance level of the uncertainty band
+    :return: (mean, lower, upper) arrays of shape (n_states, n_time_steps) with the proportion of patients in each
+        state at the end of each time-step averaged across cohorts, and the 100(1-alpha)% percentile band
+        across cohorts
+    """
+
+    prevalence = np.asarray(state_occupancies, dtype=float) / np.reshape(pop_sizes, (-1, 1, 1))
+    lower, upper = np.percentile(prevalence, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return prevalence.mean(axis=0), lower, upper
+
+
+class LazySummaryStat(stats.SummaryStat):
+    """ summary statistics of observations kept as a numpy array; moments and order statistics are calculated
+    on first use and intervals are memoized per significance level (the observations should not change
+    after the statistics are created) """
+
+    def __init__(self, data, name=None):
+        """
+        :param data: a list or numpy.array of observations
+        :param name: name of the statistics
+        """
+        stats._Statistics.__init__(self, name)
+        self._data = np.asarray(data, dtype=float)
+        self._n = len(self._data)
+        self._mean = None       # moments (calculated on first use)
+        self._stDev = None
+        self._total = None
+        self._sorted = None     # sorted observations (calculated on first use)
+        self._intervals = {}    # memoized intervals by (type, alpha)
+
+    def get_total(self):
+        if self._total is None:
+            self._total = float(np.sum(self._data))
+        return self._total
+
+    def get_mean(self):
+        if self._mean is None:
+            self._mean = self.get_total() / self._n if self._n > 0 else np.nan
+        return self._mean
+
+    def get_stdev(self):
+        if self._stDev is None:
+            self._stDev = float(np.std(self._data, ddof=1)) if self._n > 1 else np.nan
+        return self._stDev
+
+    def get_sorted(self):
+        """ :return: (numpy.array) sorted observations """
+        if self._sorted is None:
+            self._sorted = np.sort(self._data)
+        return self._sorted
+
+    def get_min(self):
+        return self.get_sorted()[0]
+
+    def get_max(self):
+        return self.get_sorted()[-1]
+
+    def get_percentile(self, q):
+        """
+        :param q: percentile (or array of percentiles) to compute (q in range [0, 100])
+        :returns: qth percentile (with linear interpolation as numpy.percentile) """
+
+        sorted_data = self.get_sorted()
+        position = np.asarray(q, dtype=float) / 100 * (self._n - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, self._n - 1)
+        return sorted_data[lower] + (position - lower) * (sorted_data[upper] - sorted_data[lower])
+
+    def _get_memoized(self, key, calculate):
+        """ :return: the memoized interval of this key (calculated with the function calculate if needed) """
+        if key not in self._intervals:
+            self._intervals[key] = calculate()
+        return list(self._intervals[key])
+
+    def get_t_half_length(self, alpha):
+        return self._get_memoized(('t half-length', alpha),
+                                  lambda: [stats.SummaryStat.get_t_half_length(self, alpha)])[0]
+
+    def get_t_CI(self, alpha):
+        return self._get_memoized(('t CI', alpha), lambda: stats.SummaryStat.get_t_CI(self, alpha))
+
+    def get_PI(self, alpha=0.05):
+        return self._get_memoized(('PI', alpha),
+                                  lambda: self.get_percentile([100 * alpha / 2, 100 * (1 - alpha / 2)]).tolist())
+
+    def get_bootstrap_CI(self, alpha, num_samples=None):
+        return self._get_memoized(('bootstrap CI', alpha, num_samples),
+                                  lambda: stats.SummaryStat.get_bootstrap_CI(self, alpha, num_samples))
+
+
+class StreamingStat(stats.DiscreteTimeStat):
+    """ summary statistics updated with batches of observations without keeping the observations
+    (mean and variance are merged with Chan's parallel algorithm to avoid round-off) """
+
+    def __init__(self, name=None):
+        stats.DiscreteTimeStat.__init__(self, name)
+        self._sumSqDev = 0  # sum of squared deviations from the mean
+
+    def record_batch(self, obs):
+        """ :param obs: (numpy.array) a batch of observations """
+
+        n = len(obs)
+        if n == 0:
+            return
+        mean = float(np.mean(obs))
+        delta = mean - self._mean
+        total_n = self._n + n
+        self._sumSqDev += float(np.sum((obs - mean) ** 2)) + delta ** 2 * self._n * n / total_n
+        self._mean += delta * n / total_n
+        self._n = total_n
+        self._total += float(np.sum(obs))
+        self._max = max(self._max, float(np.max(obs)))
+        self._min = min(self._min, float(np.min(obs)))
+
+    def record(self, obs):
+        self.record_batch(np.array([obs]))
+
+    def merge(self, other):
+        """ :param other: statistics of another set of observations to add to these statistics """
+
+        if other._n == 0:
+            return
+        delta = other._mean - self._mean
+        total_n = self._n + other._n
+        self._sumSqDev += other._sumSqDev + delta ** 2 * self._n * other._n / total_n
+        self._mean += delta * other._n / total_n
+        self._n = total_n
+        self._total += other._total
+        self._max = max(self._max, other._max)
+        self._min = min(self._min, other._min)
+
+    def get_mean(self):
+        return self._mean
+
+    def get_stdev(self):
+        if self._n > 1:
+            return np.sqrt(self._sumSqDev / (self._n - 1))
+        else:
+            return 0
+
+
+class AntitheticStat(StreamingStat):
+    """ statistics of observations from antithetic pairs of patients; the estimate is the usual sample mean but
+    confidence intervals are based on pairs (ratio estimator over pair sums, since a pair may contribute 0, 1,
+    or 2 observations), which accounts for the negative correlation within pairs """
+
+    def __init__(self, name=None):
+        StreamingStat.__init__(self, name)
+        self._nPairs = 0
+        # sums over pairs of x, c, x^2, c^2, and x*c where x is the sum and c the number of observations of a pair
+        self._pairSums = np.zeros(5)
+
+    def record_pairs(self, obs, pairs, n_pairs):
+        """
+        :param obs: (numpy.array) observations
+        :param pairs: (numpy.array) index (0, 1, ..., n_pairs-1) of the pair each observation comes from
+        :param n_pairs: number of pairs the observations come from (including pairs without observations)
+        """
+
+        self.record_batch(obs)
+        x = np.bincount(pairs, weights=obs, minlength=n_pairs)
+        c = np.bincount(pairs, minlength=n_pairs)
+        self._pairSums += [x.sum(), c.sum(), np.sum(x * x), np.sum(c * c), np.sum(x * c)]
+        self._nPairs += n_pairs
+
+    def merge(self, other):
+        StreamingStat.merge(self, other)
+        self._pairSums += other._pairSums
+        self._nPairs += other._nPairs
+
+    def get_t_half_length(self, alpha):
+        """
+        :param alpha: significance level (between 0 and 1)
+        :returns half-length of 100(1-alpha)% t-confidence interval based on antithetic pairs """
+
+        sum_x, sum_c, sum_xx, sum_cc, sum_xc = self._pairSums
+        if self._nPairs < 2 or sum_c == 0:
+            return np.nan
+        ratio = sum_x / sum_c
+        # variance of the pair residuals x - ratio * c (which sum to 0)
+        var_residual = max(sum_xx - 2 * ratio * sum_xc + ratio ** 2 * sum_cc, 0) / (self._nPairs - 1)
+        st_error = np.sqrt(var_residual * self._nPairs) / sum_c
+        return scipy_stats.t.ppf(1 - alpha / 2, self._nPairs - 1) * st_error
+
+
+class AggregateCohortOutcomes:
+    """ cohort outcomes accumulated from batches of simulated patients in constant memory """
+
+    def __init__(self, antithetic=False):
+        self.antithetic = antithetic    # if patients were simulated in antithetic pairs
+        self.survivalTimes = []         # patient-level observations are not kept
+        self.timeToSEVERE = []
+        self.costs = []
+        self.utilities = []
+        self.nDeaths = None             # number of deaths at each time-step
+        self.nLivingPatients = None     # survival curve (sample path of number of alive patients over time)
+        self.stateOccupancy = None      # (n_states, n_time_steps) number of patients in each state at the end
+                                        # of each time-step
+        stat_class = AntitheticStat if antithetic else StreamingStat
+        self.statSurvivalTimes = stat_class(name="Survival Time")
+        self.statTimeToSEVERE = stat_class(name="Time To Severe State")
+        self.statCost = stat_class(name="Discounted Cost")
+        self.statUtilities = stat_class(name="Discounted Utilities")
+
+    def extract_batch_outcomes(self, simulated_batch, n_time_steps):
+        """ adds the outcomes of a simulated batch of patients
+        :param simulated_batch: a simulated PatientBatch (its first patient starts an antithetic pair)
+        :param n_time_steps: simulation length """
+
+        died = ~np.isnan(simulated_batch.survivalTimes)
+        reached_severe = ~np.isnan(simulated_batch.timeToSEVERE)
+        survival_times = simulated_batch.survivalTimes[died]
+        if self.antithetic:
+            pairs = np.arange(simulated_batch.nPatients) // 2
+            n_pairs = (simulated_batch.nPatients + 1) // 2
+            self.statSurvivalTimes.record_pairs(obs=survival_times, pairs=pairs[died], n_pairs=n_pairs)
+            self.statTimeToSEVERE.record_pairs(obs=simulated_batch.timeToSEVERE[reached_severe],
+                                               pairs=pairs[reached_severe], n_pairs=n_pairs)
+            self.statCost.record_pairs(obs=simulated_batch.costs, pairs=pairs, n_pairs=n_pairs)
+            self.statUtilities.record_pairs(obs=simulated_batch.utilities, pairs=pairs, n_pairs=n_pairs)
+        else:
+            self.statSurvivalTimes.record_batch(survival_times)
+            self.statTimeToSEVERE.record_batch(simulated_batch.timeToSEVERE[reached_severe])
+            self.statCost.record_batch(simulated_batch.costs)
+            self.statUtilities.record_batch(simulated_batch.utilities)
+
+        # deaths at each time-step (survival times are k + 0.5)
+        self.nDeaths += np.bincount(survival_times.astype(int), minlength=n_time_steps)
+        self.stateOccupancy += simulated_batch.stateOccupancy
+
+    def calculate_cohort_outcomes(self, initial_pop_size):
+        """ calculates the cohort outcomes
+        :param initial_pop_size: initial population size
+        """
+
+        # survival curve from the number of deaths at each time-step
+        self.nLivingPatients = get_survival_curve(initial_pop_size=initial_pop_size, n_deaths=self.nDeaths)
+
+    def merge_outcomes(self, cohort_outcomes):
+        """ adds the aggregate outcomes of another simulated cohort (e.g. a stratum of the population)
+        :param cohort_outcomes: aggregate outcomes of a simulated cohort """
+
+        self.statSurvivalTimes.merge(cohort_outcomes.statSurvivalTimes)
+        self.statTimeToSEVERE.merge(cohort_outcomes.statTimeToSEVERE)
+        self.statCost.merge(cohort_outcomes.statCost)
+        self.statUtilities.merge(cohort_outcomes.statUtilities)
+        if self.nDeaths is None:
+            self.nDeaths = np.zeros_like(cohort_outcomes.nDeaths)
+            self.stateOccupancy = np.zeros_like(cohort_outcomes.stateOccupancy)
+        self.nDeaths += cohort_outcomes.nDeaths
+        self.stateOccupancy += cohort_outcomes.stateOccupancy
+
+    def get_deaths_per_step(self, n_time_steps):
+        """
+        :param n_time_steps: simulation length
+        :return: (numpy.array) number of deaths at each time-step
+        """
+        return self.nDeaths
+
+
 class MultiCohort:
     """ simulates multiple cohorts with different parameters """
 
-    def __init__(self, ids, pop_sizes, parameters):
+    def __init__(self, ids, pop_sizes, parameters, memory_budget=None, antithetic=False, checkpoint_dir=None):
         self.ids = ids
         self.popSizes = pop_sizes
         self.params = parameters
+        self.memoryBudget = memory_budget   # megabytes available to simulate each cohort (None: no cap)
+        self.antithetic = antithetic        # if patients are simulated in antithetic pairs
+        self.checkpointDir = checkpoint_dir     # directory to save the outcomes of completed cohorts (None: not saved)
         self.multiCohortOutcomes = MultiCohortOutcomes(parameters=parameters)
 
     def simulate(self, n_time_steps):
-        """ simulates all cohorts """
+        """ simulates all cohorts (cohorts already saved in the checkpoint directory are loaded instead) """
+
+        checkpoints = None
+        if self.checkpointDir is not None:
+            checkpoints = CheckpointDirectory(
+                path=self.checkpointDir,
+                settings={'ids': self.ids, 'popSizes': self.popSizes, 'nTimeSteps': n_time_steps,
+                          'antithetic': self.antithetic, 'parameters': get_parameter_settings(self.params)})
 
         for i in range(len(self.ids)):
 
+            if checkpoints is not None and checkpoints.get_if_completed(i):
+                self.multiCohortOutcomes.restore_outcomes(record=checkpoints.load(i))
+                continue
+
             # create a cohort
             cohort = Cohort(id=self.ids[i], pop_size=self.popSizes[i],
-                            parameters=self.params)
+                            parameters=self.params, memory_budget=self.memoryBudget,
+                            antithetic=self.antithetic)
 
             # simulate the cohort
             cohort.simulate(n_time_steps=n_time_steps)
 
             # outcomes from simulating all cohorts
             self.multiCohortOutcomes.extract_outcomes(simulated_cohort=cohort)
+            if checkpoints is not None:
+                checkpoints.save(index=i, record=get_cohort_record(simulated_cohort=cohort,
+                                                                   n_time_steps=n_time_steps))
 
         # calculate the summary statistics of from all cohorts
         self.multiCohortOutcomes.calculate_summary_stats()
@@ -207,7 +970,11 @@ class MultiCohortOutcomes:
         self.timeToSEVERE = []  # two-dimensional list of patients time to SEVERE state
         self.meanTimeToSEVERE = [] # list of average time to severe state for all simulated cohorts
         self.statMeanTimeToSEVERE = None # summary statistics for mean time to SEVERE
+        self.stateOccupancies = []  # state occupancy (n_states, n_time_steps) of each simulated cohort
+        self.popSizes = []          # population size of each simulated cohort
         self.params = parameters
+        self._cohortStats = {}      # statistics of survival time and time to SEVERE by cohort (built on first use)
+
     def extract_outcomes(self, simulated_cohort):
         """ extracts outcomes of a simulated cohort """
 
@@ -220,43 +987,69 @@ class MultiCohortOutcomes:
         # store time to SEVERE state from cohort
         self.timeToSEVERE.append(simulated_cohort.cohortOutcomes.timeToSEVERE)
 
+        # store average survival time and average time to severe state of this cohort
+        # (also available when only aggregate outcomes of the cohort are kept)
+        self.meanSurvivalTimes.append(simulated_cohort.cohortOutcomes.statSurvivalTimes.get_mean())
+        self.meanTimeToSEVERE.append(simulated_cohort.cohortOutcomes.statTimeToSEVERE.get_mean())
+
+        # store the state occupancy of this cohort
+        self.stateOccupancies.append(simulated_cohort.cohortOutcomes.stateOccupancy)
+        self.popSizes.append(simulated_cohort.popSize)
+
+    def restore_outcomes(self, record):
+        """ adds the outcomes of a cohort saved in a checkpoint
+        :param record: (dict) saved outcomes of the cohort (see Checkpoints.get_cohort_record) """
+
+        self.survivalTimes.append(record['survival_times'].tolist())
+        self.survivalCurves.append(get_saved_survival_curve(record=record))
+        self.timeToSEVERE.append(record['time_to_severe'].tolist())
+        self.meanSurvivalTimes.append(record['mean_survival_time'].item())
+        self.meanTimeToSEVERE.append(record['mean_time_to_severe'].item())
+        self.stateOccupancies.append(record['state_occupancy'])
+        self.popSizes.append(int(record['pop_size']))
+
     def calculate_summary_stats(self):
         """
         calculate the summary statistics
         """
 
-        # calculate average patient survival time and average time to severe state for all simulated cohorts
-        for obs_set in self.survivalTimes:
-            self.meanSurvivalTimes.append(sum(obs_set)/len(obs_set))
+        # summary statistics of mean survival time and mean time to severe state
+        self.statMeanSurvivalTime = LazySummaryStat(name='Mean survival time',
+                                                    data=self.meanSurvivalTimes)
+        self.statMeanTimeToSEVERE = LazySummaryStat(name='Time to SEVERE',
+                                                    data=self.meanTimeToSEVERE)
 
-        for obs_set in self.timeToSEVERE:
-            self.meanTimeToSEVERE.append(sum(obs_set)/len(obs_set))
+    def get_state_prevalence(self, alpha=data.ALPHA):
+        """
+        :param alpha: significance level of the uncertainty band
+        :return: (mean, lower, upper) proportion of patients in each state at the end of each time-step
+            (see get_state_prevalence)
+        """
+        return get_state_prevalence(state_occupancies=self.stateOccupancies, pop_sizes=self.popSizes, alpha=alpha)
 
-        # summary statistics of mean survival time and mean time to severe state
-        self.statMeanSurvivalTime = stats.SummaryStat(name='Mean survival time',
-                                                      data=self.meanSurvivalTimes)
-        self.statMeanTimeToSEVERE = stats.SummaryStat(name='Time to SEVERE',
-                                                      data=self.meanTimeToSEVERE)
+    def get_cohort_stats(self, cohort_index):
+        """
+        :param cohort_index: index of a simulated cohort
+        :return: (statistics of survival time, statistics of time to SEVERE state) of this cohort
+        """
+
+        if cohort_index not in self._cohortStats:
+            self._cohortStats[cohort_index] = (
+                LazySummaryStat(name='Summary statistics', data=self.survivalTimes[cohort_index]),
+                LazySummaryStat(name='Time to SEVERE state', data=self.timeToSEVERE[cohort_index]))
+        return self._cohortStats[cohort_index]
 
     def get_cohort_CI_mean_survival(self, cohort_index, alpha):
         """
         Returns the confidence intervals for both mean survival time and time to SEVERE state for a specified cohort.
         """
 
-        # Calculate CI for mean survival time of the cohort
-        stat_survival = stats.SummaryStat(name='Summary statistics',
-                                          data=self.survivalTimes[cohort_index])
-        survival_ci = stat_survival.get_t_CI(alpha=alpha)
-
-        # Calculate CI for time to SEVERE state of the cohort
-        stat_time_severe = stats.SummaryStat(name='Time to SEVERE state',
-                                             data=self.timeToSEVERE[cohort_index])
-        severe_ci = stat_time_severe.get_t_CI(alpha=alpha)
+        stat_survival, stat_time_severe = self.get_cohort_stats(cohort_index)
 
         # Return a dictionary containing both confidence intervals
         return {
-            'survival_ci': survival_ci,
-            'severe_ci': severe_ci
+            'survival_ci': stat_survival.get_t_CI(alpha=alpha),
+            'severe_ci': stat_time_severe.get_t_CI(alpha=alpha)
         }
 
     def get_cohort_PI_survival(self, cohort_index, alpha):
@@ -264,18 +1057,10 @@ class MultiCohortOutcomes:
         Returns the prediction intervals for both survival time and time to SEVERE state for a specified cohort.
         """
 
-        # Calculate PI for survival time of the cohort
-        stat_survival = stats.SummaryStat(name='Summary statistics',
-                                          data=self.survivalTimes[cohort_index])
-        survival_pi = stat_survival.get_PI(alpha=alpha)
-
-        # Calculate PI for time to SEVERE state of the cohort
-        stat_time_severe = stats.SummaryStat(name='Time to SEVERE state',
-                                             data=self.timeToSEVERE[cohort_index])
-        severe_pi = stat_time_severe.get_PI(alpha=alpha)
+        stat_survival, stat_time_severe = self.get_cohort_stats(cohort_index)
 
         # Return a dictionary containing both prediction intervals
         return {
-            'survival_pi': survival_pi,
-            'severe_pi': severe_pi
-        }
\ No newline at end of file
+            'survival_pi': stat_survival.get_PI(alpha=alpha),
+            'severe_pi': stat_time_severe.get_PI(alpha=alpha)
+        }
@@ -1,44 +1,323 @@
-import deampy.statistics as stat
-from MarkovClasses import Cohort
-from SensitivityParamClasses import ParameterGenerator
+import bisect
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import InputData as data
+from Checkpoints import CheckpointDirectory, get_cohort_record
+from MarkovClasses import Cohort, LazySummaryStat, get_saved_survival_curve, get_state_prevalence, \
+    get_survival_curve
+from SensitivityParamClasses import PSA_INPUTS, ParameterGenerator
+
+_worker = {}    # state of a worker process (parameter generator and shared outcome arrays)
 
 
 class MultiCohort:
     """ simulates multiple cohorts with different parameters """
 
-    def __init__(self, ids, pop_sizes, parameters):
+    def __init__(self, ids, pop_sizes, parameters, checkpoint_dir=None):
         """
         :param ids: (list) of ids for cohorts to simulate
         :param pop_sizes: (list) of population sizes of cohorts to simulate
         :param parameters: (list) of key parameter values and therapy to be applied to the cohorts
+        :param checkpoint_dir: directory to save the outcomes of each completed draw in, and to resume an
+            interrupted simulation from (None: outcomes are not saved)
         """
         self.ids = ids
         self.popSizes = pop_sizes
         self.params = parameters
+        self.checkpointDir = checkpoint_dir
         self.multiCohortOutcomes = MultiCohortOutcomes(parameters=parameters)
         self.paramSets = []  # list of parameter sets each of which corresponds to a cohort
         self.paramGenerator = ParameterGenerator(therapy=self.params)
+        self._checkpoints = None     # checkpoint directory (opened when the simulation starts)
+
+    def simulate(self, n_time_steps, n_processes=1):
+        """ simulates all cohorts
+        :param n_time_steps: simulation length
+        :param n_processes: number of processes to simulate the cohorts in parallel
+        """
+
+        self.open_checkpoints(n_time_steps=n_time_steps)
+        if n_processes > 1:
+            self._simulate_in_parallel(n_time_steps=n_time_steps, n_processes=n_processes)
+            return
+
+        for i in range(len(self.ids)):
+            self.simulate_draw(draw=i, n_time_steps=n_time_steps)
+
+        # calculate the summary statistics of from all cohorts
+        self.multiCohortOutcomes.calculate_summary_stats()
+
+    def simulate_draw(self, draw, n_time_steps):
+        """ simulates the cohort of a PSA draw and stores its outcomes
+        :param draw: index of the PSA draw
+        :param n_time_steps: simulation length
+        """
+
+        # for each cohort, sample a new distribution
+        # get a new set of parameter values
+        param_set = self.paramGenerator.get_new_parameters(seed=draw)
+        self.paramSets.append(param_set)
+
+        # load the outcomes of a draw completed before the simulation was interrupted
+        checkpoints = self.open_checkpoints(n_time_steps=n_time_steps)
+        if checkpoints is not None and checkpoints.get_if_completed(draw):
+            self.multiCohortOutcomes.restore_outcomes(record=checkpoints.load(draw))
+            return
+
+        # create a cohort
+        cohort = Cohort(id=self.ids[draw],
+                        pop_size=self.popSizes,
+                        parameters=param_set)
+        # simulate the cohort
+        cohort.simulate(n_time_steps=n_time_steps)
+
+        # outcomes from simulating all cohorts
+        self.multiCohortOutcomes.extract_outcomes(simulated_cohort=cohort)
+        if checkpoints is not None:
+            checkpoints.save(index=draw, record=get_cohort_record(simulated_cohort=cohort, n_time_steps=n_time_steps))
+
+    def open_checkpoints(self, n_time_steps):
+        """
+        :param n_time_steps: simulation length
+        :return: the checkpoint directory of this simulation (None if outcomes are not saved); its settings
+            include the InputData values the parameter sets are sampled from, so saved draws of other inputs
+            are not reused
+        """
+
+        if self.checkpointDir is not None and self._checkpoints is None:
+            self._checkpoints = CheckpointDirectory(
+                path=self.checkpointDir,
+                settings={'ids': self.ids, 'popSizes': self.popSizes, 'nTimeSteps': n_time_steps,
+                          'therapy': self.params, 'inputs': {name: getattr(data, name) for name in PSA_INPUTS}})
+        return self._checkpoints
+
+    def simulate_until_converged(self, n_time_steps, comparator, monitor):
+        """ simulates the draws of this therapy and of the comparator one by one (draw i of both uses the same
+        parameter values) until the monitor finds that the incremental outcomes have converged or all ids
+        are simulated
+        :param n_time_steps: simulation length
+        :param comparator: a MultiCohort of the comparator therapy (with at least as many ids as this one)
+        :param monitor: a PSAConvergenceMonitor
+        """
 
-    def simulate(self, n_time_steps):
-        """ simulates all cohorts """
         for i in range(len(self.ids)):
-            # for each cohort, sample a new distribution
-            # get a new set of parameter values
-            param_set = self.paramGenerator.get_new_parameters(seed=i)
-            # create a cohort
-            cohort = Cohort(id=self.ids[i],
-                            pop_size=self.popSizes,
-                            parameters=param_set)
-            # simulate the cohort
-            cohort.simulate(n_time_steps=n_time_steps)
-
-            # outcomes from simulating all cohorts
-            self.multiCohortOutcomes.extract_outcomes(simulated_cohort=cohort)
+            self.simulate_draw(draw=i, n_time_steps=n_time_steps)
+            comparator.simulate_draw(draw=i, n_time_steps=n_time_steps)
+            monitor.record(
+                incremental_cost=self.multiCohortOutcomes.meanCosts[i] - comparator.multiCohortOutcomes.meanCosts[i],
+                incremental_qaly=self.multiCohortOutcomes.meanQALYs[i] - comparator.multiCohortOutcomes.meanQALYs[i])
+            if monitor.get_if_converged():
+                break
+
+        # calculate the summary statistics of from all simulated cohorts
+        self.multiCohortOutcomes.calculate_summary_stats()
+        comparator.multiCohortOutcomes.calculate_summary_stats()
+
+    def _simulate_in_parallel(self, n_time_steps, n_processes):
+        """ simulates the cohorts in worker processes which write the outcomes of each draw
+        directly into shared-memory arrays """
+
+        n_draws = len(self.ids)
+        # parameter sets of the draws (workers sample the same values from the streams of these draws)
+        self.paramSets = [self.paramGenerator.get_new_parameters(seed=i) for i in range(n_draws)]
+        shared_outcomes = SharedOutcomeArrays(n_draws=n_draws, n_time_steps=n_time_steps)
+
+        # split draws into tasks (a few per process to balance the load)
+        n_tasks = min(n_draws, 4 * n_processes)
+        tasks = [(draws, [self.ids[i] for i in draws], self.popSizes, n_time_steps)
+                 for draws in np.array_split(np.arange(n_draws), n_tasks)]
+
+        with mp.Pool(processes=n_processes,
+                     initializer=_init_worker,
+                     initargs=(self.params, shared_outcomes.get_names(), n_draws, n_time_steps,
+                               self.checkpointDir)) as pool:
+            for _ in pool.imap_unordered(_simulate_draws, tasks):
+                pass
+
+        # the parent keeps its mapping of the buffers; their names are no longer needed
+        shared_outcomes.unlink()
+        self.multiCohortOutcomes.wrap_shared_outcomes(shared_outcomes=shared_outcomes,
+                                                      pop_size=self.popSizes)
 
         # calculate the summary statistics of from all cohorts
         self.multiCohortOutcomes.calculate_summary_stats()
 
 
+class PSAConvergenceMonitor:
+    """ tracks the running mean and percentile interval of incremental cost, QALY, and net monetary benefit
+    as PSA draws complete, and detects when they have stabilized """
+
+    OUTCOMES = ['Incremental cost', 'Incremental QALY', 'Incremental NMB']
+
+    def __init__(self, wtp=data.WTP, alpha=data.ALPHA, tolerance=0.01, window=50, min_draws=100):
+        """
+        :param wtp: willingness-to-pay per QALY to calculate the net monetary benefit
+        :param alpha: significance level of the percentile intervals
+        :param tolerance: largest change of the running statistics over the window, relative to the width
+            of the current percentile interval of each outcome, for the outcomes to be considered converged
+        :param window: number of most recent draws over which the statistics should stay within the tolerance
+        :param min_draws: number of draws before convergence is checked
+        """
+        self.wtp = wtp
+        self.alpha = alpha
+        self.tolerance = tolerance
+        self.window = window
+        self.minDraws = min_draws
+        self.observations = {name: [] for name in self.OUTCOMES}
+        # observations of each outcome in increasing order and their sum (so that the running statistics of a
+        # draw take constant time instead of a pass over all draws)
+        self._sorted = {name: [] for name in self.OUTCOMES}
+        self._sums = {name: 0.0 for name in self.OUTCOMES}
+        # running (mean, lower, upper) of each outcome after each draw
+        self.trace = {name: [] for name in self.OUTCOMES}
+        self.nDrawsToConverge = None    # number of draws at which convergence was detected
+
+    def record(self, incremental_cost, incremental_qaly):
+        """ records the incremental outcomes of a PSA draw and updates the running statistics
+        :param incremental_cost: incremental mean cost of the draw
+        :param incremental_qaly: incremental mean QALY of the draw
+        """
+
+        values = [incremental_cost, incremental_qaly, self.wtp * incremental_qaly - incremental_cost]
+        for name, value in zip(self.OUTCOMES, values):
+            self.observations[name].append(value)
+            bisect.insort(self._sorted[name], value)
+            self._sums[name] += value
+            n = len(self._sorted[name])
+            self.trace[name].append((self._sums[name] / n, self._get_percentile(name, self.alpha / 2),
+                                     self._get_percentile(name, 1 - self.alpha / 2)))
+
+    def _get_percentile(self, name, q):
+        """ :return: q-quantile of the observations of an outcome (linear interpolation, as numpy.percentile) """
+
+        obs = self._sorted[name]
+        if len(obs) == 1:
+            return obs[0]
+        position = (len(obs) - 1) * q
+        i = min(int(position), len(obs) - 2)
+        return obs[i] + (position - i) * (obs[i + 1] - obs[i])
+
+    def get_n_draws(self):
+        """ :return: number of draws recorded """
+        return len(self.observations[self.OUTCOMES[0]])
+
+    def get_if_converged(self):
+        """ :return: True if over the last window draws no running statistic (mean or bounds of the percentile
+            interval) of any outcome moved by more than the tolerance times the width of its interval """
+
+        n = self.get_n_draws()
+        if n < max(self.minDraws, self.window + 1):
+            return False
+
+        for name in self.OUTCOMES:
+            trace = np.array(self.trace[name][-self.window - 1:])
+            width = trace[-1, 2] - trace[-1, 1]
+            if width <= 0 or np.max(np.abs(trace - trace[-1])) > self.tolerance * width:
+                return False
+
+        self.nDrawsToConverge = n
+        return True
+
+
+class SharedOutcomeArrays:
+    """ outcome vectors of all PSA draws in shared memory, indexed by draw """
+
+    FIELDS = ['meanSurvivalTimes', 'meanTimeToSEVERE', 'meanCosts', 'meanQALYs']
+
+    def __init__(self, n_draws, n_time_steps, names=None):
+        """
+        :param n_draws: number of PSA draws
+        :param n_time_steps: simulation length
+        :param names: (dict) names of existing shared memory blocks to attach to (None to create them)
+        """
+
+        shapes = {field: ((n_draws, ), np.float64) for field in self.FIELDS}
+        shapes['nDeaths'] = ((n_draws, n_time_steps), np.int64)   # survival curve counts
+        shapes['stateOccupancy'] = ((n_draws, len(data.HealthStates), n_time_steps), np.int64)
+
+        self._blocks = {}
+        for field, (shape, dtype) in shapes.items():
+            if names is None:
+                size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                self._blocks[field] = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                self._blocks[field] = shared_memory.SharedMemory(name=names[field])
+            setattr(self, field, np.ndarray(shape, dtype=dtype, buffer=self._blocks[field].buf))
+
+    def get_names(self):
+        """ :return: (dict) names of the shared memory blocks """
+        return {field: block.name for field, block in self._blocks.items()}
+
+    def write(self, draw, simulated_cohort, n_time_steps):
+        """ writes the outcomes of a simulated cohort
+        :param draw: index of the PSA draw
+        :param simulated_cohort: a cohort after being simulated
+        :param n_time_steps: simulation length
+        """
+
+        outcomes = simulated_cohort.cohortOutcomes
+        self.meanSurvivalTimes[draw] = outcomes.statSurvivalTimes.get_mean()
+        self.meanTimeToSEVERE[draw] = outcomes.statTimeToSEVERE.get_mean()
+        self.meanCosts[draw] = outcomes.statCost.get_mean()
+        self.meanQALYs[draw] = outcomes.statUtilities.get_mean()
+        self.nDeaths[draw] = outcomes.get_deaths_per_step(n_time_steps=n_time_steps)
+        self.stateOccupancy[draw] = outcomes.stateOccupancy
+
+    def write_record(self, draw, record):
+        """ writes the outcomes of a draw saved in a checkpoint
+        :param draw: index of the PSA draw
+        :param record: (dict) saved outcomes of the draw (see Checkpoints.get_cohort_record)
+        """
+
+        self.meanSurvivalTimes[draw] = record['mean_survival_time']
+        self.meanTimeToSEVERE[draw] = record['mean_time_to_severe']
+        self.meanCosts[draw] = record['mean_cost']
+        self.meanQALYs[draw] = record['mean_qaly']
+        self.nDeaths[draw] = record['n_deaths']
+        self.stateOccupancy[draw] = record['state_occupancy']
+
+    def close(self):
+        """ closes this process's access to the shared memory blocks """
+        for block in self._blocks.values():
+            block.close()
+
+    def unlink(self):
+        """ removes the names of the shared memory blocks (the memory is freed once all processes close it) """
+        for block in self._blocks.values():
+            block.unlink()
+
+
+def _init_worker(therapy, shared_names, n_draws, n_time_steps, checkpoint_dir):
+    """ attaches a worker process to the shared outcome arrays (and to the checkpoint directory) """
+
+    _worker['paramGenerator'] = ParameterGenerator(therapy=therapy)
+    _worker['sharedOutcomes'] = SharedOutcomeArrays(n_draws=n_draws, n_time_steps=n_time_steps,
+                                                    names=shared_names)
+    _worker['checkpoints'] = None if checkpoint_dir is None else CheckpointDirectory(path=checkpoint_dir)
+
+
+def _simulate_draws(task):
+    """ simulates the cohorts of a set of PSA draws in a worker process
+    :param task: (draws, cohort ids, population size, simulation length)
+    """
+
+    draws, ids, pop_size, n_time_steps = task
+    checkpoints = _worker['checkpoints']
+    for draw, cohort_id in zip(draws, ids):
+        if checkpoints is not None and checkpoints.get_if_completed(draw):
+            _worker['sharedOutcomes'].write_record(draw=draw, record=checkpoints.load(draw))
+            continue
+        param_set = _worker['paramGenerator'].get_new_parameters(seed=int(draw))
+        cohort = Cohort(id=cohort_id, pop_size=pop_size, parameters=param_set)
+        cohort.simulate(n_time_steps=n_time_steps)
+        _worker['sharedOutcomes'].write(draw=draw, simulated_cohort=cohort, n_time_steps=n_time_steps)
+        if checkpoints is not None:
+            checkpoints.save(index=draw, record=get_cohort_record(simulated_cohort=cohort, n_time_steps=n_time_steps))
+
+
 class MultiCohortOutcomes:
     def __init__(self,parameters):
 
@@ -54,6 +333,11 @@ class MultiCohortOutcomes:
         self.statMeanCost = None            # summary statistics of average cost
         self.statMeanQALY = None            # summary statistics of average QALY
 
+        self.stateOccupancies = []   # state occupancy (n_states, n_time_steps) of each simulated cohort
+        self.popSizes = []           # population size of each simulated cohort
+
+        self.sharedOutcomes = None   # shared-memory outcome arrays (when cohorts are simulated in parallel)
+
     def extract_outcomes(self, simulated_cohort):
         """ extracts outcomes of a simulated cohort
         :param simulated_cohort: a cohort after being simulated"""
@@ -69,6 +353,37 @@ class MultiCohortOutcomes:
         self.meanCosts.append(simulated_cohort.cohortOutcomes.statCost.get_mean())
         # store mean QALY from this cohort
         self.meanQALYs.append(simulated_cohort.cohortOutcomes.statUtilities.get_mean())
+        # store state occupancy of this cohort
+        self.stateOccupancies.append(simulated_cohort.cohortOutcomes.stateOccupancy)
+        self.popSizes.append(simulated_cohort.popSize)
+
+    def restore_outcomes(self, record):
+        """ adds the outcomes of a draw saved in a checkpoint
+        :param record: (dict) saved outcomes of the draw (see Checkpoints.get_cohort_record) """
+
+        self.survivalCurves.append(get_saved_survival_curve(record=record))
+        self.meanSurvivalTimes.append(record['mean_survival_time'].item())
+        self.meanTimeToSEVERE.append(record['mean_time_to_severe'].item())
+        self.meanCosts.append(record['mean_cost'].item())
+        self.meanQALYs.append(record['mean_qaly'].item())
+        self.stateOccupancies.append(record['state_occupancy'])
+        self.popSizes.append(int(record['pop_size']))
+
+    def wrap_shared_outcomes(self, shared_outcomes, pop_size):
+        """ uses the outcome arrays written by worker processes (without copying them)
+        :param shared_outcomes: shared outcome arrays of all draws
+        :param pop_size: population size of each cohort
+        """
+
+        self.sharedOutcomes = shared_outcomes   # keeps the buffers alive
+        self.meanSurvivalTimes = shared_outcomes.meanSurvivalTimes
+        self.meanTimeToSEVERE = shared_outcomes.meanTimeToSEVERE
+        self.meanCosts = shared_outcomes.meanCosts
+        self.meanQALYs = shared_outcomes.meanQALYs
+        self.survivalCurves = [get_survival_curve(initial_pop_size=pop_size, n_deaths=n_deaths)
+                               for n_deaths in shared_outcomes.nDeaths]
+        self.stateOccupancies = shared_outcomes.stateOccupancy
+        self.popSizes = [pop_size] * len(shared_outcomes.stateOccupancy)
 
     def calculate_summary_stats(self):
         """
@@ -76,14 +391,22 @@ class MultiCohortOutcomes:
         """
 
         # summary statistics of mean survival time
-        self.statMeanSurvivalTime = stat.SummaryStat(name='Average survival time',
-                                                     data=self.meanSurvivalTimes)
+        self.statMeanSurvivalTime = LazySummaryStat(name='Average survival time',
+                                                    data=self.meanSurvivalTimes)
         # summary statistics of mean time to AIDS
-        self.statMeanTimeToSEVERE = stat.SummaryStat(name='Average time to AIDS',
-                                                   data=self.meanTimeToSEVERE)
+        self.statMeanTimeToSEVERE = LazySummaryStat(name='Average time to AIDS',
+                                                    data=self.meanTimeToSEVERE)
         # summary statistics of mean cost
-        self.statMeanCost = stat.SummaryStat(name='Average cost',
-                                             data=self.meanCosts)
+        self.statMeanCost = LazySummaryStat(name='Average cost',
+                                            data=self.meanCosts)
         # summary statistics of mean QALY
-        self.statMeanQALY = stat.SummaryStat(name='Average QALY',
-                                             data=self.meanQALYs)
\ No newline at end of file
+        self.statMeanQALY = LazySummaryStat(name='Average QALY',
+                                            data=self.meanQALYs)
+
+    def get_state_prevalence(self, alpha=data.ALPHA):
+        """
+        :param alpha: significance level of the uncertainty band
+        :return: (mean, lower, upper) proportion of patients in each state at the end of each time-step
+            averaged across cohorts and its 100(1-alpha)% percentile band
+        """
+        return get_state_prevalence(state_occupancies=self.stateOccupancies, pop_sizes=self.popSizes, alpha=alpha)
@@ -0,0 +1,20 @@
+import time
+
+import InputData as data
+import OneWayClasses as one_way
+import Support as support
+
+SPEC_FILE = 'OneWaySpec.csv'    # low and high values of the inputs
+N_PROCESSES = 4                 # number of processes to evaluate the scenarios
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+
+    # evaluate the low and high scenarios of all inputs with deterministic cohort traces
+    analysis = one_way.OneWaySensitivity(parameters=one_way.read_one_way_spec(SPEC_FILE),
+                                         n_time_steps=data.SIM_TIME_STEPS)
+    analysis.evaluate(n_processes=N_PROCESSES)
+
+    # ranked table and tornado diagram
+    support.report_one_way_sensitivity(one_way=analysis)
+    print('Time to evaluate {} inputs (seconds): {:.2f}'.format(len(analysis.parameters), time.perf_counter() - start))
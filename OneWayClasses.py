@@ -0,0 +1,162 @@
+import copy
+import csv
+import multiprocessing as mp
+import re
+
+import InputData as data
+from AnalyticClasses import CohortTrace
+from ParameterClasses import Parameters, Therapies
+
+# inputs of InputData that one-way sensitivity analysis can vary
+INPUT_NAMES = ['TRANS_MATRIX', 'SEMI_ANNUAL_STATE_COST', 'STATE_UTILITY', 'RR_DMT', 'DMT30_COST', 'SOC_COST',
+               'DISCOUNT']
+
+
+class OneWayParameter:
+    """ an input varied between a low and a high value while all other inputs stay at their base values """
+
+    def __init__(self, name, low, high):
+        """
+        :param name: name of an input in InputData, with indices for an element of a list
+            (e.g. 'RR_DMT', 'STATE_UTILITY[3]' or 'TRANS_MATRIX[0][1]')
+        :param low: low value of the input
+        :param high: high value of the input
+        """
+        self.name = name
+        self.low = low
+        self.high = high
+        match = re.fullmatch(r'(\w+)((?:\[\d+\])*)', name.strip())
+        if match is None or match.group(1) not in INPUT_NAMES:
+            raise ValueError('{} is not an input of the model ({}).'.format(name, ', '.join(INPUT_NAMES)))
+        self.inputName = match.group(1)
+        self.indices = [int(i) for i in re.findall(r'\d+', match.group(2))]
+
+    def get_base_value(self, inputs):
+        """ :return: value of this input in the inputs """
+        value = inputs[self.inputName]
+        for i in self.indices:
+            value = value[i]
+        return value
+
+    def set_value(self, inputs, value):
+        """ sets the value of this input in the inputs """
+        if len(self.indices) == 0:
+            inputs[self.inputName] = value
+            return
+        container = inputs[self.inputName]
+        for i in self.indices[:-1]:
+            container = container[i]
+        container[self.indices[-1]] = value
+
+
+def read_one_way_spec(file_name):
+    """
+    :param file_name: csv file with columns Parameter, Low, High
+    :return: (list) of OneWayParameter
+    """
+
+    with open(file_name, newline='') as file:
+        return [OneWayParameter(name=row['Parameter'], low=float(row['Low']), high=float(row['High']))
+                for row in csv.DictReader(file)]
+
+
+def get_base_inputs():
+    """ :return: (dict) copies of the base values of the inputs in InputData """
+    return {name: copy.deepcopy(getattr(data, name)) for name in INPUT_NAMES}
+
+
+def get_scenario_parameters(inputs, therapy):
+    """
+    :param inputs: (dict) values of the inputs (see get_base_inputs)
+    :param therapy: therapy of the parameter set
+    :return: parameter set of the therapy under these input values
+    """
+
+    param = Parameters(therapy=therapy)
+    prob_matrix = data.get_trans_prob_matrix(trans_matrix=inputs['TRANS_MATRIX'])
+    if therapy == Therapies.DMT_30:
+        param.probMatrix = data.get_trans_prob_matrix_dmt_30(trans_prob_matrix_soc=prob_matrix,
+                                                             relative_risk_dmt=inputs['RR_DMT'])
+        param.annualTreatmentCost = inputs['DMT30_COST']
+    else:
+        param.probMatrix = prob_matrix
+        param.annualTreatmentCost = inputs['SOC_COST']
+    param.semiAnnualStateCosts = list(inputs['SEMI_ANNUAL_STATE_COST'])
+    param.stateUtilities = list(inputs['STATE_UTILITY'])
+    param.discountRate = inputs['DISCOUNT']
+    return param
+
+
+def evaluate_scenario(inputs, n_time_steps=data.SIM_TIME_STEPS):
+    """ evaluates both therapies with deterministic cohort traces
+    :param inputs: (dict) values of the inputs (see get_base_inputs)
+    :param n_time_steps: simulation length
+    :return: (dict) expected cost and QALY of each therapy, incremental cost and QALY of DMT, and ICER
+    """
+
+    outcomes = {}
+    for therapy in (Therapies.SOC, Therapies.DMT_30):
+        trace = CohortTrace(parameters=get_scenario_parameters(inputs=inputs, therapy=therapy))
+        trace.simulate(n_time_steps=n_time_steps)
+        outcomes[therapy] = (trace.expectedCost, trace.expectedUtility)
+
+    incremental_cost = outcomes[Therapies.DMT_30][0] - outcomes[Therapies.SOC][0]
+    incremental_effect = outcomes[Therapies.DMT_30][1] - outcomes[Therapies.SOC][1]
+    return {'cost SOC': outcomes[Therapies.SOC][0], 'effect SOC': outcomes[Therapies.SOC][1],
+            'cost DMT': outcomes[Therapies.DMT_30][0], 'effect DMT': outcomes[Therapies.DMT_30][1],
+            'incremental cost': incremental_cost, 'incremental effect': incremental_effect,
+            'ICER': incremental_cost / incremental_effect if incremental_effect != 0 else float('inf')}
+
+
+def _evaluate_one_way_scenario(task):
+    """ evaluates the scenario where one input takes a given value
+    :param task: (parameter, value, n_time_steps)
+    """
+
+    parameter, value, n_time_steps = task
+    inputs = get_base_inputs()
+    parameter.set_value(inputs=inputs, value=value)
+    return evaluate_scenario(inputs=inputs, n_time_steps=n_time_steps)
+
+
+class OneWaySensitivity:
+    """ varies each input between its low and high values (one at a time) and ranks inputs by the change
+    in the ICER of DMT with respect to donepezil """
+
+    def __init__(self, parameters, n_time_steps=data.SIM_TIME_STEPS):
+        """
+        :param parameters: (list) of OneWayParameter
+        :param n_time_steps: simulation length
+        """
+        self.parameters = parameters
+        self.nTimeSteps = n_time_steps
+        self.baseOutcomes = None    # outcomes under the base values of all inputs
+        self.results = []           # one dictionary per input (see evaluate)
+
+    def evaluate(self, n_processes=1):
+        """ evaluates the base scenario and the low and high scenarios of all inputs
+        :param n_processes: number of processes to evaluate the scenarios in parallel
+        """
+
+        self.baseOutcomes = evaluate_scenario(inputs=get_base_inputs(), n_time_steps=self.nTimeSteps)
+
+        tasks = [(p, value, self.nTimeSteps) for p in self.parameters for value in (p.low, p.high)]
+        if n_processes > 1:
+            with mp.Pool(processes=n_processes) as pool:
+                outcomes = pool.map(_evaluate_one_way_scenario, tasks)
+        else:
+            outcomes = [_evaluate_one_way_scenario(task) for task in tasks]
+
+        base_inputs = get_base_inputs()
+        self.results = []
+        for i, p in enumerate(self.parameters):
+            low, high = outcomes[2 * i], outcomes[2 * i + 1]
+            self.results.append({'parameter': p.name,
+                                 'base value': p.get_base_value(inputs=base_inputs),
+                                 'low value': p.low, 'high value': p.high,
+                                 'ICER at low': low['ICER'], 'ICER at high': high['ICER'],
+                                 'swing': abs(high['ICER'] - low['ICER'])})
+
+    def get_ranked_results(self):
+        """ :return: (list) results of inputs in decreasing order of their swing in the ICER """
+        return sorted(self.results, key=lambda row: row['swing'], reverse=True)
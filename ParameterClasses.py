@@ -15,6 +15,11 @@ class Parameters:
         # initial health state
         self.initialHealthState = data.HealthStates.PREDEM
 
+        # age and sex of patients (background mortality increases with age if ifAgeDependentMortality is True)
+        self.age = data.AGE_AT_START
+        self.sex = data.SEX
+        self.ifAgeDependentMortality = data.AGE_DEPENDENT_MORTALITY
+
         # annual treatment cost
         if self.therapy == Therapies.DMT_30:
             self.annualTreatmentCost = data.DMT30_COST
@@ -41,6 +46,15 @@ class Parameters:
 
         # # discount rate
         self.discountRate = data.DISCOUNT
+
+        # length of a time-step (years); transition probabilities, costs and utilities above are per
+        # BASE_CYCLE_LENGTH and are converted to this cycle length when simulating (see AnalyticClasses)
+        self.cycleLength = data.CYCLE_LENGTH
+
+        # transition probability matrices of each time-step and the transition sampler shared by
+        # all patients (built on first use)
+        self.probMatrices = None
+        self.transitionSampler = None
     
 if __name__ == '__main__':
     matrix_soc = data.get_trans_prob_matrix(data.TRANS_MATRIX)
@@ -0,0 +1,117 @@
+import concurrent.futures as futures
+import os
+import time
+
+# where a stage runs
+PROCESS = 'process'     # in a worker process: simulations, and figures (pyplot is not thread-safe)
+THREAD = 'thread'       # in a worker thread of the main process: file I/O such as writing tables
+MAIN = 'main'           # in the main thread, in the order the stages become ready: console output
+
+
+class Stage:
+    """ a stage of a pipeline: a function whose keyword arguments include the results of the stages it depends on """
+
+    def __init__(self, name, function, inputs=None, where=MAIN, kwargs=None):
+        """
+        :param name: name of the stage
+        :param function: function of the stage (a module-level function if it runs in a worker process)
+        :param inputs: (dict) keyword argument of the function that receives the result of each stage this stage
+            depends on, by stage name
+        :param where: PROCESS, THREAD, or MAIN
+        :param kwargs: (dict) other keyword arguments of the function
+        """
+        self.name = name
+        self.function = function
+        self.inputs = {} if inputs is None else inputs
+        self.where = where
+        self.kwargs = {} if kwargs is None else kwargs
+
+
+def _run_stage(function, kwargs):
+    """ :return: (result, start time, end time) of calling the function of a stage """
+
+    start = time.time()
+    result = function(**kwargs)
+    return result, start, time.time()
+
+
+class Pipeline:
+    """ runs stages as soon as the stages they depend on are complete, so that independent stages (e.g. the
+    simulations of different strategies, and the tables and figures of outcomes that are already available)
+    run concurrently """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}    # stages by name (in the order they were added)
+        self.results = {}   # result of each completed stage by name
+        self.times = {}     # (start, end) seconds since the start of the run of each completed stage
+
+    def add_stage(self, name, function, inputs=None, where=MAIN, **kwargs):
+        """ adds a stage (see Stage); the stages it depends on have to be added before it """
+
+        stage = Stage(name=name, function=function, inputs=inputs, where=where, kwargs=kwargs)
+        for dependency in stage.inputs.values():
+            if dependency not in self.stages:
+                raise ValueError('Stage ' + name + ' depends on ' + dependency + ' which is not a stage of the '
+                                 'pipeline (stages have to be added after the stages they depend on).')
+        self.stages[name] = stage
+
+    def get_dependency_graph(self):
+        """ :return: (list) lines describing each stage, where it runs, and the stages it depends on """
+
+        return ['  {} [{}] <- {}'.format(stage.name, stage.where,
+                                        ', '.join(stage.inputs.values()) if stage.inputs else '(no inputs)')
+                for stage in self.stages.values()]
+
+    def run(self, n_processes=None, n_threads=4):
+        """ runs all stages, printing the dependency graph and the start and completion of each stage
+        :param n_processes: number of worker processes (number of CPUs by default)
+        :param n_threads: number of worker threads
+        :return: (dict) result of each stage by name
+        """
+
+        self.results, self.times = {}, {}
+        start = time.time()
+        log = lambda message: print('[{:7.2f}s] {}'.format(time.time() - start, message))
+
+        print('Pipeline {}:'.format(self.name))
+        print('\n'.join(self.get_dependency_graph()))
+
+        waiting = list(self.stages.values())
+        running = {}    # stage of each running future
+        with futures.ProcessPoolExecutor(max_workers=n_processes or os.cpu_count()) as processes, \
+                futures.ThreadPoolExecutor(max_workers=n_threads) as threads:
+            while waiting or running:
+
+                # start the stages whose inputs are ready (stages in the main thread run now)
+                for stage in [s for s in waiting if all(d in self.results for d in s.inputs.values())]:
+                    waiting.remove(stage)
+                    kwargs = dict(stage.kwargs, **{arg: self.results[d] for arg, d in stage.inputs.items()})
+                    log('start {} [{}]'.format(stage.name, stage.where))
+                    if stage.where == MAIN:
+                        self._complete(stage, _run_stage(stage.function, kwargs), start, log)
+                    else:
+                        executor = processes if stage.where == PROCESS else threads
+                        running[executor.submit(_run_stage, stage.function, kwargs)] = stage
+
+                    # stages completed in the main thread may have made others ready
+                    if stage.where == MAIN:
+                        break
+                else:
+                    # wait for a stage to complete
+                    done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        self._complete(running.pop(future), future.result(), start, log)
+
+        longest = max(self.times, key=lambda name: self.times[name][1] - self.times[name][0])
+        log('pipeline complete (longest stage: {} {:.2f}s)'.format(
+            longest, self.times[longest][1] - self.times[longest][0]))
+        return self.results
+
+    def _complete(self, stage, run, start, log):
+        """ stores the result and the run time of a completed stage """
+
+        result, stage_start, stage_end = run
+        self.results[stage.name] = result
+        self.times[stage.name] = (stage_start - start, stage_end - start)
+        log('done {} ({:.2f}s)'.format(stage.name, stage_end - stage_start))
@@ -0,0 +1,82 @@
+import copy
+import csv
+
+import numpy as np
+
+import InputData as data
+
+
+class Stratum:
+    """ a group of patients with the same covariates """
+
+    def __init__(self, id, name, age, sex, initial_state, share):
+        """
+        :param id: (int) index of the stratum
+        :param name: name of the stratum
+        :param age: age of patients at the start of simulation (years)
+        :param sex: 'Male' or 'Female'
+        :param initial_state: health state of patients at the start of simulation
+        :param share: share of the population in this stratum
+        """
+        self.id = id
+        self.name = name
+        self.age = age
+        self.sex = sex
+        self.initialHealthState = initial_state
+        self.share = share
+
+
+def read_population_strata(file_name=data.POPULATION_FILE):
+    """
+    :param file_name: csv file with columns Stratum, Age, Sex, InitialState, Share
+    :return: (list) of strata
+    """
+
+    with open(file_name, newline='') as file:
+        rows = list(csv.DictReader(file))
+
+    strata = [Stratum(id=i,
+                      name=row['Stratum'],
+                      age=float(row['Age']),
+                      sex=row['Sex'],
+                      initial_state=data.HealthStates[row['InitialState']],
+                      share=float(row['Share']))
+              for i, row in enumerate(rows)]
+
+    if not np.isclose(sum(s.share for s in strata), 1):
+        raise ValueError('Shares of the strata in ' + file_name + ' should add up to 1.')
+
+    return strata
+
+
+def get_stratum_parameters(parameters, stratum):
+    """
+    :param parameters: parameter set of the therapy
+    :param stratum: a stratum of the population
+    :return: a copy of the parameter set for patients of this stratum
+    """
+
+    stratum_params = copy.copy(parameters)
+    stratum_params.age = stratum.age
+    stratum_params.sex = stratum.sex
+    stratum_params.initialHealthState = stratum.initialHealthState
+    # transition matrices and sampler depend on age, so they are built for the stratum on first use
+    stratum_params.probMatrices = None
+    stratum_params.transitionSampler = None
+
+    return stratum_params
+
+
+def get_stratum_sizes(pop_size, strata):
+    """
+    :param pop_size: population size
+    :param strata: (list) of strata
+    :return: (list) number of patients in each stratum (largest-remainder rounding of the shares)
+    """
+
+    expected = np.array([s.share for s in strata]) * pop_size
+    sizes = np.floor(expected).astype(int)
+    remainders = np.argsort(sizes - expected)[:pop_size - sizes.sum()]
+    sizes[remainders] += 1
+
+    return sizes.tolist()
@@ -0,0 +1,26 @@
+import InputData as data
+import MarkovClasses as model
+import ParameterClasses as param
+import PopulationClasses as population
+import Support as support
+
+# covariate strata of the population
+strata = population.read_population_strata()
+
+# simulating donepezil
+cohort_SOC = model.StratifiedCohort(id=0,
+                                    pop_size=data.POP_SIZE,
+                                    parameters=param.Parameters(therapy=param.Therapies.SOC),
+                                    strata=strata)
+cohort_SOC.simulate(n_time_steps=data.SIM_TIME_STEPS)
+
+# simulating dmt
+cohort_DMT30 = model.StratifiedCohort(id=1,
+                                      pop_size=data.POP_SIZE,
+                                      parameters=param.Parameters(therapy=param.Therapies.DMT_30),
+                                      strata=strata)
+cohort_DMT30.simulate(n_time_steps=data.SIM_TIME_STEPS)
+
+# print the pooled outcomes and the outcomes of each stratum
+support.print_stratified_outcomes(stratified_cohort=cohort_SOC, therapy_name=param.Therapies.SOC)
+support.print_stratified_outcomes(stratified_cohort=cohort_DMT30, therapy_name=param.Therapies.DMT_30)
@@ -0,0 +1,103 @@
+import numpy as np
+
+import InputData as data
+
+# kinds of random number streams derived from the root seed
+PARAMETER_STREAM = 0    # sampling parameter values of a PSA draw
+PATIENT_STREAM = 1      # simulating a block of patients
+POPULATION_STREAM = 2   # simulating a block of patients shared by all compared strategies
+BOOTSTRAP_STREAM = 3    # resampling observations for a bootstrap sample
+INCIDENT_STREAM = 4     # simulating a block of the incident patients entering an open cohort at a time-step
+
+
+def get_parameter_rng(draw_id, root_seed=data.SEED):
+    """
+    :param draw_id: (int) id of the PSA draw
+    :param root_seed: (int) seed from which all random number streams are derived
+    :return: (numpy.random.Generator) random number generator to sample the parameter values of this draw
+        (shared by all therapies so that therapies are compared under the same parameter values)
+    """
+
+    seed_seq = np.random.SeedSequence(entropy=root_seed, spawn_key=(PARAMETER_STREAM, draw_id))
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def get_patient_block_rng(cohort_id, block_id, therapy, stratum_id=None, root_seed=data.SEED):
+    """
+    :param cohort_id: (int) id of the cohort (or of the PSA draw the cohort is simulated for)
+    :param block_id: (int) index of the block of RNG_BLOCK_SIZE patients in the cohort
+    :param therapy: therapy of the cohort
+    :param stratum_id: (int) index of the population stratum (None if the population is not stratified)
+    :param root_seed: (int) seed from which all random number streams are derived
+    :return: (numpy.random.Generator) random number generator to simulate the patients of this block
+        (the stream depends only on these ids, so results do not depend on how patients are split
+        into chunks or processes)
+    """
+
+    spawn_key = (PATIENT_STREAM, cohort_id, therapy.value, block_id)
+    if stratum_id is not None:
+        spawn_key += (stratum_id, )
+    seed_seq = np.random.SeedSequence(entropy=root_seed, spawn_key=spawn_key)
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def get_population_block_rng(cohort_id, block_id, root_seed=data.SEED):
+    """
+    :param cohort_id: (int) id of the patient population
+    :param block_id: (int) index of the block of RNG_BLOCK_SIZE patients in the population
+    :param root_seed: (int) seed from which all random number streams are derived
+    :return: (numpy.random.Generator) random number generator of this block of patients, shared by all
+        strategies simulated for this population (common random numbers)
+    """
+
+    seed_seq = np.random.SeedSequence(entropy=root_seed, spawn_key=(POPULATION_STREAM, cohort_id, block_id))
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def get_bootstrap_rng(sample_id, root_seed=data.SEED):
+    """
+    :param sample_id: (int) id of the bootstrap sample
+    :param root_seed: (int) seed from which all random number streams are derived
+    :return: (numpy.random.Generator) random number generator to resample the observations of this bootstrap
+        sample (so bootstrap samples do not depend on how they are split into blocks or threads)
+    """
+
+    seed_seq = np.random.SeedSequence(entropy=root_seed, spawn_key=(BOOTSTRAP_STREAM, sample_id))
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+def get_incident_block_rng(population_id, entry_step, block_id, root_seed=data.SEED):
+    """
+    :param population_id: (int) id of the open-cohort population
+    :param entry_step: (int) time-step at which the patients of the block enter the population
+    :param block_id: (int) index of the block of RNG_BLOCK_SIZE patients among those entering at this time-step
+    :param root_seed: (int) seed from which all random number streams are derived
+    :return: (numpy.random.Generator) random number generator of this block of incident patients, shared by all
+        strategies simulated for this population (common random numbers)
+    """
+
+    seed_seq = np.random.SeedSequence(entropy=root_seed, spawn_key=(INCIDENT_STREAM, population_id, entry_step,
+                                                                     block_id))
+    return np.random.Generator(np.random.PCG64(seed_seq))
+
+
+class AntitheticGenerator:
+    """ wraps a random number generator so that patients are simulated in antithetic pairs: every second
+    request returns 1 - u for the uniform random numbers u returned by the previous request """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self._last = None   # uniform random numbers of the first patient of the current pair
+
+    def random(self, size):
+        """
+        :param size: number of uniform random numbers
+        :return: (numpy.array) uniform random numbers u for the first patient of a pair and 1 - u for the second
+        """
+
+        if self._last is None:
+            self._last = self.rng.random(size)
+            return self._last
+        uniforms = 1 - self._last
+        self._last = None
+        return uniforms
@@ -0,0 +1,310 @@
+import copy
+import hashlib
+import json
+import numbers
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import InputData as data
+from Checkpoints import get_cohort_record, get_parameter_settings, to_json
+from OneWayClasses import INPUT_NAMES
+
+REGISTRY_FILE = 'registry.sqlite'
+# constants of InputData that the outcomes of a run depend on: the inputs of the model and the settings of the
+# engines (the seed and the sizes of the run itself are part of its scenario, and constants that only change how
+# the outcomes are reported, e.g. ALPHA or WTP, or how patients are split into chunks are not part of it)
+SCENARIO_INPUTS = INPUT_NAMES + ['CYCLE_LENGTH', 'BASE_CYCLE_LENGTH', 'RNG_BLOCK_SIZE', 'AGE_DEPENDENT_MORTALITY',
+                                 'AGE_AT_START', 'SEX', 'LIFE_TABLE_FILE', 'POPULATION_FILE']
+
+# status of a registered run
+RUNNING = 'running'
+DONE = 'done'
+
+
+def get_input_values(inputs=None):
+    """
+    :param inputs: (dict) values of inputs that replace those of InputData (e.g. see OneWayClasses.get_base_inputs)
+    :return: (dict) copies of the SCENARIO_INPUTS constants of InputData with the replaced values
+    """
+
+    values = {name: copy.deepcopy(getattr(data, name)) for name in SCENARIO_INPUTS}
+    values.update(inputs or {})
+    return values
+
+
+def get_scenario(therapy, engine, pop_size, n_time_steps, n_cohorts=1, inputs=None, parameters=None):
+    """
+    :param therapy: therapy of the run
+    :param engine: name of the engine of the run (e.g. 'Cohort', 'Cohort (batched)', 'MultiCohort', 'CohortTrace')
+    :param pop_size: population size of each cohort
+    :param n_time_steps: simulation length
+    :param n_cohorts: number of cohorts (or PSA draws)
+    :param inputs: (dict) values of inputs that differ from InputData
+    :param parameters: parameter set of the run (when it is modified after it is built from the inputs)
+    :return: (dict) the full scenario of a run (json-compatible); runs of the same scenario have the same outcomes
+    """
+
+    scenario = {'therapy': therapy.name, 'engine': engine, 'popSize': pop_size, 'nCohorts': n_cohorts,
+                'nTimeSteps': n_time_steps, 'seed': data.SEED, 'inputs': get_input_values(inputs=inputs)}
+    if parameters is not None:
+        scenario['parameters'] = get_parameter_settings(parameters)
+    return json.loads(json.dumps(scenario, default=to_json))
+
+
+def get_scenario_key(scenario):
+    """ :return: (str) hash identifying the scenario (independent of the order of its keys) """
+    return hashlib.sha256(json.dumps(scenario, sort_keys=True).encode()).hexdigest()
+
+
+def get_cohort_results(simulated_cohort, n_time_steps):
+    """
+    :param simulated_cohort: a cohort after being simulated
+    :param n_time_steps: simulation length
+    :return: (outcomes, arrays) the summary outcomes (dict of numbers) and the arrays (dict of numpy arrays) of
+        the cohort to register
+    """
+
+    record = get_cohort_record(simulated_cohort=simulated_cohort, n_time_steps=n_time_steps)
+    outcomes = {key: float(value) for key, value in record.items() if np.ndim(value) == 0}
+    arrays = {key: value for key, value in record.items() if np.ndim(value) > 0}
+    return outcomes, arrays
+
+
+def _flatten(value, name):
+    """ :return: (list) of (name, number) of the numbers in a value, with the names of elements of lists as in
+        OneWayClasses (e.g. 'TRANS_MATRIX[0][1]') and of entries of dictionaries as name.key """
+
+    if isinstance(value, bool):
+        return [(name, int(value))]
+    if isinstance(value, numbers.Number):
+        return [(name, value)]
+    if isinstance(value, list):
+        return [pair for i, v in enumerate(value) for pair in _flatten(v, '{}[{}]'.format(name, i))]
+    if isinstance(value, dict):
+        return [pair for key, v in value.items() for pair in _flatten(v, name + '.' + key if name else key)]
+    return []
+
+
+class RegisteredRun:
+    """ a run in the registry """
+
+    def __init__(self, row):
+        """ :param row: (id, key, status, scenario, outcomes, array file) of the run in the registry """
+
+        self.id, self.key, self.status = row[0], row[1], row[2]
+        self.scenario = json.loads(row[3])
+        self.outcomes = None if row[4] is None else json.loads(row[4])
+        self.arrayFile = row[5]
+
+    def get_arrays(self):
+        """ :return: (dict) the stored arrays of the run (empty if none were stored) """
+
+        if self.arrayFile is None:
+            return {}
+        with np.load(self.arrayFile) as f:
+            return {key: f[key] for key in f.files}
+
+
+class RunRegistry:
+    """ an SQLite database of runs: the full scenario of each run (the inputs of the model, therapy, seed, engine,
+    population sizes), its summary outcomes, and the file of its arrays. Every number of the scenario and of the
+    outcomes is also stored in an indexed table of (name, value) so that runs are found by ranges of any input
+    (e.g. RR_DMT between 0.2 and 0.4), and a scenario that was already run is returned instead of run again. """
+
+    def __init__(self, directory, run_timeout=600, heartbeat_interval=60):
+        """
+        :param directory: directory of the registry database and of the arrays of the runs
+        :param run_timeout: seconds without a heartbeat after which a run that has not completed (its process was
+            interrupted) is started again by the next request of its scenario
+        :param heartbeat_interval: seconds between the heartbeats of a run in progress (less than run_timeout)
+        """
+
+        if not 0 < heartbeat_interval < run_timeout:
+            raise ValueError('The heartbeat interval (' + str(heartbeat_interval) + ' seconds) should be positive '
+                             'and shorter than the run timeout (' + str(run_timeout) + ' seconds).')
+        self.directory = directory
+        self.runTimeout = run_timeout
+        self.heartbeatInterval = heartbeat_interval
+        os.makedirs(os.path.join(directory, 'arrays'), exist_ok=True)
+
+        self._connection = sqlite3.connect(os.path.join(directory, REGISTRY_FILE), timeout=60,
+                                           isolation_level=None)
+        self._connection.executescript(
+            'CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, key TEXT UNIQUE, status TEXT, '
+            'started REAL, heartbeat REAL, completed REAL, therapy TEXT, engine TEXT, scenario TEXT, outcomes TEXT, '
+            'array_file TEXT);'
+            'CREATE INDEX IF NOT EXISTS runs_by_therapy ON runs (therapy, engine);'
+            'CREATE TABLE IF NOT EXISTS run_values (run_id INTEGER, name TEXT, value REAL, '
+            'PRIMARY KEY (run_id, name));'
+            'CREATE INDEX IF NOT EXISTS run_values_by_name ON run_values (name, value);')
+
+    def find(self, scenario):
+        """ :return: the completed run of this scenario (RegisteredRun) or None """
+
+        run = self._get_run(key=get_scenario_key(scenario))
+        return run if run is not None and run.status == DONE else None
+
+    def get_or_run(self, scenario, simulate, poll_interval=5):
+        """ returns the run of the scenario if it is registered, otherwise runs and registers it; if another
+        process is running the same scenario, waits for its run instead of starting a duplicate one
+        :param scenario: the scenario of the run (see get_scenario)
+        :param simulate: function with no arguments that runs the scenario and returns (outcomes, arrays): a dict
+            of summary numbers and a dict of numpy arrays (see get_cohort_results)
+        :param poll_interval: seconds between checks of a run of another process
+        :return: the registered run (RegisteredRun)
+        """
+
+        key = get_scenario_key(scenario)
+        while True:
+            claimed, run = self._claim(key=key, scenario=scenario)
+            if claimed:
+                break
+            if run is None:
+                continue    # the run of the other process failed (and was deleted) after it was found
+            if run.status == DONE:
+                return run
+            time.sleep(poll_interval)
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(key, stop), daemon=True)
+        heartbeat.start()
+        try:
+            outcomes, arrays = simulate()
+        except BaseException:
+            self._connection.execute('DELETE FROM runs WHERE key = ? AND status != ?', (key, DONE))
+            raise
+        finally:
+            stop.set()
+            heartbeat.join()
+        return self._complete(key=key, scenario=scenario, outcomes=outcomes, arrays=arrays)
+
+    def record(self, scenario, outcomes, arrays=None):
+        """ registers the results of a run (the results of a scenario already registered are not replaced)
+        :param scenario: the scenario of the run (see get_scenario)
+        :param outcomes: (dict) summary outcomes of the run
+        :param arrays: (dict) numpy arrays of the run to store
+        :return: the registered run (RegisteredRun)
+        """
+
+        key = get_scenario_key(scenario)
+        claimed, run = self._claim(key=key, scenario=scenario)
+        while not claimed and run is None:
+            # the run of another process failed (and was deleted) after it was found
+            claimed, run = self._claim(key=key, scenario=scenario)
+        if not claimed:
+            return run
+        return self._complete(key=key, scenario=scenario, outcomes=outcomes, arrays=arrays or {})
+
+    def query(self, ranges=None, therapy=None, engine=None):
+        """
+        :param ranges: (dict) (low, high) range or value of numbers of the scenario or of the outcomes by name:
+            InputData constants and their elements (e.g. 'RR_DMT', 'TRANS_MATRIX[0][1]'), 'popSize',
+            'nCohorts', 'nTimeSteps', 'seed', 'parameters.<attribute>', and 'outcomes.<outcome>'
+        :param therapy: name of the therapy of the runs (any therapy if None)
+        :param engine: engine of the runs (any engine if None)
+        :return: (list) completed runs (RegisteredRun) that satisfy all conditions, in the order they were started
+        """
+
+        sql = 'SELECT id, key, status, scenario, outcomes, array_file FROM runs WHERE status = ?'
+        args = [DONE]
+        for column, value in [('therapy', therapy), ('engine', engine)]:
+            if value is not None:
+                sql += ' AND {} = ?'.format(column)
+                args.append(value)
+        for name, value in (ranges or {}).items():
+            low, high = value if isinstance(value, (tuple, list)) else (value, value)
+            sql += ' AND id IN (SELECT run_id FROM run_values WHERE name = ? AND value BETWEEN ? AND ?)'
+            args += [name, low, high]
+        return [RegisteredRun(row) for row in self._connection.execute(sql + ' ORDER BY id', args)]
+
+    def _get_run(self, key):
+        """ :return: the run of this scenario key (RegisteredRun) or None """
+
+        row = self._connection.execute('SELECT id, key, status, scenario, outcomes, array_file FROM runs '
+                                       'WHERE key = ?', (key, )).fetchone()
+        return None if row is None else RegisteredRun(row)
+
+    def _beat(self, key, stop):
+        """ updates the heartbeat of a run in progress every heartbeat interval until stop is set
+        :param key: scenario key of the run
+        :param stop: (threading.Event) set when the run has completed or failed
+        """
+
+        connection = sqlite3.connect(os.path.join(self.directory, REGISTRY_FILE), timeout=60,
+                                     isolation_level=None)
+        try:
+            while not stop.wait(self.heartbeatInterval):
+                connection.execute('UPDATE runs SET heartbeat = ? WHERE key = ? AND status = ?',
+                                   (time.time(), key, RUNNING))
+        finally:
+            connection.close()
+
+    def _claim(self, key, scenario):
+        """ registers the scenario as running unless it is done or being run by another process (a run without a
+        heartbeat for longer than the run timeout is claimed again, keeping its id)
+        :return: (claimed, run) where claimed is True if this process has to run the scenario, and run is the
+            registered run of the scenario otherwise
+        """
+
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = connection.execute('SELECT status, heartbeat FROM runs WHERE key = ?', (key, )).fetchone()
+            claimed = row is None or (row[0] == RUNNING and row[1] < now - self.runTimeout)
+            if row is None:
+                connection.execute(
+                    'INSERT INTO runs (key, status, started, heartbeat, therapy, engine, scenario) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, RUNNING, now, now, scenario.get('therapy'), scenario.get('engine'), json.dumps(scenario)))
+            elif claimed:
+                connection.execute('UPDATE runs SET started = ?, heartbeat = ? WHERE key = ? AND status != ?',
+                                   (now, now, key, DONE))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return claimed, None if claimed else self._get_run(key=key)
+
+    def _complete(self, key, scenario, outcomes, arrays):
+        """ stores the arrays and outcomes of a claimed run and indexes the numbers of its scenario and outcomes
+        :return: the registered run (RegisteredRun)
+        """
+
+        connection = self._connection
+        run_id = connection.execute('SELECT id FROM runs WHERE key = ?', (key, )).fetchone()[0]
+
+        array_file = None
+        if arrays:
+            # a unique temporary file, as the process of a reclaimed run may also be completing it
+            array_file = os.path.join(self.directory, 'arrays', 'run_{:06d}.npz'.format(run_id))
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(array_file),
+                                             prefix=os.path.basename(array_file) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, **arrays)
+                os.replace(temp_file, array_file)
+            except BaseException:
+                os.remove(temp_file)
+                raise
+
+        outcomes = json.loads(json.dumps(outcomes, default=to_json))
+        values = _flatten({name: value for name, value in scenario.items() if name != 'inputs'}, '') \
+            + _flatten(scenario['inputs'], '') + _flatten(outcomes, 'outcomes')
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM run_values WHERE run_id = ?', (run_id, ))
+            connection.executemany('INSERT OR REPLACE INTO run_values VALUES (?, ?, ?)',
+                                   [(run_id, name, value) for name, value in values])
+            connection.execute('UPDATE runs SET status = ?, completed = ?, outcomes = ?, array_file = ? '
+                               'WHERE id = ?', (DONE, time.time(), json.dumps(outcomes), array_file, run_id))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return self._get_run(key=key)
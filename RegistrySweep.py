@@ -0,0 +1,36 @@
+import InputData as data
+import MarkovClasses as model
+import OneWayClasses as one_way
+import ParameterClasses as param
+import RegistryClasses as registry
+
+REGISTRY_DIR = 'runs'       # directory of the run registry
+RR_VALUES = [0.1, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5]   # effectiveness of DMT to simulate
+POP_SIZE = 10000            # population size of each cohort
+
+runs = registry.RunRegistry(directory=REGISTRY_DIR)
+
+# simulate a DMT cohort for each effectiveness (scenarios already in the registry are not simulated again)
+for rr in RR_VALUES:
+    inputs = one_way.get_base_inputs()
+    inputs['RR_DMT'] = rr
+    scenario = registry.get_scenario(therapy=param.Therapies.DMT_30, engine='Cohort (batched)', pop_size=POP_SIZE,
+                                     n_time_steps=data.SIM_TIME_STEPS, inputs=inputs)
+
+    def simulate():
+        cohort = model.Cohort(id=0, pop_size=POP_SIZE, memory_budget=data.MEMORY_BUDGET,
+                              parameters=one_way.get_scenario_parameters(inputs=inputs,
+                                                                         therapy=param.Therapies.DMT_30))
+        cohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
+        return registry.get_cohort_results(simulated_cohort=cohort, n_time_steps=data.SIM_TIME_STEPS)
+
+    run = runs.get_or_run(scenario=scenario, simulate=simulate)
+    print('RR_DMT = {}: run {} (mean cost {:,.0f}, mean QALY {:.3f})'.format(
+        rr, run.id, run.outcomes['mean_cost'], run.outcomes['mean_qaly']))
+
+# find the runs with DMT effectiveness between 0.2 and 0.4
+print('Runs with RR_DMT between 0.2 and 0.4:')
+for run in runs.query(ranges={'RR_DMT': (0.2, 0.4)}, therapy=param.Therapies.DMT_30.name):
+    print('  run {}: RR_DMT = {}, mean survival time {:.2f}, deaths by the end of simulation {}'.format(
+        run.id, run.scenario['inputs']['RR_DMT'], run.outcomes['mean_survival_time'],
+        run.get_arrays()['n_deaths'].sum()))
@@ -0,0 +1,30 @@
+import InputData as data
+import MarkovClasses as model
+import ParameterClasses as param
+from TrajectoryClasses import TrajectoryStore
+
+TRAJECTORY_FILE = 'trajectories/dmt'   # base name of the files of the recorded state paths
+SEVERE_COST_CHANGE = 1.2    # multiplier of the cost of SEVERE state in the replayed scenario
+
+# simulate the cohort under DMT and record the state path of every patient
+cohort = model.Cohort(id=1,
+                      pop_size=data.POP_SIZE,
+                      parameters=param.Parameters(therapy=param.Therapies.DMT_30),
+                      memory_budget=data.MEMORY_BUDGET,
+                      trajectory_file=TRAJECTORY_FILE)
+cohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
+
+# replay the stored paths under the simulated rewards and under a higher cost of SEVERE state
+store = TrajectoryStore.open(TRAJECTORY_FILE)
+scenario = param.Parameters(therapy=param.Therapies.DMT_30)
+scenario.semiAnnualStateCosts = list(scenario.semiAnnualStateCosts)
+scenario.semiAnnualStateCosts[data.HealthStates.SEVERE.value] *= SEVERE_COST_CHANGE
+
+print('Patients and time-steps stored:', store.paths.shape)
+for name, parameters in [('Simulated rewards', cohort.params),
+                         ('Cost of SEVERE x {}'.format(SEVERE_COST_CHANGE), scenario)]:
+    costs, utilities = store.replay(parameters=parameters)
+    print('  {}: mean discounted cost {:,.0f}, mean discounted QALY {:.3f}'.format(
+        name, costs.mean(), utilities.mean()))
+print('  Simulated: mean discounted cost {:,.0f}, mean discounted QALY {:.3f}'.format(
+    cohort.cohortOutcomes.statCost.get_mean(), cohort.cohortOutcomes.statUtilities.get_mean()))
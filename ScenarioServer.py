@@ -0,0 +1,34 @@
+import argparse
+
+import ServerClasses as server
+
+HOST = '127.0.0.1'      # the server only accepts local connections
+PORT = 8765             # port of the server
+N_WORKERS = None        # number of worker processes for simulation requests (number of CPUs if None)
+
+# start:    python ScenarioServer.py                (or --socket /tmp/scenarios.sock for a Unix socket)
+# request:  curl -s localhost:8765/evaluate -d '{"inputs": {"DMT30_COST": 20000, "RR_DMT": 0.25}}'
+#           (add "method": "simulation" and "pop_size" to simulate cohorts instead of evaluating cohort traces)
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Long-running server that evaluates what-if scenarios.')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', help='path of a Unix socket to listen on instead of a TCP port')
+    parser.add_argument('--workers', type=int, default=N_WORKERS)
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    if args.socket is None:
+        scenario_server = server.ScenarioServer(host=HOST, port=args.port, n_workers=args.workers,
+                                                verbose=args.verbose)
+        print('Serving scenarios on http://{}:{}'.format(HOST, args.port))
+    else:
+        scenario_server = server.UnixScenarioServer(socket_file=args.socket, n_workers=args.workers,
+                                                    verbose=args.verbose)
+        print('Serving scenarios on', args.socket)
+
+    with scenario_server:
+        try:
+            scenario_server.serve_forever()
+        except KeyboardInterrupt:
+            pass
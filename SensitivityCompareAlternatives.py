@@ -1,26 +1,36 @@
+import os
+
 import InputData as data
 import MarkovClassesSensitivity as model
 import SensitivityParamClasses as param
 import SensitivitySupport as support
 
-N_COHORTS = 100  # number of cohorts
+MAX_COHORTS = 1000  # maximum number of cohorts (PSA draws); fewer are simulated once the outcomes converge
 POP_SIZE = 500  # population size of each cohort
+CHECKPOINT_DIR = None   # directory to save completed draws in and to resume an interrupted run from (None: not saved)
 
 # create a multi-cohort to simulate under SOC treatment
 multiCohortSOC = model.MultiCohort(
-    ids=range(N_COHORTS),
+    ids=range(MAX_COHORTS),
     pop_sizes=POP_SIZE,
-    parameters=param.Therapies.SOC)
-
-multiCohortSOC.simulate(n_time_steps=data.SIM_TIME_STEPS)
+    parameters=param.Therapies.SOC,
+    checkpoint_dir=None if CHECKPOINT_DIR is None else os.path.join(CHECKPOINT_DIR, 'soc'))
 
 # create a multi-cohort to simulate under DMT treatment
 multiCohortDMT30 = model.MultiCohort(
-    ids=range(N_COHORTS),
+    ids=range(MAX_COHORTS),
     pop_sizes=POP_SIZE,
-    parameters=param.Therapies.DMT_30)
-
-multiCohortDMT30.simulate(n_time_steps=data.SIM_TIME_STEPS)
+    parameters=param.Therapies.DMT_30,
+    checkpoint_dir=None if CHECKPOINT_DIR is None else os.path.join(CHECKPOINT_DIR, 'dmt'))
+
+# simulate draws of both therapies until the incremental cost, QALY, and NMB converge
+monitor = model.PSAConvergenceMonitor(wtp=data.WTP, alpha=data.ALPHA)
+multiCohortDMT30.simulate_until_converged(n_time_steps=data.SIM_TIME_STEPS,
+                                          comparator=multiCohortSOC,
+                                          monitor=monitor)
+print('Number of PSA draws simulated:', monitor.get_n_draws(),
+      '(converged)' if monitor.nDrawsToConverge is not None else '(not converged)')
+support.plot_convergence(monitor=monitor)
 
 # print the estimates for the mean survival time and mean time to severe stage
 support.print_outcomes(multi_cohort_outcomes=multiCohortSOC.multiCohortOutcomes,
@@ -1,8 +1,13 @@
 import InputData as data
-import numpy as np
 import deampy.random_variates as rvgs
 from ParameterClasses import Therapies
 from InputData import get_trans_prob_matrix_dmt_30
+from RandomStreams import get_parameter_rng
+
+# constants of InputData that determine the sampled parameter sets and their simulated outcomes
+PSA_INPUTS = ('TRANS_MATRIX', 'RR_DMT', 'DMT30_COST', 'SOC_COST', 'SEMI_ANNUAL_STATE_COST', 'STATE_UTILITY',
+              'DISCOUNT', 'AGE_DEPENDENT_MORTALITY', 'AGE_AT_START', 'SEX', 'LIFE_TABLE_FILE', 'CYCLE_LENGTH',
+              'BASE_CYCLE_LENGTH', 'RNG_BLOCK_SIZE')
 
 
 class Parameters:
@@ -12,11 +17,17 @@ class Parameters:
 
         self.therapy = therapy              # selected therapy
         self.initialHealthState = data.HealthStates.PREDEM     # initial health state
+        self.age = data.AGE_AT_START        # age of patients at the start of simulation
+        self.sex = data.SEX                 # sex of patients
+        self.ifAgeDependentMortality = data.AGE_DEPENDENT_MORTALITY  # if background mortality increases with age
         self.annualTreatmentCost = 0        # annual treatment cost
         self.probMatrix = []                # transition probability matrix of the selected therapy
         self.semiAnnualStateCosts = []          # annual state costs
         self.stateUtilities = []      # annual state utilities
         self.discountRate = data.DISCOUNT   # discount rate
+        self.cycleLength = data.CYCLE_LENGTH    # length of a time-step (years) (inputs are per BASE_CYCLE_LENGTH)
+        self.probMatrices = None            # transition probability matrices of each time-step (built on first use)
+        self.transitionSampler = None       # transition sampler shared by all patients (built on first use)
 
 class ParameterGenerator:
     """ class to generate parameter values from the selected probability distributions """
@@ -72,11 +83,11 @@ class ParameterGenerator:
 
     def get_new_parameters(self, seed):
         """
-        :param seed: seed for the random number generator used to a sample of parameter values
+        :param seed: id of the PSA draw (its random number stream is derived from the root seed)
         :return: a new parameter set
         """
 
-        rng = np.random.RandomState(seed=seed)
+        rng = get_parameter_rng(draw_id=seed)
 
         # create a parameter set
         param = Parameters(therapy=self.therapy)
@@ -109,5 +120,11 @@ class ParameterGenerator:
         for dist in self.StateDisutilityRVGs:
             param.stateUtilities.append(dist.sample(rng))
 
+        # sample from gamma distributions that are assumed for the cost of each drug (both are sampled, so that
+        # draw i of both therapies uses the same values of the other parameters and of the drug costs)
+        dmt30_cost = self.annualDMT30CostRVG.sample(rng)
+        soc_cost = self.annualSOCCostRVG.sample(rng)
+        param.annualTreatmentCost = dmt30_cost if self.therapy == Therapies.DMT_30 else soc_cost
+
         # return the parameter set
         return param
@@ -2,8 +2,12 @@ import deampy.econ_eval as econ
 import deampy.plots.histogram as hist
 import deampy.plots.sample_paths as path
 import deampy.statistics as stat
+import matplotlib.pyplot as plt
+import numpy as np
 
+import BootstrapClasses as bootstrap
 import InputData as data
+from Support import plot_incremental_NMB
 
 
 def print_outcomes(multi_cohort_outcomes, therapy_name):
@@ -160,10 +164,13 @@ def print_comparative_outcomes(multi_cohort_outcomes_soc, multi_cohort_outcomes_
           .format(1 - data.ALPHA, prec=0), estimate_PI)
 
 
-def report_CEA_CBA(multi_cohort_outcomes_soc, multi_cohort_outcomes_dmt30):
+def report_CEA_CBA(multi_cohort_outcomes_soc, multi_cohort_outcomes_dmt30, n_bootstrap_samples=1000, n_threads=1):
     """ performs cost-effectiveness and cost-benefit analyses
     :param multi_cohort_outcomes_soc: outcomes of a multi-cohort simulated under SOC Donepezil treatment
     :param multi_cohort_outcomes_dmt30: outcomes of a multi-cohort simulated under DMT treatment
+    :param n_bootstrap_samples: number of paired bootstrap samples for the confidence intervals of the ICER and
+        the incremental net monetary benefit
+    :param n_threads: number of threads to evaluate the bootstrap samples
     """
 
     # define two strategies
@@ -197,28 +204,51 @@ def report_CEA_CBA(multi_cohort_outcomes_soc, multi_cohort_outcomes_dmt30):
         file_name='figs/cea_sensitivity.png')
 
     # report the CE table
-    CEA.build_CE_table(
+    costs = [multi_cohort_outcomes_soc.meanCosts, multi_cohort_outcomes_dmt30.meanCosts]
+    effects = [multi_cohort_outcomes_soc.meanQALYs, multi_cohort_outcomes_dmt30.meanQALYs]
+    bootstrap.write_CE_table(
+        names=[soc_therapy_strategy.name, dmt30_therapy_strategy.name],
+        costs=costs,
+        effects=effects,
         interval_type='p',  # uncertainty (projection) interval for cost and effect estimates but
                             # for ICER, confidence interval will be reported.
         alpha=data.ALPHA,
+        n_samples=n_bootstrap_samples,
+        n_threads=n_threads,
         cost_digits=0,
         effect_digits=2,
         icer_digits=2,
         file_name='CETable_sensitivity.csv')
 
-    # CBA
-    NBA = econ.CBA(
-        strategies=[soc_therapy_strategy, dmt30_therapy_strategy],
-        wtp_range=(0, 150000),
-        if_paired=True
-    )
     # show the net monetary benefit figure
-    NBA.plot_marginal_nmb_lines(
+    plot_incremental_NMB(
+        paired_bootstrap=bootstrap.PairedBootstrap(costs=costs, effects=effects, n_samples=n_bootstrap_samples,
+                                                   n_threads=n_threads),
         title='Cost-Benefit Analysis',
         x_label='Willingness-To-Pay per Additional QALY($)',
         y_label='Incremental Net Monetary Benefit ($)',
-        interval_type='c', # show confidence interval
-        show_legend=True,
-        figure_size=(6, 5),
         file_name='figs/nmb_sensitivity.png'
-    )
\ No newline at end of file
+    )
+
+
+def plot_convergence(monitor, file_name='figs/psa_convergence.png'):
+    """ plots the running mean and percentile interval of incremental outcomes against the number of PSA draws
+    :param monitor: a PSAConvergenceMonitor after the draws are recorded
+    :param file_name: name of the file to save the figure to
+    """
+
+    fig, axes = plt.subplots(len(monitor.OUTCOMES), 1, figsize=(6, 8), sharex=True)
+    n_draws = np.arange(1, monitor.get_n_draws() + 1)
+    for ax, name in zip(axes, monitor.OUTCOMES):
+        trace = np.array(monitor.trace[name])
+        ax.plot(n_draws, trace[:, 0], color='midnightblue', label='Mean')
+        ax.fill_between(n_draws, trace[:, 1], trace[:, 2], color='cornflowerblue', alpha=0.3,
+                        label='{:.{prec}%} uncertainty interval'.format(1 - monitor.alpha, prec=0))
+        if monitor.nDrawsToConverge is not None:
+            ax.axvline(monitor.nDrawsToConverge, color='black', linestyle='--', linewidth=1)
+        ax.set_ylabel(name)
+    axes[0].legend(fontsize='small')
+    axes[-1].set_xlabel('Number of PSA draws')
+    fig.tight_layout()
+    fig.savefig(file_name, dpi=300)
+    plt.close(fig)
@@ -0,0 +1,303 @@
+import collections
+import concurrent.futures as futures
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+
+import InputData as data
+import MarkovClasses as model
+from AnalyticClasses import CohortTrace
+from Checkpoints import to_json
+from OneWayClasses import INPUT_NAMES, get_base_inputs, get_scenario_parameters
+from ParameterClasses import Therapies
+
+# how a scenario is evaluated
+ANALYTIC = 'analytic'       # expected outcomes of cohort traces (milliseconds)
+SIMULATION = 'simulation'   # simulated cohorts in the worker pool
+
+MAX_POP_SIZE = 10 ** 7      # largest population size a request may simulate
+
+
+def _check_input_shape(name, value, base_value):
+    """ raises a ValueError if the value of an input is not a number where its base value is a number, or not a
+    list of the same length where its base value is a list (e.g. a utility for each health state) """
+
+    if isinstance(base_value, list):
+        if not isinstance(value, list) or len(value) != len(base_value):
+            raise ValueError(name + ' should be a list of ' + str(len(base_value)) + ' values.')
+        for i, (v, base_v) in enumerate(zip(value, base_value)):
+            _check_input_shape(name='{}[{}]'.format(name, i), value=v, base_value=base_v)
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(name + ' should be a number.')
+
+
+class ScenarioEvaluator:
+    """ evaluates what-if scenarios (inputs of InputData that differ from their base values) for both therapies;
+    keeps the parameter sets of recent scenarios, so their transition matrices and transition samplers are built
+    once, and the results of recent requests (evaluations are deterministic given the root seed) """
+
+    def __init__(self, cache_size=256):
+        """ :param cache_size: number of recent parameter sets and results to keep """
+
+        self.cacheSize = cache_size
+        self._parameters = collections.OrderedDict()    # parameter set by (inputs, therapy)
+        self._results = collections.OrderedDict()       # result by request
+        self._lock = threading.Lock()
+
+    def get_request(self, request):
+        """
+        :param request: (dict) a scenario request: 'inputs' (dict of input values by name in
+            OneWayClasses.INPUT_NAMES), 'method' (ANALYTIC or SIMULATION), 'n_time_steps', 'pop_size' and
+            'id' (of the simulated cohorts), and 'wtp' (willingness-to-pay per QALY)
+        :return: (dict) the request with default values for missing entries
+        """
+
+        if not isinstance(request, dict):
+            raise ValueError('A request should be a json object.')
+        unknown = set(request) - {'inputs', 'method', 'n_time_steps', 'pop_size', 'id', 'wtp'}
+        if unknown:
+            raise ValueError('Unknown entries of the request: ' + ', '.join(sorted(unknown)) + '.')
+        inputs = request.get('inputs', {})
+        if not isinstance(inputs, dict):
+            raise ValueError('The inputs of a request should be a json object of input values by name.')
+        unknown = set(inputs) - set(INPUT_NAMES)
+        if unknown:
+            raise ValueError('Unknown inputs: ' + ', '.join(sorted(unknown)) + ' (inputs are '
+                             + ', '.join(INPUT_NAMES) + ').')
+        base_inputs = get_base_inputs()
+        for name, value in inputs.items():
+            _check_input_shape(name=name, value=value, base_value=base_inputs[name])
+
+        request = {'inputs': inputs, 'method': request.get('method', ANALYTIC),
+                   'n_time_steps': int(request.get('n_time_steps', data.SIM_TIME_STEPS)),
+                   'pop_size': int(request.get('pop_size', data.POP_SIZE)), 'id': int(request.get('id', 0)),
+                   'wtp': float(request.get('wtp', data.WTP))}
+        if request['method'] not in (ANALYTIC, SIMULATION):
+            raise ValueError('Method should be ' + ANALYTIC + ' or ' + SIMULATION + '.')
+        if not 0 < request['n_time_steps'] <= 1000 or not 0 < request['pop_size'] <= MAX_POP_SIZE:
+            raise ValueError('n_time_steps should be between 1 and 1000 and pop_size between 1 and '
+                             + str(MAX_POP_SIZE) + '.')
+        return request
+
+    def get_cached_result(self, request):
+        """ :return: the result of an earlier identical request (see get_request) or None """
+
+        with self._lock:
+            key = json.dumps(request, sort_keys=True)
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        return None
+
+    def cache_result(self, request, result):
+        """ keeps the result of a request (see get_request) """
+
+        self._put(self._results, json.dumps(request, sort_keys=True), result)
+
+    def get_parameters(self, inputs, therapy):
+        """
+        :param inputs: (dict) input values that differ from their base values
+        :param therapy: a therapy
+        :return: parameter set of the therapy under these inputs (shared by requests with the same inputs)
+        """
+
+        key = (json.dumps(inputs, sort_keys=True), therapy)
+        with self._lock:
+            if key in self._parameters:
+                self._parameters.move_to_end(key)
+                return self._parameters[key]
+        base_inputs = get_base_inputs()
+        base_inputs.update(inputs)
+        parameters = get_scenario_parameters(inputs=base_inputs, therapy=therapy)
+        self._put(self._parameters, key, parameters)
+        return parameters
+
+    def _put(self, cache, key, value):
+        """ adds a value to a cache and drops the least recently used values beyond the cache size """
+
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cacheSize:
+                cache.popitem(last=False)
+
+    def evaluate(self, request):
+        """
+        :param request: (dict) a scenario request (see get_request)
+        :return: (dict) outcomes of each therapy and cost-effectiveness of DMT with respect to donepezil
+        """
+
+        request = self.get_request(request)
+        outcomes = {}
+        for therapy in (Therapies.SOC, Therapies.DMT_30):
+            parameters = self.get_parameters(inputs=request['inputs'], therapy=therapy)
+            if request['method'] == ANALYTIC:
+                outcomes[therapy.name] = self._evaluate_trace(parameters, request)
+            else:
+                outcomes[therapy.name] = self._evaluate_cohort(parameters, request)
+
+        soc, dmt = outcomes[Therapies.SOC.name], outcomes[Therapies.DMT_30.name]
+        for therapy_outcomes in outcomes.values():
+            therapy_outcomes['NMB'] = request['wtp'] * therapy_outcomes['QALY'] - therapy_outcomes['cost']
+        incremental_cost = dmt['cost'] - soc['cost']
+        incremental_effect = dmt['QALY'] - soc['QALY']
+        return {'request': request, 'outcomes': outcomes,
+                'incremental cost': incremental_cost, 'incremental QALY': incremental_effect,
+                'ICER': incremental_cost / incremental_effect if incremental_effect != 0 else None,
+                'incremental NMB': request['wtp'] * incremental_effect - incremental_cost}
+
+    @staticmethod
+    def _evaluate_trace(parameters, request):
+        """ :return: (dict) expected outcomes of a cohort trace """
+
+        trace = CohortTrace(parameters=parameters)
+        trace.simulate(n_time_steps=request['n_time_steps'])
+        return {'cost': trace.expectedCost, 'QALY': trace.expectedUtility,
+                'mean survival time': trace.get_mean_survival_time(),
+                'mean time to SEVERE': trace.get_mean_time_to_severe(),
+                'probability of death': float(trace.probDeath.sum()),
+                'probability of SEVERE': float(trace.probSEVERE.sum())}
+
+    @staticmethod
+    def _evaluate_cohort(parameters, request):
+        """ :return: (dict) mean outcomes of a simulated cohort with the confidence intervals of cost and QALY """
+
+        cohort = model.Cohort(id=request['id'], pop_size=request['pop_size'], parameters=parameters,
+                              memory_budget=data.MEMORY_BUDGET)
+        cohort.simulate(n_time_steps=request['n_time_steps'])
+        outcomes = cohort.cohortOutcomes
+        return {'cost': outcomes.statCost.get_mean(), 'QALY': outcomes.statUtilities.get_mean(),
+                'cost CI': list(outcomes.statCost.get_t_CI(alpha=data.ALPHA)),
+                'QALY CI': list(outcomes.statUtilities.get_t_CI(alpha=data.ALPHA)),
+                'mean survival time': outcomes.statSurvivalTimes.get_mean(),
+                'mean time to SEVERE': outcomes.statTimeToSEVERE.get_mean(),
+                'probability of death': float(outcomes.nDeaths.sum() / request['pop_size'])}
+
+
+# evaluator of a worker process of the pool (parameter sets are cached across the requests of a worker)
+_evaluator = None
+
+
+def _init_worker(cache_size):
+    """ creates the evaluator of a worker process """
+
+    global _evaluator
+    _evaluator = ScenarioEvaluator(cache_size=cache_size)
+
+
+def _evaluate_in_worker(request):
+    """ :return: evaluation of the request by the evaluator of this worker process """
+    return _evaluator.evaluate(request)
+
+
+class ScenarioRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ answers GET /health and POST /evaluate (a json scenario request, see ScenarioEvaluator.get_request)
+    with json """
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send(404, {'error': 'Unknown path ' + self.path + '.'})
+            return
+        self._send(200, {'status': 'ok', 'workers': self.server.nWorkers, 'inputs': get_base_inputs()})
+
+    def do_POST(self):
+        if self.path != '/evaluate':
+            self._send(404, {'error': 'Unknown path ' + self.path + '.'})
+            return
+
+        start = time.perf_counter()
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            result = self.server.evaluate(json.loads(body or b'{}'))
+        except (ValueError, TypeError) as error:
+            self._send(400, {'error': str(error)})
+            return
+        except Exception as error:
+            self._send(500, {'error': '{}: {}'.format(type(error).__name__, error)})
+            return
+        self._send(200, dict(result, milliseconds=1000 * (time.perf_counter() - start)))
+
+    def _send(self, status, content):
+        body = json.dumps(content, default=to_json).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _ScenarioServerMixin:
+    """ the evaluation of requests shared by the TCP and Unix socket servers: analytic requests are answered in
+    the thread of the request (each request has its own thread), simulation requests by the worker pool """
+
+    daemon_threads = True
+
+    def setup_evaluation(self, n_workers, cache_size, verbose):
+        self.nWorkers = n_workers
+        self.verbose = verbose
+        self.evaluator = ScenarioEvaluator(cache_size=cache_size)
+        self.workers = futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                                   initargs=(cache_size, ))
+
+        # start the workers and build the parameter sets of the base scenario before the first request
+        self.evaluator.evaluate({})
+        list(self.workers.map(_evaluate_in_worker, [{'method': SIMULATION, 'pop_size': 1}] * n_workers))
+
+    def evaluate(self, request):
+        """ :return: evaluation of a scenario request (from the cache if it was evaluated before) """
+
+        request = self.evaluator.get_request(request)
+        result = self.evaluator.get_cached_result(request)
+        if result is None:
+            if request['method'] == ANALYTIC:
+                result = self.evaluator.evaluate(request)
+            else:
+                result = self.workers.submit(_evaluate_in_worker, request).result()
+            self.evaluator.cache_result(request, result)
+        return result
+
+    def server_close(self):
+        super().server_close()
+        self.workers.shutdown(cancel_futures=True)
+
+
+class ScenarioServer(_ScenarioServerMixin, socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """ scenario server on a local TCP port """
+
+    def __init__(self, host='127.0.0.1', port=8765, n_workers=None, cache_size=256, verbose=False):
+        """
+        :param host: address to listen on (local only by default)
+        :param port: port to listen on
+        :param n_workers: number of worker processes for simulation requests (number of CPUs by default)
+        :param cache_size: number of recent parameter sets and results to keep
+        :param verbose: set to True to log every request
+        """
+        self.setup_evaluation(n_workers=n_workers or os.cpu_count(), cache_size=cache_size, verbose=verbose)
+        super().__init__((host, port), ScenarioRequestHandler)
+
+
+class UnixScenarioServer(_ScenarioServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ scenario server on a Unix socket """
+
+    def __init__(self, socket_file, n_workers=None, cache_size=256, verbose=False):
+        """
+        :param socket_file: path of the socket (replaced if it exists)
+        :param n_workers: number of worker processes for simulation requests (number of CPUs by default)
+        :param cache_size: number of recent parameter sets and results to keep
+        :param verbose: set to True to log every request
+        """
+        if os.path.exists(socket_file):
+            os.remove(socket_file)
+        self.setup_evaluation(n_workers=n_workers or os.cpu_count(), cache_size=cache_size, verbose=verbose)
+        super().__init__(socket_file, ScenarioRequestHandler)
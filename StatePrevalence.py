@@ -0,0 +1,29 @@
+import InputData as data
+import MarkovClassesSensitivity as model
+import SensitivityParamClasses as param
+import Support as support
+
+N_COHORTS = 200     # number of PSA draws
+POP_SIZE = 1000     # population size of each cohort
+
+for therapy, label in [(param.Therapies.SOC, 'soc'), (param.Therapies.DMT_30, 'dmt')]:
+    # simulate the cohorts of the PSA draws
+    multiCohort = model.MultiCohort(
+        ids=range(N_COHORTS),
+        pop_sizes=POP_SIZE,
+        parameters=therapy)
+    multiCohort.simulate(n_time_steps=data.SIM_TIME_STEPS)
+
+    # proportion of patients in each health state over time (mean and uncertainty band across draws)
+    prevalence = multiCohort.multiCohortOutcomes.get_state_prevalence(alpha=data.ALPHA)
+    support.plot_state_prevalence(prevalence=prevalence,
+                                  title='State Prevalence ({})'.format(therapy.name),
+                                  file_name='figs/{}/state_prevalence.png'.format(label))
+    support.write_state_prevalence(prevalence=prevalence,
+                                   file_name='StatePrevalence_{}.csv'.format(label))
+
+    print(therapy)
+    severe = data.HealthStates.SEVERE.value
+    print('  Proportion of patients in SEVERE state at the end of simulation: {:.3f} ({:.{prec}%} interval: {:.3f}, {:.3f})'
+          .format(prevalence[0][severe, -1], 1 - data.ALPHA, prevalence[1][severe, -1], prevalence[2][severe, -1],
+                  prec=0))
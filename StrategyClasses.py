@@ -0,0 +1,152 @@
+import InputData as data
+from MarkovClasses import CohortOutcomes, PatientBatch, get_chunk_size, get_chunk_uniforms
+from ParameterClasses import Parameters, Therapies
+from RandomStreams import get_population_block_rng
+
+
+class Strategy:
+    """ a treatment strategy: disease modifying treatment at a given effectiveness and price, started in a
+    given stage (no effect corresponds to standard of care) """
+
+    def __init__(self, name, relative_risk, treatment_cost, color=None, initial_state=None):
+        """
+        :param name: name of the strategy
+        :param relative_risk: effectiveness of the treatment (0 for standard of care)
+        :param treatment_cost: treatment cost per time-step
+        :param color: color of the strategy in figures
+        :param initial_state: health state in which treatment starts (None: the initial state of the comparison)
+        """
+        self.name = name
+        self.relativeRisk = relative_risk
+        self.treatmentCost = treatment_cost
+        self.color = color
+        self.initialState = initial_state
+
+    def get_parameters(self, initial_state=data.HealthStates.PREDEM):
+        """
+        :param initial_state: health state in which patients start if the strategy does not set its own
+        :return: parameter set of this strategy
+        """
+
+        param = Parameters(therapy=Therapies.SOC if self.relativeRisk == 0 else Therapies.DMT_30)
+        param.initialHealthState = initial_state if self.initialState is None else self.initialState
+        param.annualTreatmentCost = self.treatmentCost
+        param.probMatrix = data.get_trans_prob_matrix_dmt_30(
+            trans_prob_matrix_soc=data.get_trans_prob_matrix(trans_matrix=data.TRANS_MATRIX),
+            relative_risk_dmt=self.relativeRisk)
+        return param
+
+
+# registry of strategies by name
+STRATEGIES = {}
+
+
+def register_strategy(strategy):
+    """ :param strategy: a strategy to add to (or replace in) the registry """
+    STRATEGIES[strategy.name] = strategy
+
+
+register_strategy(Strategy(name='Donepezil', relative_risk=0, treatment_cost=data.SOC_COST,
+                           color='cornflowerblue'))
+register_strategy(Strategy(name='Disease Modifying Treatment at 30% effectiveness', relative_risk=data.RR_DMT,
+                           treatment_cost=data.DMT30_COST, color='midnightblue'))
+
+
+class StrategyComparison:
+    """ simulates any number of strategies over the same patient population (the same random numbers drive
+    every strategy); outcomes are kept per strategy, so adding a strategy does not rerun the others """
+
+    def __init__(self, id, pop_size, initial_state=data.HealthStates.PREDEM, memory_budget=data.MEMORY_BUDGET):
+        """
+        :param id: id of the patient population
+        :param pop_size: population size
+        :param initial_state: health state in which patients start under strategies that do not set their own
+            (strategies started in different stages are compared over the same random numbers)
+        :param memory_budget: (float) megabytes of memory the simulation of a chunk of patients may use
+        """
+        self.id = id
+        self.popSize = pop_size
+        self.initialState = initial_state
+        self.memoryBudget = memory_budget
+        self.strategyOutcomes = {}    # outcomes (CohortOutcomes) of each simulated strategy by name
+
+    def simulate(self, strategy_names, n_time_steps):
+        """ simulates the strategies not simulated yet in one pass over the patient population
+        :param strategy_names: (list) names of registered strategies
+        :param n_time_steps: simulation length
+        """
+
+        new_names = [name for name in strategy_names if name not in self.strategyOutcomes]
+        if len(new_names) == 0:
+            return
+
+        params = [STRATEGIES[name].get_parameters(initial_state=self.initialState) for name in new_names]
+        outcomes = [CohortOutcomes() for _ in new_names]
+
+        chunk_size = get_chunk_size(memory_budget=self.memoryBudget / len(new_names), n_time_steps=n_time_steps)
+        for chunk_start in range(0, self.popSize, chunk_size):
+            n_patients = min(chunk_size, self.popSize - chunk_start)
+            uniforms = get_chunk_uniforms(
+                get_block_rng=lambda block_id: get_population_block_rng(cohort_id=self.id, block_id=block_id),
+                chunk_start=chunk_start, n_patients=n_patients, n_time_steps=n_time_steps)
+
+            # every strategy is simulated with the same random numbers
+            for param, outcome in zip(params, outcomes):
+                batch = PatientBatch(parameters=param, n_patients=n_patients)
+                batch.simulate(n_time_steps=n_time_steps, uniforms=uniforms)
+                outcome.extract_batch_outcomes(simulated_batch=batch, n_time_steps=n_time_steps)
+
+        for name, outcome in zip(new_names, outcomes):
+            outcome.calculate_cohort_outcomes(initial_pop_size=self.popSize)
+            self.strategyOutcomes[name] = outcome
+
+
+def get_efficient_frontier(names, costs, effects):
+    """
+    :param names: (list) names of strategies
+    :param costs: (list) expected cost of each strategy
+    :param effects: (list) expected effect (QALY) of each strategy
+    :return: (list) of dictionaries, one per strategy in the order of increasing cost, with keys
+        'name', 'cost', 'effect', 'status' ('frontier', 'dominated' or 'extendedly dominated'),
+        and for strategies on the frontier, 'incremental cost', 'incremental effect' and 'ICER' with respect
+        to the previous strategy on the frontier
+    """
+
+    rows = [{'name': n, 'cost': float(c), 'effect': float(e), 'status': 'frontier'}
+            for n, c, e in zip(names, costs, effects)]
+    rows.sort(key=lambda row: (row['cost'], -row['effect']))
+
+    # strong dominance: another strategy costs no more and is at least as effective; of strategies with the same
+    # cost and effect (e.g. identical parameters simulated with common random numbers), the first one listed
+    # stays and the others are dominated by it
+    for i, row in enumerate(rows):
+        for j, other in enumerate(rows):
+            if j != i and other['cost'] <= row['cost'] and other['effect'] >= row['effect'] \
+                    and (other['cost'] < row['cost'] or other['effect'] > row['effect'] or j < i):
+                row['status'] = 'dominated'
+                break
+
+    # extended dominance: remove strategies whose ICER is higher than that of the next strategy
+    frontier = [row for row in rows if row['status'] == 'frontier']
+    removed = True
+    while removed and len(frontier) > 2:
+        removed = False
+        icers = [(frontier[i]['cost'] - frontier[i - 1]['cost']) / (frontier[i]['effect'] - frontier[i - 1]['effect'])
+                 for i in range(1, len(frontier))]
+        for i in range(len(icers) - 1):
+            if icers[i] > icers[i + 1]:
+                frontier[i + 1]['status'] = 'extendedly dominated'
+                del frontier[i + 1]
+                removed = True
+                break
+
+    # incremental outcomes along the frontier
+    for i, row in enumerate(frontier):
+        if i == 0:
+            row['incremental cost'], row['incremental effect'], row['ICER'] = None, None, None
+        else:
+            row['incremental cost'] = row['cost'] - frontier[i - 1]['cost']
+            row['incremental effect'] = row['effect'] - frontier[i - 1]['effect']
+            row['ICER'] = row['incremental cost'] / row['incremental effect']
+
+    return rows
@@ -1,9 +1,15 @@
+import csv
+
 import deampy.econ_eval as econ
 import deampy.plots.histogram as hist
 import deampy.plots.sample_paths as path
 import deampy.statistics as stat
+import matplotlib.pyplot as plt
+import numpy as np
 
+import BootstrapClasses as bootstrap
 import InputData as data
+from StrategyClasses import get_efficient_frontier
 
 
 def print_outcomes(sim_outcomes, therapy_name):
@@ -40,6 +46,19 @@ def print_outcomes(sim_outcomes, therapy_name):
     print("")
 
 
+def print_stratified_outcomes(stratified_cohort, therapy_name):
+    """ prints the pooled outcomes of a simulated stratified cohort and the outcomes of each stratum
+    :param stratified_cohort: a simulated StratifiedCohort
+    :param therapy_name: the name of the selected therapy
+    """
+
+    print_outcomes(sim_outcomes=stratified_cohort.cohortOutcomes,
+                   therapy_name='{} (pooled over strata)'.format(therapy_name))
+    for stratum, outcomes in zip(stratified_cohort.strata, stratified_cohort.stratumOutcomes):
+        print_outcomes(sim_outcomes=outcomes,
+                       therapy_name='{}: {} ({:.0%} of patients)'.format(therapy_name, stratum.name, stratum.share))
+
+
 def plot_survival_curves_and_histograms(sim_outcomes_soc, sim_outcomes_dmt):
     """ draws the survival curves and the histograms of time until HIV deaths
     :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
@@ -221,10 +240,11 @@ def print_comparative_outcomes(sim_outcomes_soc, sim_outcomes_dmt):
           .format(1 - data.ALPHA, prec=0), estimate_CI)
 
 
-def report_CEA_CBA(sim_outcomes_soc, sim_outcomes_dmt):
-    """ performs cost-effectiveness and cost-benefit analyses
+def get_CE_strategies(sim_outcomes_soc, sim_outcomes_dmt):
+    """
     :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
     :param sim_outcomes_dmt: outcomes of a cohort simulated under combination therapy
+    :return: (list) strategies to compare (the first is the 'Base' strategy)
     """
 
     # define two strategies
@@ -240,11 +260,20 @@ def report_CEA_CBA(sim_outcomes_soc, sim_outcomes_dmt):
         effect_obs=sim_outcomes_dmt.utilities,
         color='midnightblue'
     )
+    return [soc_therapy_strategy, dmt_therapy_strategy]
+
+
+def plot_CE_plane(sim_outcomes_soc, sim_outcomes_dmt, file_name='figs/cea/cea.png'):
+    """ plots the cost-effectiveness plane
+    :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
+    :param sim_outcomes_dmt: outcomes of a cohort simulated under combination therapy
+    :param file_name: file to save the figure in
+    """
 
     # do CEA
     # (the first strategy in the list of strategies is assumed to be the 'Base' strategy)
     CEA = econ.CEA(
-        strategies=[soc_therapy_strategy, dmt_therapy_strategy],
+        strategies=get_CE_strategies(sim_outcomes_soc=sim_outcomes_soc, sim_outcomes_dmt=sim_outcomes_dmt),
         if_paired=True
     )
 
@@ -254,31 +283,360 @@ def report_CEA_CBA(sim_outcomes_soc, sim_outcomes_dmt):
         x_label='Additional QALYs',
         y_label='Additional Cost',
         interval_type='c',  # to show confidence intervals for cost and effect of each strategy
-        file_name='figs/cea/cea.png'
+        file_name=file_name
     )
 
-    # report the CE table
-    CEA.build_CE_table(
+
+def write_CE_table(sim_outcomes_soc, sim_outcomes_dmt, file_name='CETable.csv', n_bootstrap_samples=1000,
+                   n_threads=1):
+    """ writes the cost-effectiveness table
+    :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
+    :param sim_outcomes_dmt: outcomes of a cohort simulated under combination therapy
+    :param file_name: csv file to write the table in
+    :param n_bootstrap_samples: number of paired bootstrap samples for the confidence interval of the ICER
+    :param n_threads: number of threads to evaluate the bootstrap samples
+    """
+
+    bootstrap.write_CE_table(
+        names=['Donepezil', 'Disease Modifying Treatment at 30% effectiveness'],
+        costs=[sim_outcomes_soc.costs, sim_outcomes_dmt.costs],
+        effects=[sim_outcomes_soc.utilities, sim_outcomes_dmt.utilities],
         interval_type='c',
         alpha=data.ALPHA,
+        n_samples=n_bootstrap_samples,
+        n_threads=n_threads,
         cost_digits=0,
         effect_digits=2,
         icer_digits=2,
-        file_name='CETable.csv')
+        file_name=file_name)
 
-    # CBA
-    CBA = econ.CBA(
-        strategies=[soc_therapy_strategy, dmt_therapy_strategy],
-        wtp_range=[0, 150000],
-        if_paired=True
-    )
-    # show the net monetary benefit figure
-    CBA.plot_marginal_nmb_lines(
+
+def plot_NMB_lines(sim_outcomes_soc, sim_outcomes_dmt, file_name='figs/cea/nmb.png', n_bootstrap_samples=1000,
+                   n_threads=1):
+    """ plots the marginal net monetary benefit over a range of willingness-to-pay values
+    :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
+    :param sim_outcomes_dmt: outcomes of a cohort simulated under combination therapy
+    :param file_name: file to save the figure in
+    :param n_bootstrap_samples: number of paired bootstrap samples for the confidence band
+    :param n_threads: number of threads to evaluate the bootstrap samples
+    """
+
+    plot_incremental_NMB(
+        paired_bootstrap=bootstrap.PairedBootstrap(
+            costs=[sim_outcomes_soc.costs, sim_outcomes_dmt.costs],
+            effects=[sim_outcomes_soc.utilities, sim_outcomes_dmt.utilities],
+            n_samples=n_bootstrap_samples, n_threads=n_threads),
         title='Cost-Benefit Analysis',
         x_label='Willingness-to-pay per QALY ($)',
         y_label='Marginal Net Monetary Benefit ($)',
+        file_name=file_name
+    )
+
+
+def plot_incremental_NMB(paired_bootstrap, title, x_label, y_label, wtp_range=(0, 150000),
+                         legend='Disease Modifying Treatment at 30% effectiveness', color='midnightblue',
+                         file_name='figs/cea/nmb.png'):
+    """ plots the incremental net monetary benefit of DMT with respect to donepezil over a grid of
+    willingness-to-pay values with its bootstrap confidence band
+    :param paired_bootstrap: PairedBootstrap of donepezil (strategy 0) and DMT (strategy 1)
+    :param title: title of the figure
+    :param x_label: x-axis label
+    :param y_label: y-axis label
+    :param wtp_range: range of willingness-to-pay values
+    :param legend: legend of the line
+    :param color: color of the line and the band
+    :param file_name: name of the file to save the figure to
+    """
+
+    wtp_values = np.linspace(wtp_range[0], wtp_range[1], 101)
+    mean, lower, upper = paired_bootstrap.get_incremental_NMB(new=1, base=0, wtp_values=wtp_values, alpha=data.ALPHA)
+
+    fig, ax = plt.subplots(figsize=(6, 5))
+    ax.plot(wtp_values, mean, color=color, label=legend)
+    ax.fill_between(wtp_values, lower, upper, color=color, alpha=0.2)
+    ax.axhline(0, color='black', linestyle='--', linewidth=0.5)
+    ax.set_title(title)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_xlim(wtp_range)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(file_name, dpi=300)
+    plt.close(fig)
+
+
+def report_CEA_CBA(sim_outcomes_soc, sim_outcomes_dmt):
+    """ performs cost-effectiveness and cost-benefit analyses
+    :param sim_outcomes_soc: outcomes of a cohort simulated under mono therapy
+    :param sim_outcomes_dmt: outcomes of a cohort simulated under combination therapy
+    """
+
+    plot_CE_plane(sim_outcomes_soc=sim_outcomes_soc, sim_outcomes_dmt=sim_outcomes_dmt)
+    write_CE_table(sim_outcomes_soc=sim_outcomes_soc, sim_outcomes_dmt=sim_outcomes_dmt)
+    plot_NMB_lines(sim_outcomes_soc=sim_outcomes_soc, sim_outcomes_dmt=sim_outcomes_dmt)
+
+
+def plot_exact_time_distributions(dist_soc, dist_dmt, x_label, file_name):
+    """ draws the exact probability mass functions of a time-to-event outcome under both therapies
+    (replaces the histograms of simulated times)
+    :param dist_soc: exact distribution (AnalyticClasses.FirstPassageTime) under donepezil
+    :param dist_dmt: exact distribution (AnalyticClasses.FirstPassageTime) under disease modifying treatment
+    :param x_label: label of the x-axis
+    :param file_name: name of the file to save the figure to
+    """
+
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for dist, legend, color in zip([dist_soc, dist_dmt],
+                                   ['Donepezil', 'Disease Modifying Treatment at 30% effectiveness'],
+                                   ['cornflowerblue', 'midnightblue']):
+        times, pmf = dist.get_pmf()
+        ax.bar(times, pmf, width=1, alpha=0.5, color=color, label=legend)
+
+    ax.set_xlabel(x_label)
+    ax.set_ylabel('Probability')
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(file_name, dpi=300)
+    plt.close(fig)
+
+
+def report_strategies_CEA(strategy_comparison, strategies, file_name='CETable_strategies.csv'):
+    """ reports the cost-effectiveness frontier of any number of strategies
+    :param strategy_comparison: a simulated StrategyComparison
+    :param strategies: (list) of strategies (StrategyClasses.Strategy) simulated in strategy_comparison;
+        the first one is the base strategy of the cost-effectiveness plane
+    :param file_name: csv file to write the frontier table to
+    """
+
+    outcomes = [strategy_comparison.strategyOutcomes[s.name] for s in strategies]
+    rows = get_efficient_frontier(names=[s.name for s in strategies],
+                                  costs=[o.statCost.get_mean() for o in outcomes],
+                                  effects=[o.statUtilities.get_mean() for o in outcomes])
+
+    def format_or_dash(value, deci):
+        return '-' if value is None else '{:,.{deci}f}'.format(value, deci=deci)
+
+    # print and write the frontier table
+    header = ['Strategy', 'Cost', 'Effect', 'Status', 'Incremental Cost', 'Incremental Effect', 'ICER']
+    table = [[row['name'], format_or_dash(row['cost'], 0), format_or_dash(row['effect'], 2), row['status'],
+              format_or_dash(row.get('incremental cost'), 0), format_or_dash(row.get('incremental effect'), 2),
+              format_or_dash(row.get('ICER'), 2)] for row in rows]
+    print('Cost-effectiveness frontier:')
+    for line in table:
+        print('  ' + ' | '.join(line))
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(table)
+
+    # cost-effectiveness plane of all strategies
+    CEA = econ.CEA(
+        strategies=[econ.Strategy(name=s.name, cost_obs=o.costs, effect_obs=o.utilities, color=s.color)
+                    for s, o in zip(strategies, outcomes)],
+        if_paired=True
+    )
+    CEA.plot_CE_plane(
+        title='Cost-Effectiveness Analysis',
+        x_label='Additional QALYs',
+        y_label='Additional Cost',
         interval_type='c',
-        show_legend=True,
-        figure_size=(6, 5),
-        file_name='figs/cea/nmb.png'
+        file_name='figs/cea/cea_strategies.png'
     )
+
+
+def plot_state_prevalence(prevalence, title, file_name):
+    """ draws the proportion of patients in each health state over time with its uncertainty band
+    :param prevalence: (mean, lower, upper) arrays of shape (n_states, n_time_steps) as returned by
+        get_state_prevalence of multi-cohort outcomes
+    :param title: title of the figure
+    :param file_name: name of the file to save the figure to
+    """
+
+    mean, lower, upper = prevalence
+    years = (np.arange(mean.shape[1]) + 1) * data.CYCLE_LENGTH
+
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for state in data.HealthStates:
+        line, = ax.plot(years, mean[state.value], label=state.name)
+        ax.fill_between(years, lower[state.value], upper[state.value], color=line.get_color(), alpha=0.2)
+
+    ax.set_title(title)
+    ax.set_xlabel('Simulation time (year)')
+    ax.set_ylabel('Proportion of patients')
+    ax.set_ylim(0, 1)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(file_name, dpi=300)
+    plt.close(fig)
+
+
+def write_state_prevalence(prevalence, file_name):
+    """ writes the proportion of patients in each health state at the end of each time-step to a csv file
+    :param prevalence: (mean, lower, upper) arrays of shape (n_states, n_time_steps) as returned by
+        get_state_prevalence of multi-cohort outcomes
+    :param file_name: csv file to write the prevalence table to
+    """
+
+    mean, lower, upper = prevalence
+    header = ['Time-step', 'Year']
+    for state in data.HealthStates:
+        header += [state.name, state.name + ' lower', state.name + ' upper']
+
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for k in range(mean.shape[1]):
+            row = [k + 1, (k + 1) * data.CYCLE_LENGTH]
+            for state in data.HealthStates:
+                row += ['{:.4f}'.format(v) for v in (mean[state.value, k], lower[state.value, k], upper[state.value, k])]
+            writer.writerow(row)
+
+
+def report_one_way_sensitivity(one_way, n_parameters=None, file_name='OneWaySensitivity.csv',
+                               fig_file_name='figs/cea/tornado.png'):
+    """ writes the ranked table and draws the tornado diagram of a one-way sensitivity analysis
+    :param one_way: an evaluated OneWaySensitivity
+    :param n_parameters: number of inputs with the largest swing to show in the tornado diagram (None: all)
+    :param file_name: csv file to write the ranked table to
+    :param fig_file_name: name of the file to save the tornado diagram to
+    """
+
+    base_icer = one_way.baseOutcomes['ICER']
+    rows = one_way.get_ranked_results()
+
+    # ranked table
+    header = ['Rank', 'Parameter', 'Base Value', 'Low Value', 'High Value', 'ICER at Low', 'ICER at High', 'Swing']
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for rank, row in enumerate(rows, start=1):
+            writer.writerow([rank, row['parameter'], row['base value'], row['low value'], row['high value'],
+                             '{:.2f}'.format(row['ICER at low']), '{:.2f}'.format(row['ICER at high']),
+                             '{:.2f}'.format(row['swing'])])
+    print('Base ICER: {:,.2f}'.format(base_icer))
+    print('Inputs ranked by their influence on the ICER:')
+    for rank, row in enumerate(rows, start=1):
+        print('  {}. {}: {:,.2f} to {:,.2f}'.format(rank, row['parameter'], row['ICER at low'], row['ICER at high']))
+
+    # tornado diagram (largest swing on top)
+    rows = rows[:n_parameters][::-1]
+    fig, ax = plt.subplots(figsize=(7, 0.3 * len(rows) + 1.5))
+    y = np.arange(len(rows))
+    for value_key, color, label in [('ICER at low', 'cornflowerblue', 'Low value'),
+                                    ('ICER at high', 'midnightblue', 'High value')]:
+        values = np.array([row[value_key] for row in rows])
+        ax.barh(y, values - base_icer, left=base_icer, color=color, label=label)
+    ax.axvline(base_icer, color='black', linewidth=1)
+    ax.set_yticks(y)
+    ax.set_yticklabels([row['parameter'] for row in rows], fontsize='small')
+    ax.set_xlabel('ICER ($ per QALY)')
+    ax.set_title('One-Way Sensitivity Analysis')
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(fig_file_name, dpi=300)
+    plt.close(fig)
+
+
+def report_calibration(calibration, matrix_file_name='CalibratedMatrix.csv', fit_file_name='CalibrationFit.csv',
+                       fig_file_name='figs/calibration_fit.png'):
+    """ prints and writes the calibrated transition probability matrix and the goodness of fit to the targets
+    :param calibration: a calibrated CalibrationClasses.Calibration
+    :param matrix_file_name: csv file to write the calibrated matrix to
+    :param fit_file_name: csv file to write the goodness of fit of each target to
+    :param fig_file_name: name of the file to save the figure of modeled and observed targets to
+    """
+
+    states = [s.name for s in data.HealthStates]
+
+    # calibrated matrix
+    print('Calibrated transition probability matrix:')
+    with open(matrix_file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['From / To'] + states)
+        for state, row in zip(states, calibration.calibratedMatrix):
+            writer.writerow([state] + ['{:.4f}'.format(p) for p in row])
+            print('  {:10s}'.format(state) + ' '.join('{:.4f}'.format(p) for p in row))
+
+    # goodness of fit
+    header = ['Outcome', 'Year', 'Target', 'St Dev', 'Initial Model', 'Calibrated Model', 'Z']
+    with open(fit_file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for row in calibration.fit:
+            writer.writerow([row['outcome'], row['year'], row['target'], row['st dev'],
+                             '{:.4f}'.format(row['initial model']), '{:.4f}'.format(row['calibrated model']),
+                             '{:.2f}'.format(row['z'])])
+    print('Chi-square of the targets: {:.2f} (initial matrix: {:.2f}) with {} targets'.format(
+        calibration.get_chi_square(), calibration.get_chi_square(matrix=calibration.initialMatrix),
+        len(calibration.targets)))
+    print('Generations of the optimizer: {}'.format(calibration.result.nit))
+
+    # modeled and observed targets
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for outcome, color in zip(sorted({row['outcome'] for row in calibration.fit}), ['midnightblue', 'firebrick']):
+        rows = [row for row in calibration.fit if row['outcome'] == outcome]
+        ax.errorbar([row['year'] for row in rows], [row['target'] for row in rows],
+                    yerr=[1.96 * row['st dev'] for row in rows], fmt='o', color=color, label=outcome + ' (target)')
+        ax.plot([row['year'] for row in rows], [row['initial model'] for row in rows], ':', color=color,
+                label=outcome + ' (initial)')
+        ax.plot([row['year'] for row in rows], [row['calibrated model'] for row in rows], '-', color=color,
+                label=outcome + ' (calibrated)')
+    ax.set_xlabel('Years since start of follow-up')
+    ax.set_ylabel('Proportion of patients')
+    ax.set_ylim(0, 1)
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(fig_file_name, dpi=300)
+    plt.close(fig)
+
+
+def report_budget_impact(budget_impacts, file_name='BudgetImpact.csv', fig_file_name='figs/budget_impact.png'):
+    """ reports the annual budget of each strategy for an open cohort and its difference from the first strategy
+    :param budget_impacts: (dict) simulated BudgetImpact of each strategy by name (the first one is the reference)
+    :param file_name: csv file to write the annual table to
+    :param fig_file_name: file to save the figure of annual costs in
+    """
+
+    names = list(budget_impacts)
+    reference = budget_impacts[names[0]]
+    years = np.arange(1, reference.get_n_years() + 1)
+    severe = data.HealthStates.SEVERE.value
+
+    header = ['Year', 'New patients']
+    for name in names:
+        header += [name + ' cost', name + ' treated', name + ' in SEVERE']
+    for name in names[1:]:
+        header += ['Budget impact of ' + name]
+
+    costs = {name: b.get_annual_costs() for name, b in budget_impacts.items()}
+    treated = {name: b.get_annual_treated() for name, b in budget_impacts.items()}
+    prevalence = {name: b.get_annual_prevalence() for name, b in budget_impacts.items()}
+    new_patients = np.add.reduceat(reference.entries, reference.get_year_index())
+
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for y in range(len(years)):
+            row = [years[y], new_patients[y]]
+            for name in names:
+                row += ['{:.0f}'.format(costs[name][y]), '{:.0f}'.format(treated[name][y]),
+                        '{:.0f}'.format(prevalence[name][severe, y])]
+            row += ['{:.0f}'.format(costs[name][y] - costs[names[0]][y]) for name in names[1:]]
+            writer.writerow(row)
+
+    print('Budget impact over {} years:'.format(len(years)))
+    for name in names:
+        print('  {}: total cost {:,.0f}'.format(name, costs[name].sum()))
+    for name in names[1:]:
+        print('  Budget impact of {}: {:,.0f}'.format(name, (costs[name] - costs[names[0]]).sum()))
+
+    fig, ax = plt.subplots(figsize=(6, 5))
+    for name in names:
+        ax.plot(years, costs[name], marker='o', label=name)
+    ax.set_title('Budget Impact')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Annual cost')
+    ax.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(fig_file_name, dpi=300)
+    plt.close(fig)
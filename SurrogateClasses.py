@@ -0,0 +1,178 @@
+import numpy as np
+
+import InputData as data
+
+# outcomes the surrogate model predicts (names of the lists of MultiCohortOutcomes)
+SURROGATE_OUTCOMES = ['meanCosts', 'meanQALYs', 'meanSurvivalTimes']
+
+
+def get_parameter_vector(param_set):
+    """
+    :param param_set: a parameter set (as sampled by ParameterGenerator)
+    :return: (numpy.array) parameter values as a vector: transition probabilities (row by row),
+        semi-annual state costs, state utilities, and the annual treatment cost
+    """
+
+    prob_matrix = np.asarray(param_set.probMatrix, dtype=float)[:len(data.HealthStates) - 1]
+    return np.concatenate((prob_matrix.ravel(),
+                           np.asarray(param_set.semiAnnualStateCosts, dtype=float),
+                           np.asarray(param_set.stateUtilities, dtype=float),
+                           [param_set.annualTreatmentCost]))
+
+
+def get_parameter_names():
+    """ :return: (list) names of the elements of the parameter vector """
+
+    states = [s.name for s in data.HealthStates]
+    names = ['P({}->{})'.format(i, j) for i in states[:-1] for j in states]
+    names += ['Cost of {}'.format(s) for s in states]
+    names += ['Utility of {}'.format(s) for s in states]
+    names += ['Annual treatment cost']
+    return names
+
+
+class Surrogate:
+    """ quadratic ridge regression emulator of the mean outcomes of a simulated cohort given its parameter
+    values (trained on PSA draws so that outcomes of new parameter values are predicted without simulation) """
+
+    def __init__(self, ridge_penalty=1e-2):
+        """
+        :param ridge_penalty: penalty on the squared coefficients (features are standardized)
+        """
+        self.ridgePenalty = ridge_penalty
+        self.outcomeNames = None    # names of the predicted outcomes
+        self.featureMask = None     # parameters that vary across training draws (constants are dropped)
+        self.featureMean = None     # mean and standard deviation to standardize the varying parameters
+        self.featureStDev = None
+        self.coefficients = None    # (number of terms, number of outcomes) regression coefficients
+        self.validationErrors = {}  # hold-out errors of each outcome
+        self._intercept = None      # coefficients arranged to evaluate a single parameter vector
+        self._linear = None
+        self._quadratic = None
+
+    def fit(self, parameter_vectors, outcomes, outcome_names, holdout_fraction=0.2, seed=data.SEED):
+        """ estimates the hold-out error of the emulator and then trains it on all draws
+        :param parameter_vectors: (numpy.array) parameter values of each draw with shape (n_draws, n_parameters)
+        :param outcomes: (numpy.array) outcomes of each draw with shape (n_draws, n_outcomes)
+        :param outcome_names: (list) names of the outcomes
+        :param holdout_fraction: fraction of draws held out to validate the emulator
+        :param seed: seed to select the hold-out draws
+        """
+
+        x = np.asarray(parameter_vectors, dtype=float)
+        y = np.asarray(outcomes, dtype=float)
+        self.outcomeNames = list(outcome_names)
+
+        # hold-out validation
+        order = np.random.default_rng(seed).permutation(len(x))
+        n_holdout = int(round(holdout_fraction * len(x)))
+        if n_holdout > 0:
+            holdout, train = order[:n_holdout], order[n_holdout:]
+            self._train(x[train], y[train])
+            errors = self.predict(x[holdout]) - y[holdout]
+            for j, name in enumerate(self.outcomeNames):
+                self.validationErrors[name] = {
+                    'RMSE': float(np.sqrt(np.mean(errors[:, j] ** 2))),
+                    'Mean absolute relative error': float(np.mean(np.abs(errors[:, j] / y[holdout, j]))),
+                    'R2': float(1 - np.sum(errors[:, j] ** 2) / np.sum((y[holdout, j] - y[holdout, j].mean()) ** 2))}
+
+        # final emulator uses all draws
+        self._train(x, y)
+
+    def _train(self, x, y):
+        """ solves the ridge regression of outcomes y on the quadratic terms of parameters x """
+
+        self.featureMask = np.ptp(x, axis=0) > 0
+        self.featureMean = x[:, self.featureMask].mean(axis=0)
+        self.featureStDev = x[:, self.featureMask].std(axis=0)
+
+        terms = self._get_terms(x)
+        penalty = self.ridgePenalty * len(terms) * np.eye(terms.shape[1])
+        penalty[0, 0] = 0   # the intercept is not penalized
+        self.coefficients = np.linalg.solve(terms.T @ terms + penalty, terms.T @ y)
+        self._build_quadratic_form()
+
+    def _build_quadratic_form(self):
+        """ rearranges the coefficients so that a single parameter vector is evaluated with two small
+        matrix products (no feature expansion) """
+
+        n = int(np.sum(self.featureMask))
+        rows, cols = np.triu_indices(n)
+        quadratic = np.zeros((n, n, self.coefficients.shape[1]))
+        quadratic[rows, cols] = self.coefficients[1 + n:]
+        self._intercept = self.coefficients[0]
+        self._linear = self.coefficients[1:1 + n]
+        self._quadratic = quadratic.reshape(n, -1)
+
+    def _get_terms(self, x):
+        """ :return: (numpy.array) intercept, linear, and quadratic terms of the standardized parameters """
+
+        z = (x[:, self.featureMask] - self.featureMean) / self.featureStDev
+        rows, cols = np.triu_indices(z.shape[1])
+        return np.hstack((np.ones((len(z), 1)), z, z[:, rows] * z[:, cols]))
+
+    def predict(self, parameter_vectors):
+        """
+        :param parameter_vectors: (numpy.array) parameter values with shape (n_parameters, ) or
+            (n_draws, n_parameters)
+        :return: (numpy.array) predicted outcomes with shape (n_outcomes, ) or (n_draws, n_outcomes)
+        """
+
+        x = np.asarray(parameter_vectors, dtype=float)
+        if x.ndim == 1:
+            z = (x[self.featureMask] - self.featureMean) / self.featureStDev
+            return self._intercept + z @ self._linear + z @ (z @ self._quadratic).reshape(len(z), -1)
+        return self._get_terms(x) @ self.coefficients
+
+    def predict_outcomes(self, param_set):
+        """
+        :param param_set: a parameter set
+        :return: (dict) predicted outcome of this parameter set by outcome name
+        """
+        return dict(zip(self.outcomeNames, self.predict(get_parameter_vector(param_set)).tolist()))
+
+    def save(self, file_name):
+        """ :param file_name: file (.npz) to save the trained emulator in """
+
+        np.savez(file_name,
+                 ridge_penalty=self.ridgePenalty,
+                 outcome_names=np.array(self.outcomeNames),
+                 feature_mask=self.featureMask,
+                 feature_mean=self.featureMean,
+                 feature_st_dev=self.featureStDev,
+                 coefficients=self.coefficients)
+
+    @staticmethod
+    def load(file_name):
+        """
+        :param file_name: file (.npz) the emulator was saved in
+        :return: the trained emulator
+        """
+
+        with np.load(file_name) as f:
+            surrogate = Surrogate(ridge_penalty=float(f['ridge_penalty']))
+            surrogate.outcomeNames = f['outcome_names'].tolist()
+            surrogate.featureMask = f['feature_mask']
+            surrogate.featureMean = f['feature_mean']
+            surrogate.featureStDev = f['feature_st_dev']
+            surrogate.coefficients = f['coefficients']
+        surrogate._build_quadratic_form()
+        return surrogate
+
+
+def train_surrogate(multi_cohort, holdout_fraction=0.2, ridge_penalty=1e-2):
+    """
+    :param multi_cohort: a simulated MultiCohort (of MarkovClassesSensitivity)
+    :param holdout_fraction: fraction of PSA draws held out to validate the emulator
+    :param ridge_penalty: penalty on the squared coefficients of the emulator
+    :return: the emulator trained on the parameter draws and outcomes of the simulated cohorts
+    """
+
+    parameter_vectors = np.array([get_parameter_vector(param_set) for param_set in multi_cohort.paramSets])
+    outcomes = np.column_stack([np.asarray(getattr(multi_cohort.multiCohortOutcomes, name), dtype=float)
+                                for name in SURROGATE_OUTCOMES])
+
+    surrogate = Surrogate(ridge_penalty=ridge_penalty)
+    surrogate.fit(parameter_vectors=parameter_vectors, outcomes=outcomes, outcome_names=SURROGATE_OUTCOMES,
+                  holdout_fraction=holdout_fraction)
+    return surrogate
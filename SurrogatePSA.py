@@ -0,0 +1,44 @@
+import os
+import time
+
+import InputData as data
+import MarkovClassesSensitivity as model
+import SensitivityParamClasses as param
+import SurrogateClasses as surrogate
+
+N_COHORTS = 300     # number of PSA draws to train the surrogate model on
+POP_SIZE = 500      # population size of each cohort
+N_PROCESSES = 4     # number of processes to simulate the cohorts
+SURROGATE_DIR = 'surrogates'   # directory of the saved surrogate models
+therapy = param.Therapies.DMT_30
+
+# simulate the PSA draws
+multiCohort = model.MultiCohort(
+    ids=range(N_COHORTS),
+    pop_sizes=POP_SIZE,
+    parameters=therapy)
+multiCohort.simulate(n_time_steps=data.SIM_TIME_STEPS, n_processes=N_PROCESSES)
+
+# train the surrogate model and report its hold-out error
+emulator = surrogate.train_surrogate(multi_cohort=multiCohort)
+for name, errors in emulator.validationErrors.items():
+    print('Hold-out error of', name)
+    for error_name, value in errors.items():
+        print('  {}: {:.4g}'.format(error_name, value))
+
+# save the surrogate model and load it back
+os.makedirs(SURROGATE_DIR, exist_ok=True)
+file_name = os.path.join(SURROGATE_DIR, 'surrogate_{}.npz'.format(therapy.name))
+emulator.save(file_name)
+emulator = surrogate.Surrogate.load(file_name)
+
+# predict the outcomes of a new parameter set
+new_params = multiCohort.paramGenerator.get_new_parameters(seed=N_COHORTS)
+print('Predicted outcomes of a new parameter set:', emulator.predict_outcomes(param_set=new_params))
+
+n_repeats = 10000
+vector = surrogate.get_parameter_vector(new_params)
+start = time.perf_counter()
+for _ in range(n_repeats):
+    emulator.predict(vector)
+print('Time per prediction (microseconds):', 1e6 * (time.perf_counter() - start) / n_repeats)
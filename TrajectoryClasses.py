@@ -0,0 +1,132 @@
+import json
+import os
+
+import numpy as np
+
+import InputData as data
+from AnalyticClasses import get_discount_factors, get_step_rewards
+from InputData import HealthStates
+
+PADDING = 255   # value of the cells after the time-step of death (and after the end of a partially written store)
+
+
+class TrajectoryStore:
+    """ the state path of each patient of a cohort as a (n_patients, n_time_steps) matrix of state indices
+    (one byte per patient and time-step) in a memory-mapped file, with a json manifest describing it;
+    cell [i, k] is the state of patient i at the end of time-step k """
+
+    def __init__(self, file_name, manifest, mode='r'):
+        """ use TrajectoryStore.create or TrajectoryStore.open
+        :param file_name: base name of the files (file_name.dat holds the matrix and file_name.json the manifest)
+        :param manifest: (dict) description of the stored paths
+        :param mode: 'r' to read, 'r+' to write
+        """
+        self.fileName = file_name
+        self.manifest = manifest
+        self.paths = np.memmap(file_name + '.dat', dtype=np.uint8, mode=mode,
+                               shape=(manifest['nPatients'], manifest['nTimeSteps']))
+
+    @staticmethod
+    def create(file_name, n_patients, n_time_steps, initial_state, cohort_id=None, therapy=None,
+               cycle_length=data.CYCLE_LENGTH):
+        """
+        :param file_name: base name of the files (file_name.dat holds the matrix and file_name.json the manifest)
+        :param n_patients: number of patients
+        :param n_time_steps: simulation length
+        :param initial_state: health state in which patients start
+        :param cohort_id: id of the simulated cohort
+        :param therapy: name of the therapy of the cohort
+        :param cycle_length: length of a time-step (years) of the simulated paths
+        :return: a new store with all cells padded
+        """
+
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        manifest = {'nPatients': n_patients, 'nTimeSteps': n_time_steps, 'dtype': 'uint8', 'padding': PADDING,
+                    'states': [s.name for s in HealthStates], 'initialState': initial_state.value,
+                    'cycleLength': cycle_length, 'cohortId': cohort_id, 'therapy': therapy, 'seed': data.SEED,
+                    'complete': False}
+        np.memmap(file_name + '.dat', dtype=np.uint8, mode='w+', shape=(n_patients, n_time_steps))[:] = PADDING
+        store = TrajectoryStore(file_name=file_name, manifest=manifest, mode='r+')
+        store._write_manifest()
+        return store
+
+    @staticmethod
+    def open(file_name):
+        """
+        :param file_name: base name of the files of the store
+        :return: the store (read-only)
+        """
+        with open(file_name + '.json') as f:
+            return TrajectoryStore(file_name=file_name, manifest=json.load(f))
+
+    def write_path(self, patient_index, state_indices):
+        """
+        :param patient_index: index of the patient
+        :param state_indices: (list) index of the state at the end of each time-step until death
+        """
+        self.paths[patient_index, :len(state_indices)] = state_indices
+
+    def write_paths(self, first_patient_index, paths):
+        """
+        :param first_patient_index: index of the first patient of a batch
+        :param paths: (numpy.array) state paths of the batch with shape (n_patients, n_time_steps)
+        """
+        self.paths[first_patient_index:first_patient_index + len(paths)] = paths
+
+    def close(self):
+        """ flushes the paths to the file and marks the store as complete in the manifest """
+
+        self.paths.flush()
+        self.manifest['complete'] = True
+        self._write_manifest()
+
+    def _write_manifest(self):
+        with open(self.fileName + '.json', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+
+    def replay(self, parameters, memory_budget=data.MEMORY_BUDGET):
+        """ recomputes discounted costs and utilities of the stored paths under (possibly modified) state costs,
+        state utilities, treatment cost, and discount rate; the transition probabilities of the parameters
+        are not used
+        :param parameters: parameter set with the reward inputs (and the cycle length of the stored paths)
+        :param memory_budget: (float) megabytes of memory the rows processed together may use
+        :return: (costs, utilities) arrays of the discounted cost and utility of each patient
+        """
+
+        if parameters.cycleLength != self.manifest['cycleLength']:
+            raise ValueError('The paths were simulated with a cycle length of ' + str(self.manifest['cycleLength'])
+                             + ' years, not ' + str(parameters.cycleLength) + '.')
+
+        n_patients, n_time_steps = self.paths.shape
+        death, severe = HealthStates.ADJ_DEATH.value, HealthStates.SEVERE.value
+
+        # rewards of a time-step by state index (padded cells have no state)
+        step_costs, step_utilities, treatment_cost = get_step_rewards(parameters)
+        state_costs = np.zeros(PADDING + 1)
+        state_costs[:len(HealthStates)] = step_costs
+        state_utilities = np.zeros(PADDING + 1)
+        state_utilities[:len(HealthStates)] = step_utilities
+        treatment_costs = np.full(PADDING + 1, float(treatment_cost))
+        treatment_costs[severe] *= 0.5   # half cycle treatment cost if the next state is SEVERE
+        discount_factors = get_discount_factors(parameters, n_time_steps)
+
+        costs = np.zeros(n_patients)
+        utilities = np.zeros(n_patients)
+        # about 6 arrays of 8 bytes per cell of the rows processed together
+        n_rows = max(1, int(memory_budget * 2 ** 20 / (48 * n_time_steps)))
+        for start in range(0, n_patients, n_rows):
+            paths = np.asarray(self.paths[start:start + n_rows])
+            current = np.full(len(paths), self.manifest['initialState'])
+            for k in range(n_time_steps):
+                new = paths[:, k]
+                alive = new != PADDING  # the patient was alive at the start of time-step k
+                # half-cycle costs and utilities of the transitions
+                cost = 0.5 * (state_costs[current] + state_costs[new]) + treatment_costs[new]
+                utility = np.where(new != death, 0.5 * (state_utilities[current] + state_utilities[new]), 0)
+                costs[start:start + n_rows] += np.where(alive, cost, 0) * discount_factors[k]
+                utilities[start:start + n_rows] += np.where(alive, utility, 0) * discount_factors[k]
+                current = new
+
+        return costs, utilities
@@ -0,0 +1,19 @@
+import sys
+import time
+
+import EquivalenceClasses as equivalence
+
+N_PATIENTS = 3000       # population size of the cohorts compared with the reference patient loop
+N_LARGE = 200000        # population size of the cohorts compared with analytic expectations
+
+# every engine against the reference Patient/Cohort simulation on the fixed scenarios
+start = time.time()
+checks = equivalence.run_all_checks(n_patients=N_PATIENTS, n_large=N_LARGE)
+for check in checks:
+    print(check)
+
+n_failed = sum(not check.passed for check in checks)
+print('{} of {} checks passed ({:.1f}s)'.format(len(checks) - n_failed, len(checks), time.time() - start))
+
+# a non-zero exit status marks a failed verification
+sys.exit(1 if n_failed > 0 else 0)